@@ -1,47 +1,204 @@
+import logging
+import os
+import random
+import threading
+import time
 import requests
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Iterator, Optional, List
+from urllib.parse import urlsplit
 from fastapi import HTTPException
+from requests.adapters import HTTPAdapter
+
+from .scheduler import get_scheduler
+
+try:
+    import ijson
+except ImportError:  # ijsonがない環境ではレスポンス全体を解析する
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+# 上流APIへの接続設定
+CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "30"))
+POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", "10"))
+
+# リトライ対象のステータスコード（レート制限とサーバーエラー）
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 上流ホストごとに共有するHTTPセッション（コネクションプールとkeep-aliveを再利用する）
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_http_session(base_url: str) -> requests.Session:
+    """
+    上流ホストごとに共有されるHTTPセッションを返す
+    """
+    host = urlsplit(base_url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            # リトライは_make_requestで行うため、アダプターでは行わない
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
 
 
 class BlockchainApiClient(ABC):
     """
     ブロックチェーンAPIクライアントの基底クラス
     """
+    # レート制限とスケジューリングに使用する上流APIの名前（サブクラスで指定）
+    RATE_LIMIT_KEY = "default"
+
     def __init__(self, base_url: str, api_key: Optional[str] = None):
         self.base_url = base_url
         self.api_key = api_key
-    
+        self.session = get_http_session(base_url)
+        self.scheduler = get_scheduler(self.RATE_LIMIT_KEY)
+
     @abstractmethod
     def get_transactions(self, address: str, **kwargs) -> List[Dict[str, Any]]:
         """指定されたアドレスのトランザクションを取得"""
         pass
-    
-    def _make_request(self, endpoint: str = "", params: Optional[Dict[str, Any]] = None, 
-                     headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+
+    def get_transactions_many(self, addresses: List[str], **kwargs) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        複数のアドレスのトランザクションを取得し、アドレスごとに分けて返す
+
+        既定ではアドレスごとにget_transactionsを呼び出す。
+        複数のアドレスを1回で取得できる上流APIでは、サブクラスでオーバーライドする。
+        """
+        return {address: self.get_transactions(address, **kwargs) for address in addresses}
+
+    def _make_request(self, endpoint: str = "", params: Optional[Dict[str, Any]] = None,
+                     headers: Optional[Dict[str, Any]] = None, cost: int = 1) -> Dict[str, Any]:
         """
         APIリクエストを実行し、レスポンスを返す共通メソッド
+
+        429/5xxと接続エラーは、ジッター付きの指数バックオフでMAX_RETRIES回まで再試行する。
+        costには、上流APIのレート制限で何回分のリクエストとして数えられるか（バッチ取得のアドレス数など）を指定する。
         """
+        response = self._send(endpoint, params, headers, cost)
         try:
-            url = f"{self.base_url}/{endpoint}" if endpoint else self.base_url
-            print(f"Requesting: {url}, params: {params}")
-            
-            response = requests.get(url, params=params, headers=headers)
-            print(f"Response status: {response.status_code}")
-            
-            if response.status_code != 200:
-                print(f"Error response: {response.text}")
-                
-            response.raise_for_status()
             return response.json()
-        
-        except requests.RequestException as e:
-            error_msg = f"API request error: {str(e)}"
-            print(f"API ERROR: {error_msg}")
-            print(f"Exception details: {type(e).__name__}")
-            
-            if hasattr(e, "response") and e.response:
-                print(f"Response status: {e.response.status_code}")
-                print(f"Response text: {e.response.text}")
-            
-            raise HTTPException(status_code=503, detail=error_msg)
\ No newline at end of file
+        except ValueError as e:
+            self._raise_api_error(response, e)
+
+    def _stream_request(self, endpoint: str = "", params: Optional[Dict[str, Any]] = None,
+                        headers: Optional[Dict[str, Any]] = None, cost: int = 1) -> requests.Response:
+        """
+        _make_requestと同じ再試行を行い、本文を読み込まずにレスポンスを返す
+        （本文はiter_json_itemsで少しずつ解析する。使用後は呼び出し側でcloseすること）
+        """
+        return self._send(endpoint, params, headers, cost, stream=True)
+
+    def _send(self, endpoint: str, params: Optional[Dict[str, Any]], headers: Optional[Dict[str, Any]],
+              cost: int, stream: bool = False) -> requests.Response:
+        url = f"{self.base_url}/{endpoint}" if endpoint else self.base_url
+
+        for attempt in range(MAX_RETRIES + 1):
+            # レート制限のトークンを優先度順に取得してから送信する
+            for _ in range(cost):
+                self.scheduler.acquire()
+            try:
+                logger.debug(f"Requesting: {url} (attempt {attempt + 1})")
+                response = self.session.get(
+                    url, params=params, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stream=stream
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt < MAX_RETRIES:
+                    delay = self._retry_delay(attempt)
+                    logger.warning(f"API connection error: {type(e).__name__} for {url}, retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                    continue
+                error_msg = f"API request error: {str(e)}"
+                logger.error(f"API ERROR: {error_msg}")
+                raise HTTPException(status_code=503, detail=error_msg)
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES:
+                delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+                logger.warning(f"API response status {response.status_code} for {url}, retrying in {delay:.2f}s")
+                response.close()
+                time.sleep(delay)
+                continue
+
+            try:
+                response.raise_for_status()
+            except requests.RequestException as e:
+                self._raise_api_error(response, e)
+            return response
+
+    def _raise_api_error(self, response: requests.Response, e: Exception) -> None:
+        error_msg = f"API request error: {str(e)}"
+        logger.error(f"API ERROR: {error_msg}")
+        logger.error(f"Response status: {response.status_code}")
+        logger.error(f"Response text: {response.text[:1000]}")
+        raise HTTPException(status_code=503, detail=error_msg)
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        再試行までの待機時間（フルジッター付き指数バックオフ）
+        Retry-Afterヘッダーが秒数で指定されている場合はそれを優先する。
+        """
+        if retry_after:
+            try:
+                return min(BACKOFF_MAX, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def iter_json_items(response: requests.Response, key: str, fields: Dict[str, Any]) -> Iterator[Any]:
+    """
+    レスポンスの本文を少しずつ解析し、トップレベルのkeyの配列の要素を1件ずつ返す
+
+    Parameters:
+    - response: _stream_requestで取得したレスポンス
+    - key: 要素を返す配列のキー（"result" など）
+    - fields: トップレベルのその他のスカラー値（"status", "message" など）を格納するdict
+      （keyの値が配列ではない場合は、その値もfieldsに格納する）
+
+    本文全体を読み込まないため、使用するメモリは配列の1要素分に抑えられる。
+    ijsonがない環境では本文全体を解析してから順に返す。
+    """
+    if ijson is None:
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise HTTPException(status_code=503, detail=f"API request error: {str(e)}")
+        for name, value in data.items():
+            if name == key and isinstance(value, list):
+                yield from value
+            else:
+                fields[name] = value
+        return
+
+    # gzipなどで圧縮された本文を展開しながら読み込む
+    response.raw.decode_content = True
+    item_prefix = f"{key}.item"
+    builder = None
+    try:
+        for prefix, event, value in ijson.parse(response.raw, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == item_prefix and event in ("end_map", "end_array"):
+                    yield builder.value
+                    builder = None
+            elif prefix == item_prefix and event in ("start_map", "start_array"):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            elif prefix == item_prefix:
+                yield value
+            elif prefix and "." not in prefix and event in ("string", "number", "boolean", "null"):
+                fields[prefix] = value
+    except ijson.JSONError as e:
+        raise HTTPException(status_code=503, detail=f"API request error: {str(e)}")
@@ -1,6 +1,8 @@
-from typing import Dict, Any, List, Optional
+import os
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
 from datetime import datetime
 from dateutil import parser
+from fastapi import HTTPException
 
 from .base import BlockchainApiClient
 
@@ -9,48 +11,241 @@ class BlockCypherClient(BlockchainApiClient):
     """
     BlockCypherのAPIクライアント実装
     """
-    
+    RATE_LIMIT_KEY = "blockcypher"
+
+    # addrs/{address}/full で1回に取得できるトランザクション数の上限
+    PAGE_LIMIT = 50
+
+    # addrs/{address}（トランザクションの参照のみ）で1回に取得できる件数の上限
+    TXREF_LIMIT = 2000
+
+    # addrs/{a;b;c}/full で1回にまとめて取得するアドレス数
+    # （無料枠のバッチ上限は3件。有料プランではより多くのアドレスをまとめられる）
+    BATCH_SIZE = max(1, int(os.getenv("BLOCKCYPHER_BATCH_SIZE", "3")))
+
     def get_transactions(self, address: str, start_datetime: Optional[datetime] = None, 
-                        end_datetime: Optional[datetime] = None) -> List[Dict[str, Any]]:
+                        end_datetime: Optional[datetime] = None,
+                        after_height: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        BitcoinのトランザクションをBlockCypher APIから取得
+        BitcoinのトランザクションをBlockCypher APIから取得（全ページ）
         """
-        endpoint = f"addrs/{address}/full"
-        data = self._make_request(endpoint)
-        
         transactions = []
-        for tx in data.get("txs", []):
-            # 日付処理
-            received_time = tx.get("received")
-            tx_time = self._parse_datetime(received_time)
-            
-            # 日付フィルタリング
-            if (start_datetime and tx_time < start_datetime) or (
-                end_datetime and tx_time > end_datetime
-            ):
-                print("skip tx_time: ", tx_time)
+        for page in self.iter_transaction_pages(address, start_datetime, end_datetime, after_height):
+            transactions.extend(page)
+        return transactions
+
+    def iter_transaction_pages(self, address: str, start_datetime: Optional[datetime] = None,
+                               end_datetime: Optional[datetime] = None,
+                               after_height: Optional[int] = None,
+                               before_height: Optional[int] = None,
+                               seen_hashes: Optional[Set[str]] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        BitcoinのトランザクションをBlockCypher APIからページ単位で取得
+
+        Parameters:
+        - address: 取得対象のアドレス
+        - start_datetime: 開始日時（これより古いトランザクションに到達したら取得を終了）
+        - end_datetime: 終了日時
+        - after_height: 指定した場合、このブロック高より後のトランザクションのみを取得
+        - before_height: 指定した場合、このブロック高より前のトランザクションから取得を始める（続きの取得用）
+        - seen_hashes: 取得済みのトランザクションのハッシュ（続きの取得用）
+
+        BlockCypherは新しい順にトランザクションを返すため、before（ブロック高）を
+        ずらしながら古い方へ向かって取得する。
+        1ブロック内のトランザクションが1ページに収まらない場合は、そのブロックの残りを
+        _fetch_block_remainderで取得してから、より古いブロックへ進む。
+        """
+        endpoint = f"addrs/{address}/full"
+        seen_hashes = set() if seen_hashes is None else seen_hashes
+
+        while True:
+            params = self._page_params(before_height, after_height)
+            data = self._make_request(endpoint, params)
+
+            page, before_height, incomplete_height = self._parse_page(
+                address, data, start_datetime, end_datetime, before_height, seen_hashes
+            )
+            if incomplete_height is not None:
+                page.extend(self._fetch_block_remainder(
+                    address, incomplete_height, start_datetime, end_datetime, seen_hashes
+                ))
+            yield page
+            if before_height is None:
+                break
+
+    def get_transactions_many(self, addresses: List[str], start_datetime: Optional[datetime] = None,
+                              end_datetime: Optional[datetime] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        複数のアドレスのトランザクションを取得し、アドレスごとに分けて返す（全ページ）
+
+        addrs/{a;b;c}/full でBATCH_SIZE件ずつまとめて最初のページを取得し、
+        続きのページがあるアドレスだけをアドレスごとに取得する。
+        バッチのレスポンスに含まれなかった（エラーになった）アドレスは個別に取得し直す。
+        """
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        for offset in range(0, len(addresses), self.BATCH_SIZE):
+            batch = addresses[offset:offset + self.BATCH_SIZE]
+            if len(batch) == 1:
+                results[batch[0]] = self.get_transactions(batch[0], start_datetime, end_datetime)
                 continue
-                
-            # Bitcoin's UTXOモデルを解析
-            inputs = tx.get("inputs", [])
-            outputs = tx.get("outputs", [])
-            tx_hash = tx.get("hash")
+
+            # バッチ内の各アドレスはBlockCypherのレート制限では1回ずつのリクエストとして数えられる
+            data = self._make_request(
+                f"addrs/{';'.join(batch)}/full", self._page_params(None, None), cost=len(batch)
+            )
+            for entry in data if isinstance(data, list) else [data]:
+                address = entry.get("address")
+                if address not in batch or address in results or "error" in entry:
+                    continue
+                seen_hashes: Set[str] = set()
+                transactions, before_height, incomplete_height = self._parse_page(
+                    address, entry, start_datetime, end_datetime, None, seen_hashes
+                )
+                if incomplete_height is not None:
+                    transactions.extend(self._fetch_block_remainder(
+                        address, incomplete_height, start_datetime, end_datetime, seen_hashes
+                    ))
+                if before_height is not None:
+                    for page in self.iter_transaction_pages(
+                        address, start_datetime, end_datetime,
+                        before_height=before_height, seen_hashes=seen_hashes
+                    ):
+                        transactions.extend(page)
+                results[address] = transactions
+
+            for address in batch:
+                if address not in results:
+                    results[address] = self.get_transactions(address, start_datetime, end_datetime)
+        return results
+
+    def _page_params(self, before_height: Optional[int], after_height: Optional[int]) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"limit": self.PAGE_LIMIT}
+        if before_height is not None:
+            params["before"] = before_height
+        if after_height is not None:
+            params["after"] = after_height
+        if self.api_key:
+            params["token"] = self.api_key
+        return params
+
+    def _parse_page(self, address: str, data: Dict[str, Any], start_datetime: Optional[datetime],
+                    end_datetime: Optional[datetime], before_height: Optional[int],
+                    seen_hashes: Set[str]) -> Tuple[List[Dict[str, Any]], Optional[int], Optional[int]]:
+        """
+        1ページ分のレスポンスを変換し、(トランザクション, 次のページのbefore, 残りを別に取得するブロック高) を返す
+        （続きを取得しない場合、次のページのbeforeはNone）
+
+        ページ全体が1つのブロックに収まり、beforeをずらしても先に進めない場合は、
+        そのブロックの残りを呼び出し側で取得させ、次のページはそのブロックより前から要求する。
+        """
+        page: List[Dict[str, Any]] = []
+        heights = []
+        new_count = 0
+        reached_start = False
+        for tx in data.get("txs", []):
             block_height = tx.get("block_height")
-            
-            # ウォレットアドレスが関連するトランザクションかを確認
-            tx_addresses = tx.get("addresses", [])
-            if address not in tx_addresses:
+            if block_height is not None and block_height >= 0:
+                heights.append(block_height)
+
+            tx_hash = tx.get("hash")
+            # ページ境界のブロックは次のページでも返されるため、取得済みのものは除外
+            if tx_hash in seen_hashes:
                 continue
-                
-            # アドレスが入金を受けた場合と送金した場合の両方を処理
-            self._process_received_transactions(
-                transactions, address, inputs, outputs, tx_hash, block_height, tx_time
-            )
-            self._process_sent_transactions(
-                transactions, address, inputs, outputs, tx_hash, block_height, tx_time
+            seen_hashes.add(tx_hash)
+            new_count += 1
+            if self._add_transaction(page, address, tx, start_datetime, end_datetime):
+                reached_start = True
+
+        # 開始日時に到達した、または続きがない場合は終了
+        if reached_start or not data.get("hasMore") or not heights:
+            return page, None, None
+
+        # 最も古いブロックの残りを取りこぼさないよう、そのブロックを含めて次のページを要求する
+        lowest_height = min(heights)
+        if new_count and (before_height is None or lowest_height + 1 < before_height):
+            return page, lowest_height + 1, None
+        # 1ブロック内のトランザクションが1ページに収まらない
+        return page, lowest_height, lowest_height
+
+    def _fetch_block_remainder(self, address: str, block_height: int, start_datetime: Optional[datetime],
+                               end_datetime: Optional[datetime], seen_hashes: Set[str]) -> List[Dict[str, Any]]:
+        """
+        1つのブロックに含まれるアドレスのトランザクションのうち、取得済みでないものを取得する
+
+        addrs/{address} でそのブロックのトランザクションの参照（ハッシュ）を列挙し、
+        未取得のものを txs/{a;b;c} でBATCH_SIZE件ずつまとめて取得する。
+        参照が1回で列挙しきれない場合は、取得済み期間として記録されないよう502を返す。
+        """
+        params: Dict[str, Any] = {
+            "before": block_height + 1,
+            "after": block_height - 1,
+            "limit": self.TXREF_LIMIT,
+        }
+        if self.api_key:
+            params["token"] = self.api_key
+        data = self._make_request(f"addrs/{address}", params)
+        if data.get("hasMore"):
+            raise HTTPException(
+                status_code=502,
+                detail=f"Too many BlockCypher transactions for {address} in block {block_height}",
             )
-            
+
+        hashes = list(dict.fromkeys(
+            ref["tx_hash"] for ref in data.get("txrefs", [])
+            if ref.get("tx_hash") and ref["tx_hash"] not in seen_hashes
+        ))
+        transactions: List[Dict[str, Any]] = []
+        for offset in range(0, len(hashes), self.BATCH_SIZE):
+            batch = hashes[offset:offset + self.BATCH_SIZE]
+            params = {"token": self.api_key} if self.api_key else {}
+            response = self._make_request(f"txs/{';'.join(batch)}", params, cost=len(batch))
+            for tx in response if isinstance(response, list) else [response]:
+                if "error" in tx or tx.get("hash") in seen_hashes:
+                    continue
+                seen_hashes.add(tx.get("hash"))
+                self._add_transaction(transactions, address, tx, start_datetime, end_datetime)
         return transactions
+
+    def _add_transaction(self, transactions: List, address: str, tx: Dict[str, Any],
+                         start_datetime: Optional[datetime], end_datetime: Optional[datetime]) -> bool:
+        """
+        期間内のトランザクションを行に変換してtransactionsに追加し、開始日時より前だった場合はTrueを返す
+        """
+        # 日付処理
+        tx_time = self._parse_datetime(tx.get("received"))
+
+        # 日付フィルタリング
+        if start_datetime and tx_time < start_datetime:
+            return True
+        if end_datetime and tx_time > end_datetime:
+            return False
+
+        self._process_transaction(transactions, address, tx, tx_time)
+        return False
+
+    def _process_transaction(self, transactions: List, address: str,
+                             tx: Dict[str, Any], tx_time: datetime) -> None:
+        """
+        1件のトランザクションを送金・入金ごとの行に変換してtransactionsに追加
+        """
+        # Bitcoin's UTXOモデルを解析
+        inputs = tx.get("inputs", [])
+        outputs = tx.get("outputs", [])
+        tx_hash = tx.get("hash")
+        block_height = tx.get("block_height")
+
+        # ウォレットアドレスが関連するトランザクションかを確認
+        tx_addresses = tx.get("addresses", [])
+        if address not in tx_addresses:
+            return
+
+        # アドレスが入金を受けた場合と送金した場合の両方を処理
+        self._process_received_transactions(
+            transactions, address, inputs, outputs, tx_hash, block_height, tx_time
+        )
+        self._process_sent_transactions(
+            transactions, address, inputs, outputs, tx_hash, block_height, tx_time
+        )
         
     def _parse_datetime(self, datetime_str: str) -> datetime:
         """
@@ -1,10 +1,11 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
 from datetime import datetime
 from fastapi import HTTPException
 import logging
 import json
+import time
 
-from .base import BlockchainApiClient
+from .base import BlockchainApiClient, iter_json_items
 
 logger = logging.getLogger(__name__)
 
@@ -12,73 +13,224 @@ class EtherscanClient(BlockchainApiClient):
     """
     Etherscan APIクライアントの実装
     """
-    
+    RATE_LIMIT_KEY = "etherscan"
+
+    # endblockを指定しない場合の上限（最新ブロックまで）
+    LATEST_BLOCK = 99999999
+
+    # txlistのレスポンスを解析しながら、この件数ごとに呼び出し側へ渡す（保存もこの単位で行われる）
+    STREAM_BATCH_SIZE = 1000
+
+    # txlistが1回の呼び出しで返す最大件数（これを超える分は黙って切り捨てられる）
+    MAX_RESULTS = 10000
+
+    # getblocknobytimeの結果をキャッシュする日時の単位（秒）と、キャッシュする日時の古さ（秒）
+    BLOCK_TIME_RESOLUTION = 60
+    BLOCK_TIME_CACHE_AGE = 3600
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None):
+        super().__init__(base_url, api_key)
+        # 過去の日時に対応するブロック番号は変わらないためキャッシュする
+        self._block_number_cache: Dict[Tuple[int, str], int] = {}
+
     def get_transactions(self, address: str, start_datetime: Optional[datetime] = None,
-                        end_datetime: Optional[datetime] = None) -> List[Dict[str, Any]]:
+                        end_datetime: Optional[datetime] = None, start_block: int = 0,
+                        end_block: int = LATEST_BLOCK) -> List[Dict[str, Any]]:
         """
         EthereumのトランザクションをEtherscan APIから取得
+
+        start_block / end_block を指定すると、その範囲のブロックのみを上流に要求する。
+        """
+        transactions = []
+        for page in self.iter_transaction_pages(address, start_datetime, end_datetime, start_block, end_block):
+            transactions.extend(page)
+        return transactions
+
+    def iter_transaction_pages(self, address: str, start_datetime: Optional[datetime] = None,
+                               end_datetime: Optional[datetime] = None, start_block: int = 0,
+                               end_block: int = LATEST_BLOCK) -> Iterator[List[Dict[str, Any]]]:
+        """
+        EthereumのトランザクションをEtherscan APIから取得し、STREAM_BATCH_SIZE件ずつ返す
+
+        txlistのレスポンス（最大10,000件、inputの16進データを含む）は全体を読み込まずに
+        1件ずつ解析するため、使用するメモリはレスポンスの大きさではなくバッチの大きさで決まる。
+        1回の呼び出しで上限の件数が返された場合は、最後のブロックからend_blockまでを続けて要求する。
         """
         # APIキーが必要
         if not self.api_key:
             raise HTTPException(status_code=400, detail="Etherscan API key is required")
-            
-        # 通常のトランザクションパラメータ設定
+
+        page: List[Dict[str, Any]] = []
+        count = 0
+        request_start = start_block
+        # 前回の呼び出しの最後のブロックで返したトランザクション（次の呼び出しはそのブロックから要求する）
+        returned_hashes: Set[str] = set()
+        while True:
+            received = 0
+            last_block = request_start
+            last_block_hashes: Set[str] = set()
+            for tx in self._iter_txlist(address, request_start, end_block):
+                received += 1
+                block_number = int(tx.get("blockNumber", 0))
+                tx_hash = tx.get("hash")
+                if block_number != last_block:
+                    last_block = block_number
+                    last_block_hashes = set()
+                last_block_hashes.add(tx_hash)
+                if block_number == request_start and tx_hash in returned_hashes:
+                    continue
+                count += 1
+
+                # 日付フィルタリング
+                tx_time = datetime.fromtimestamp(int(tx.get("timeStamp", 0)))
+                if (start_datetime and tx_time < start_datetime) or (
+                    end_datetime and tx_time > end_datetime
+                ):
+                    continue
+
+                transaction = self._process_transaction(address, tx, tx_time)
+                if transaction is not None:
+                    page.append(transaction)
+                if len(page) >= self.STREAM_BATCH_SIZE:
+                    yield page
+                    page = []
+
+            if received < self.MAX_RESULTS:
+                break
+            # 上限まで返された場合は、最後のブロックが途中で切れている可能性があるため、そのブロックから続きを要求する
+            # （1ブロックに同じアドレスの取引が上限を超えて含まれることはガスの上限からありえない）
+            if last_block == request_start:
+                raise HTTPException(
+                    status_code=502,
+                    detail=f"Etherscan returned more than {self.MAX_RESULTS} transactions in block {last_block}",
+                )
+            logger.info(f"Etherscan result limit reached for address: {address}; continuing from block {last_block}")
+            request_start = last_block
+            returned_hashes = last_block_hashes
+
+        if page:
+            yield page
+        logger.info(f"Processed {count} transactions for address: {address}")
+
+    def _iter_txlist(self, address: str, start_block: int, end_block: int) -> Iterator[Dict[str, Any]]:
+        """
+        1回のtxlistの呼び出しの結果を1件ずつ返す（最大MAX_RESULTS件、ブロックの昇順）
+        """
         params = {
             "module": "account",
             "action": "txlist",
             "address": address,
-            "startblock": 0,
-            "endblock": 99999999,
+            "startblock": start_block,
+            "endblock": end_block,
             "sort": "asc",
             "apikey": self.api_key,
         }
-        
-        # APIリクエスト実行
-        logger.info(f"Requesting Etherscan API for address: {address} with params: {params}")
-        data = self._make_request("", params)
-        logger.info(f"Etherscan API response: {data}")
-        
-        # APIのレスポンスを検証
-        if data.get("status") != "1":
+
+        # APIリクエスト実行（APIキーとレスポンスの本文はログに出力しない）
+        logger.info(f"Requesting Etherscan API for address: {address} (blocks {start_block} - {end_block})")
+        response = self._stream_request("", params)
+
+        fields: Dict[str, Any] = {}
+        count = 0
+        try:
+            for tx in iter_json_items(response, "result", fields):
+                if count == 0:
+                    # statusとmessageはresultより前にあるため、最初の要素の時点で検証できる
+                    self._check_status(fields)
+                count += 1
+                yield tx
+        finally:
+            response.close()
+
+        # 対象期間にトランザクションがない場合は空の結果として扱う
+        if count == 0 and fields.get("status") == "0" and fields.get("message") == "No transactions found":
+            logger.info(f"No transactions found for address: {address} (blocks {start_block} - {end_block})")
+            return
+        self._check_status(fields)
+
+    def _check_status(self, fields: Dict[str, Any]) -> None:
+        """
+        APIのレスポンスを検証
+        """
+        if fields.get("status") != "1":
             raise HTTPException(
                 status_code=400, 
-                detail=f"Etherscan API error: {data.get('message')}"
+                detail=f"Etherscan API error: {fields.get('message')}"
             )
-            
-        # トランザクション処理
-        transactions = []
-        for tx in data.get("result", []):
-            # 日付フィルタリング
-            tx_time = datetime.fromtimestamp(int(tx.get("timeStamp", 0)))
-            if (start_datetime and tx_time < start_datetime) or (
-                end_datetime and tx_time > end_datetime
-            ):
-                continue
-                
-            # 自分宛か送信かを判断
-            is_incoming = address.lower() == tx.get("to", "").lower()
-            is_outgoing = address.lower() == tx.get("from", "").lower()
-            
-            if is_incoming or is_outgoing:
-                # スマートコントラクトの情報を取得
-                contract_info = self._get_contract_info(tx)
-                
-                transaction = {
-                    "blockchain": "ethereum",
-                    "txid": tx.get("hash"),
-                    "from_address": tx.get("from"),
-                    "to_address": tx.get("to"),
-                    "value": float(tx.get("value", 0)) / 1e18,  # wei to ETH
-                    "timestamp": tx_time,
-                    "block_number": int(tx.get("blockNumber", 0)),
-                    **contract_info
-                }
-                
-                transactions.append(transaction)
-        
-        logger.info(f"Processed {len(transactions)} transactions for address: {address}")
-        return transactions
+
+    def _process_transaction(self, address: str, tx: Dict[str, Any],
+                             tx_time: datetime) -> Optional[Dict[str, Any]]:
+        """
+        1件のトランザクションを変換（このアドレスの送金・入金ではない場合はNone）
+        """
+        # 自分宛か送信かを判断
+        is_incoming = address.lower() == (tx.get("to") or "").lower()
+        is_outgoing = address.lower() == (tx.get("from") or "").lower()
+
+        if not (is_incoming or is_outgoing):
+            return None
+
+        # スマートコントラクトの情報を取得
+        contract_info = self._get_contract_info(tx)
+
+        return {
+            "blockchain": "ethereum",
+            "txid": tx.get("hash"),
+            "from_address": tx.get("from"),
+            "to_address": tx.get("to"),
+            "value": float(tx.get("value", 0)) / 1e18,  # wei to ETH
+            "timestamp": tx_time,
+            "block_number": int(tx.get("blockNumber", 0)),
+            **contract_info
+        }
         
+    def get_block_number_by_time(self, dt: datetime, closest: str = "before") -> Optional[int]:
+        """
+        指定日時に最も近いブロック番号をEtherscan APIから取得
+
+        Parameters:
+        - dt: 対象の日時
+        - closest: "before"（指定日時以前）または "after"（指定日時以降）
+
+        取得できない場合はNoneを返す。
+        "after" は日時をBLOCK_TIME_RESOLUTION秒単位に切り捨てて問い合わせる（返すブロックが指定日時より前になりうるが、
+        取得したトランザクションは日時でも絞り込むため結果は変わらず、同じ単位の問い合わせはキャッシュを共有する）。
+        """
+        if not self.api_key:
+            raise HTTPException(status_code=400, detail="Etherscan API key is required")
+
+        # トランザクションの日時はdatetime.fromtimestampで変換しているため、同じ基準でUNIX時間に戻す
+        timestamp = int(dt.timestamp())
+        if closest == "after":
+            timestamp -= timestamp % self.BLOCK_TIME_RESOLUTION
+        cache_key = (timestamp, closest)
+        if cache_key in self._block_number_cache:
+            return self._block_number_cache[cache_key]
+
+        params = {
+            "module": "block",
+            "action": "getblocknobytime",
+            "timestamp": timestamp,
+            "closest": closest,
+            "apikey": self.api_key,
+        }
+        data = self._make_request("", params)
+        if data.get("status") != "1":
+            logger.warning(f"Failed to resolve block number for {dt} ({closest}): {data.get('message')}")
+            return None
+
+        block_number = int(data.get("result"))
+        # 十分に古い日時のみキャッシュ（直近は新しいブロックで結果が変わりうる）
+        if not self.is_recent(dt):
+            self._block_number_cache[cache_key] = block_number
+        return block_number
+
+    def is_recent(self, dt: datetime) -> bool:
+        """
+        日時がBLOCK_TIME_CACHE_AGE秒以内（ブロック番号をキャッシュできない直近の日時）かどうか
+        """
+        return time.time() - dt.timestamp() <= self.BLOCK_TIME_CACHE_AGE
+
     def _get_contract_info(self, tx: Dict[str, Any]) -> Dict[str, Any]:
         """
         トランザクションからスマートコントラクトの情報を抽出
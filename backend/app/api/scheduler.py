@@ -0,0 +1,260 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..database.models import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+# リクエストの優先度（小さいほど先に処理される）
+PRIORITY_INTERACTIVE = 0  # /transactions などの対話的な検索
+PRIORITY_NETWORK = 10     # /network の深い階層の探索
+
+# 上流APIごとのレート制限（1秒あたりのリクエスト数とバースト容量）
+RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "blockcypher": (
+        float(os.getenv("BLOCKCYPHER_RATE_LIMIT", "3")),
+        float(os.getenv("BLOCKCYPHER_RATE_BURST", "3")),
+    ),
+    "etherscan": (
+        float(os.getenv("ETHERSCAN_RATE_LIMIT", "5")),
+        float(os.getenv("ETHERSCAN_RATE_BURST", "5")),
+    ),
+}
+
+# トークンバケットの保存先（"memory": プロセス内のみ, "database": 複数のuvicornワーカー間で共有。
+# databaseでは上流APIへのリクエストごとにデータベースへの書き込みが1回発生する）
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+
+_request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: int) -> Iterator[None]:
+    """
+    このコンテキスト内で発行される上流APIリクエストの優先度を設定する
+    """
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+def current_priority() -> int:
+    return _request_priority.get()
+
+
+class RateLimitStore(ABC):
+    """
+    トークンバケットの状態を保存するストアの基底クラス
+    """
+    @abstractmethod
+    def try_acquire(self, key: str, rate: float, capacity: float) -> float:
+        """
+        トークンを1つ取得する
+
+        取得できた場合は0を、できなかった場合は次のトークンが補充されるまでの秒数を返す。
+        """
+        pass
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """
+    プロセス内で完結するトークンバケット（既定。ワーカーが1つの場合）
+    """
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: str, rate: float, capacity: float) -> float:
+        with self._lock:
+            now = self._clock()
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+
+class DatabaseRateLimitStore(RateLimitStore):
+    """
+    rate_limit_bucketsテーブルを使ったトークンバケット
+    行ロック（SELECT ... FOR UPDATE）で更新するため、複数のuvicornワーカー間で共有できる。
+    """
+    def __init__(self, session_factory: Callable[[], Session], clock: Callable[[], float] = time.time):
+        self._session_factory = session_factory
+        self._clock = clock
+
+    def try_acquire(self, key: str, rate: float, capacity: float) -> float:
+        db = self._session_factory()
+        try:
+            bucket = (
+                db.query(RateLimitBucket)
+                .filter(RateLimitBucket.key == key)
+                .with_for_update()
+                .first()
+            )
+            now = self._clock()
+            if bucket is None:
+                bucket = RateLimitBucket(key=key, tokens=capacity, updated_at=now)
+                db.add(bucket)
+                try:
+                    db.flush()
+                except IntegrityError:
+                    # 他のワーカーが同時に作成した場合はやり直す
+                    db.rollback()
+                    return self.try_acquire(key, rate, capacity)
+
+            tokens = min(capacity, bucket.tokens + max(0.0, now - bucket.updated_at) * rate)
+            if tokens >= 1:
+                bucket.tokens = tokens - 1
+                bucket.updated_at = now
+                db.commit()
+                return 0.0
+
+            bucket.tokens = tokens
+            bucket.updated_at = now
+            db.commit()
+            return (1 - tokens) / rate
+        finally:
+            db.close()
+
+
+class RequestScheduler:
+    """
+    上流APIごとのリクエストスケジューラー
+
+    トークンバケットでレートを制限し、待機中のリクエストは優先度順（同じ優先度では到着順）に
+    トークンを受け取る。優先度の順序付けはプロセス内で行い、レートはストアを通じて共有する。
+    """
+    def __init__(self, name: str, rate: float, capacity: float, store: RateLimitStore):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.store = store
+        self._queue: list = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        # 統計情報
+        self._acquired = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def acquire(self, priority: Optional[int] = None) -> float:
+        """
+        トークンを取得できるまで待機し、待機した秒数を返す
+        """
+        if priority is None:
+            priority = current_priority()
+        ticket = (priority, next(self._sequence))
+        enqueued_at = time.monotonic()
+
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+
+        while True:
+            with self._condition:
+                while self._queue[0] != ticket:
+                    # 先頭のリクエストがトークンを取得するまで待つ
+                    self._condition.wait()
+
+            # データベースのストアは往復とコミットを伴うため、ロックを外して問い合わせる
+            # （その間に優先度の高いリクエストが先頭になった場合は、そちらも並行して問い合わせる）
+            wait = self.store.try_acquire(self.name, self.rate, self.capacity)
+
+            with self._condition:
+                if wait <= 0:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._condition.notify_all()
+                    waited = time.monotonic() - enqueued_at
+                    self._acquired += 1
+                    self._total_wait += waited
+                    self._max_wait = max(self._max_wait, waited)
+                    break
+                self._condition.wait(timeout=wait)
+
+        if waited > 1:
+            logger.info(f"Waited {waited:.2f}s for {self.name} rate limit (priority: {priority})")
+        return waited
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        キューの深さと待機時間の統計を返す
+        """
+        with self._condition:
+            waiting_by_priority: Dict[int, int] = {}
+            for priority, _ in self._queue:
+                waiting_by_priority[priority] = waiting_by_priority.get(priority, 0) + 1
+            return {
+                "name": self.name,
+                "rate": self.rate,
+                "capacity": self.capacity,
+                "queue_depth": len(self._queue),
+                "waiting_by_priority": waiting_by_priority,
+                "acquired": self._acquired,
+                "average_wait": self._total_wait / self._acquired if self._acquired else 0.0,
+                "max_wait": self._max_wait,
+            }
+
+
+_schedulers: Dict[str, RequestScheduler] = {}
+_schedulers_lock = threading.Lock()
+_store: Optional[RateLimitStore] = None
+
+
+def _get_store() -> RateLimitStore:
+    global _store
+    if _store is None:
+        if RATE_LIMIT_STORE == "database":
+            from ..database.database import SessionLocal
+            _store = DatabaseRateLimitStore(SessionLocal)
+        else:
+            _store = InMemoryRateLimitStore()
+    return _store
+
+
+def set_rate_limit_store(store: RateLimitStore) -> None:
+    """
+    トークンバケットのストアを差し替える（テストなどで使用）
+    """
+    global _store
+    with _schedulers_lock:
+        _store = store
+        for scheduler in _schedulers.values():
+            scheduler.store = store
+
+
+def get_scheduler(name: str) -> RequestScheduler:
+    """
+    上流APIごとに共有されるスケジューラーを返す
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(name)
+        if scheduler is None:
+            rate, capacity = RATE_LIMITS.get(name, (1.0, 1.0))
+            scheduler = RequestScheduler(name, rate, capacity, _get_store())
+            _schedulers[name] = scheduler
+        return scheduler
+
+
+def get_scheduler_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    全スケジューラーの統計を返す
+    """
+    names = set(RATE_LIMITS) | set(_schedulers)
+    return {name: get_scheduler(name).stats() for name in sorted(names)}
@@ -1,5 +1,6 @@
 from .base import BlockchainService
 from .bitcoin import BitcoinService
 from .ethereum import EthereumService
+from .filters import TransactionFilter
 
-__all__ = ['BlockchainService', 'BitcoinService', 'EthereumService']
\ No newline at end of file
+__all__ = ['BlockchainService', 'BitcoinService', 'EthereumService', 'TransactionFilter']
\ No newline at end of file
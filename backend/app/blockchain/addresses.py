@@ -0,0 +1,207 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from ..database.models import Address
+
+# プロセス内でキャッシュするアドレスIDの最大数
+ADDRESS_CACHE_SIZE = int(os.getenv("ADDRESS_CACHE_SIZE", "200000"))
+
+# IN句でまとめて参照するアドレス数
+LOOKUP_BATCH_SIZE = 1000
+
+# コミット前のセッションで参照した対応を保持するSession.infoのキー
+_PENDING_KEY = "address_registry_pending"
+_LISTENING_KEY = "address_registry_listening"
+
+
+def normalize_address(blockchain: str, address: str) -> str:
+    """
+    アドレスをブロックチェーンごとの正規形に変換
+
+    - Ethereum: 大文字小文字を区別しないため小文字にする（チェックサム表記は表示上のもの）
+    - Bitcoin: Base58（1... / 3...）は大文字小文字を区別するためそのまま、
+      Bech32（bc1...）は大文字小文字を区別しないため小文字にする
+    """
+    if not address:
+        return address
+    if blockchain == "ethereum":
+        return address.lower()
+    if blockchain == "bitcoin" and address[:3].lower() == "bc1":
+        return address.lower()
+    return address
+
+
+class AddressRegistry:
+    """
+    正規化済みアドレスと整数IDの対応を管理する
+
+    addressesテーブルのIDは変更されないため、一度参照した対応はプロセス内にキャッシュする。
+    （reset_databaseなどでテーブルを作り直した場合は、サーバーを再起動すること）
+    セッションでアドレスを登録した場合、そのセッションで参照した対応はコミット後にキャッシュし、
+    ロールバックした場合は破棄する（ロールバックで消えたIDを他のセッションに返さないため）。
+    """
+    def __init__(self, max_size: int = ADDRESS_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._ids: Dict[tuple, int] = {}
+        self._addresses: Dict[int, str] = {}
+
+    def get_ids(self, db: Session, blockchain: str, addresses: Iterable[str],
+                create: bool = False) -> Dict[str, int]:
+        """
+        正規化済みアドレスのIDを返す
+
+        Parameters:
+        - db: データベースセッション
+        - blockchain: ブロックチェーン名
+        - addresses: 正規化済みのアドレス
+        - create: 未登録のアドレスを登録するかどうか（Falseの場合、未登録のアドレスは結果に含まれない）
+        """
+        addresses = set(addresses)
+        result: Dict[str, int] = {}
+        with self._lock:
+            for address in addresses:
+                address_id = self._ids.get((blockchain, address))
+                if address_id is not None:
+                    result[address] = address_id
+        missing = [address for address in addresses if address not in result]
+
+        table = Address.__table__
+        if create and missing:
+            self._defer_until_commit(db)
+        for i in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            batch = missing[i:i + LOOKUP_BATCH_SIZE]
+            if create:
+                self._insert_missing(db, blockchain, batch)
+            rows = db.execute(
+                select(table.c.id, table.c.address).where(
+                    table.c.blockchain == blockchain,
+                    table.c.address.in_(batch),
+                )
+            ).fetchall()
+            for row in rows:
+                result[row.address] = row.id
+            self._remember(db, [(blockchain, row.address, row.id) for row in rows])
+        return result
+
+    def _insert_missing(self, db: Session, blockchain: str, addresses: List[str]) -> None:
+        """
+        未登録のアドレスを登録する
+
+        PostgreSQLとSQLiteでは INSERT ... ON CONFLICT DO NOTHING でまとめて登録する。
+        ON CONFLICTに対応していないデータベースでは、登録済みのアドレスを読み出して残りを1件ずつ挿入し、
+        他のセッションが同時に登録したアドレスの一意制約違反はSAVEPOINTで取り消して無視する。
+        """
+        table = Address.__table__
+        dialect = db.bind.dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+            db.execute(
+                insert(table)
+                .values([{"blockchain": blockchain, "address": address} for address in addresses])
+                .on_conflict_do_nothing(index_elements=["blockchain", "address"])
+            )
+            return
+
+        existing = set(db.execute(
+            select(table.c.address).where(
+                table.c.blockchain == blockchain,
+                table.c.address.in_(addresses),
+            )
+        ).scalars())
+        for address in addresses:
+            if address in existing:
+                continue
+            try:
+                with db.begin_nested():
+                    db.execute(table.insert().values(blockchain=blockchain, address=address))
+            except IntegrityError:
+                pass
+
+    def get_id(self, db: Session, blockchain: str, address: str) -> Optional[int]:
+        """
+        正規化済みアドレスのIDを返す（未登録の場合はNone）
+        """
+        return self.get_ids(db, blockchain, [address]).get(address)
+
+    def get_addresses(self, db: Session, address_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        IDに対応する正規化済みアドレスを返す
+        """
+        address_ids = set(address_ids)
+        result: Dict[int, str] = {}
+        with self._lock:
+            for address_id in address_ids:
+                address = self._addresses.get(address_id)
+                if address is not None:
+                    result[address_id] = address
+        missing = [address_id for address_id in address_ids if address_id not in result]
+
+        table = Address.__table__
+        for i in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            batch = missing[i:i + LOOKUP_BATCH_SIZE]
+            rows = db.execute(
+                select(table.c.id, table.c.blockchain, table.c.address).where(table.c.id.in_(batch))
+            ).fetchall()
+            for row in rows:
+                result[row.id] = row.address
+            self._remember(db, [(row.blockchain, row.address, row.id) for row in rows])
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+            self._addresses.clear()
+
+    def _remember(self, db: Session, entries: List[Tuple[str, str, int]]) -> None:
+        """
+        (ブロックチェーン名, アドレス, ID)をキャッシュする（未コミットの登録があるセッションではコミット後に行う）
+        """
+        pending = db.info.get(_PENDING_KEY)
+        if pending is not None:
+            pending.extend(entries)
+            return
+        with self._lock:
+            for blockchain, address, address_id in entries:
+                self._store(blockchain, address, address_id)
+
+    def _defer_until_commit(self, db: Session) -> None:
+        """
+        セッションのコミットまで、参照した対応をキャッシュせずに保持する
+        """
+        db.info.setdefault(_PENDING_KEY, [])
+        if db.info.get(_LISTENING_KEY):
+            return
+        db.info[_LISTENING_KEY] = True
+
+        def after_commit(session: Session) -> None:
+            entries = session.info.pop(_PENDING_KEY, None)
+            if entries:
+                with self._lock:
+                    for blockchain, address, address_id in entries:
+                        self._store(blockchain, address, address_id)
+
+        def after_rollback(session: Session) -> None:
+            session.info.pop(_PENDING_KEY, None)
+
+        event.listen(db, "after_commit", after_commit)
+        event.listen(db, "after_rollback", after_rollback)
+
+    def _store(self, blockchain: str, address: str, address_id: int) -> None:
+        # 上限を超えた場合はまとめて破棄する（IDは不変のため、再参照時にDBから読み直せばよい）
+        if len(self._ids) >= self.max_size:
+            self._ids.clear()
+            self._addresses.clear()
+        self._ids[(blockchain, address)] = address_id
+        self._addresses[address_id] = address
+
+
+# プロセス内で共有するアドレスレジストリ
+address_registry = AddressRegistry()
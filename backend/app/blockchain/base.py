@@ -1,24 +1,89 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Iterator, Optional, Sequence, Set, Tuple
 from datetime import datetime
+import logging
+from fastapi import HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import case, func, literal_column, select, union_all
+from sqlalchemy.sql import Select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from ..database.models import Transaction
-from ..schemas import Transaction as TransactionSchema
+from ..database.models import Address, Transaction
+from ..schemas import AddressStats as AddressStatsSchema, TimeSeries, Transaction as TransactionSchema
+from .addresses import address_registry, normalize_address
+from .coverage import CHAIN_EPOCH, get_covered_intervals, plan_sync, record_coverage
+from .filters import TransactionFilter
+from .singleflight import SingleFlight
+from .stats import get_address_stats, update_address_stats
+from .timeseries import volume_timeseries
+
+logger = logging.getLogger(__name__)
 
 
 class BlockchainService(ABC):
     """
     ブロックチェーン処理の基底クラス
     """
+    # トランザクション保存後に呼び出されるリスナー（キャッシュの無効化などに使用）
+    # listener(blockchain, 保存したトランザクションに含まれるアドレスの集合)
+    _save_listeners: List[Callable[[str, Set[str]], None]] = []
+
+    # 上流APIの1回の呼び出しでまとめて取得できるアドレス数（1の場合はアドレスごとに取得する）
+    FETCH_BATCH_SIZE = 1
+
     def __init__(self, blockchain_name: str):
         self.blockchain_name = blockchain_name
+        # 同じアドレス・期間への同時リクエストを1回の取得にまとめる
+        self._inflight = SingleFlight()
+
+    def normalize_address(self, address: str) -> str:
+        """
+        アドレスをこのブロックチェーンの正規形に変換（保存・検索・比較は正規形で行う）
+        """
+        return normalize_address(self.blockchain_name, address)
     
     @abstractmethod
+    def fetch_from_api(self, address: str, start_datetime: datetime,
+                       end_datetime: datetime, db: Session = None) -> List[Dict[str, Any]]:
+        """
+        上流APIから指定期間のトランザクションを取得
+
+        Parameters:
+        - address: 取得対象のアドレス
+        - start_datetime: 開始日時
+        - end_datetime: 終了日時
+        - db: データベースセッション（同期状態の参照・更新に使用）
+        """
+        pass
+
+    def fetch_many_from_api(self, addresses: List[str], start_datetime: datetime,
+                            end_datetime: datetime, db: Session = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        上流APIから複数のアドレスの指定期間のトランザクションを取得し、アドレスごとに分けて返す
+
+        既定ではアドレスごとにfetch_from_apiを呼び出す。
+        複数のアドレスをまとめて取得できる上流APIでは、サブクラスでオーバーライドする。
+        """
+        return {
+            address: self.fetch_from_api(address, start_datetime, end_datetime, db=db)
+            for address in addresses
+        }
+
+    def fetch_pages_from_api(self, address: str, start_datetime: datetime,
+                             end_datetime: datetime, db: Session = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        上流APIから指定期間のトランザクションをページ単位で取得
+
+        既定ではfetch_from_apiの結果全体を1ページとして返す。
+        ページングに対応した上流APIでは、サブクラスでオーバーライドする。
+        """
+        yield self.fetch_from_api(address, start_datetime, end_datetime, db=db)
+
     def get_transactions(self, address: str, start_datetime: Optional[datetime] = None,
                          end_datetime: Optional[datetime] = None, db: Session = None, 
-                         depth: Optional[int] = None) -> List[TransactionSchema]:
+                         depth: Optional[int] = None,
+                         filters: Optional[TransactionFilter] = None) -> List[TransactionSchema]:
         """
         指定されたアドレスのトランザクションを取得
         
@@ -27,13 +92,196 @@ class BlockchainService(ABC):
         - start_datetime: 開始日時
         - end_datetime: 終了日時
         - db: データベースセッション
-        - depth: ネットワーク探索の深さ（キャッシュ判断に使用）
+        - depth: ネットワーク探索の深さ（保存時にfetch_depthとして記録）
+        - filters: 返すトランザクションの絞り込み条件（最小金額・取引相手。SQLで適用する）
+
+        address_sync_rangesに記録された取得済み期間と要求期間を比較し、
+        未取得の期間だけを上流APIから取得してからキャッシュと合わせて返す。
+
+        同じ(blockchain, address, 期間, 探索の深さ)に対する同時呼び出しは1回の取得にまとめられ、
+        後から呼び出した側は実行中の取得の完了を待って同じ結果を受け取る。
+        （深さが異なる呼び出しはまとめない。保存する行のfetch_depthは各呼び出しの深さで記録する）
         """
-        pass
-    
+        address = self.normalize_address(address)
+        key = (
+            self.blockchain_name, address, start_datetime, end_datetime, depth, db is not None,
+            filters.key() if filters else None,
+        )
+        return list(self._inflight.do(
+            key,
+            lambda: self._get_transactions(address, start_datetime, end_datetime, db, depth, filters),
+        ))
+
+    def _get_transactions(self, address: str, start_datetime: Optional[datetime],
+                          end_datetime: Optional[datetime], db: Optional[Session],
+                          depth: Optional[int],
+                          filters: Optional[TransactionFilter] = None) -> List[TransactionSchema]:
+        """
+        get_transactionsの本体（SingleFlightを通じて呼び出される）
+        """
+        # データベースを使用しない場合はAPIの結果を直接スキーマに変換
+        if not db:
+            raw_transactions = self.fetch_from_api(
+                address, start_datetime or CHAIN_EPOCH, end_datetime or datetime.utcnow()
+            )
+            return [
+                self._raw_to_schema(tx) for tx in raw_transactions
+                if filters is None or filters.matches(self.blockchain_name, tx)
+            ]
+
+        self._sync_transactions(address, start_datetime, end_datetime, db, depth)
+
+        # キャッシュ済みの行と新たに保存した行をまとめて取得
+        cached_transactions = self.get_cached_transactions(
+            address=address,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            db=db,
+            filters=filters,
+        )
+        return self.format_transactions(cached_transactions)
+
+    def get_transactions_many(self, addresses: List[str], start_datetime: Optional[datetime] = None,
+                              end_datetime: Optional[datetime] = None, db: Session = None,
+                              depth: Optional[int] = None,
+                              filters: Optional[TransactionFilter] = None) -> Dict[str, List[TransactionSchema]]:
+        """
+        複数のアドレスのトランザクションをまとめて取得（BFSの1階層分の取得用）
+
+        Parameters:
+        - addresses: 取得対象のアドレス一覧
+        - start_datetime: 開始日時
+        - end_datetime: 終了日時
+        - db: データベースセッション
+        - depth: ネットワーク探索の深さ（保存時にfetch_depthとして記録）
+        - filters: 返すトランザクションの絞り込み条件（SQLで適用する）
+
+        未取得の期間が同じアドレスをFETCH_BATCH_SIZE件ずつfetch_many_from_apiで取得し、
+        アドレスごとに分けられた結果を保存してから、各アドレスのトランザクションを返す。
+        形式が不正なアドレスは警告を記録して戻り値から除く。
+        """
+        normalized: Dict[str, str] = {}
+        for address in addresses:
+            try:
+                self.validate_address(address)
+            except HTTPException as e:
+                logger.warning(f"Skipping address {address}: {e.detail}")
+                continue
+            normalized[address] = self.normalize_address(address)
+
+        self._sync_transactions_many(list(dict.fromkeys(normalized.values())), start_datetime, end_datetime, db, depth)
+        return {
+            address: self.format_transactions(
+                self.get_cached_transactions(normalized_address, start_datetime, end_datetime, db, filters=filters)
+            )
+            for address, normalized_address in normalized.items()
+        }
+
+    def _sync_transactions_many(self, addresses: List[str], start_datetime: Optional[datetime],
+                                end_datetime: Optional[datetime], db: Session,
+                                depth: Optional[int]) -> None:
+        """
+        _sync_transactionsの複数アドレス版（未取得の期間が同じアドレスをまとめて上流APIから取得する）
+        """
+        # 終了日時が未指定の場合も全アドレスで同じ期間になるよう、現在時刻を揃える
+        now = datetime.utcnow()
+        groups: Dict[Tuple[datetime, datetime], List[str]] = {}
+        for address in addresses:
+            covered = get_covered_intervals(db, self.blockchain_name, address)
+            for gap in plan_sync(covered, start_datetime, end_datetime, now=now):
+                groups.setdefault(gap, []).append(address)
+
+        batch_size = max(1, self.FETCH_BATCH_SIZE)
+        for (gap_start, gap_end), group in groups.items():
+            for offset in range(0, len(group), batch_size):
+                batch = group[offset:offset + batch_size]
+                logger.info(f"Fetching transactions from API for {len(batch)} addresses ({gap_start} - {gap_end})")
+                fetched = self.fetch_many_from_api(batch, gap_start, gap_end, db=db)
+                for address in batch:
+                    self.save_transactions_to_db(fetched.get(address, []), db, depth)
+                    record_coverage(db, self.blockchain_name, address, gap_start, gap_end)
+
+    def iter_transactions(self, address: str, start_datetime: Optional[datetime] = None,
+                          end_datetime: Optional[datetime] = None, db: Session = None,
+                          depth: Optional[int] = None,
+                          batch_size: int = 1000,
+                          filters: Optional[TransactionFilter] = None) -> Iterator[TransactionSchema]:
+        """
+        get_transactionsと同じトランザクションを、全件をメモリに載せずに順に返す（ストリーミング用）
+
+        未取得の期間の取得と保存はこの呼び出しの中で行い（エラーはここで送出される）、
+        返したイテレータは保存済みの行をbatch_size件ずつ読み出す。
+        """
+        address_id = self._sync_address(address, start_datetime, end_datetime, db, depth)
+        query = self._filtered_transactions_query(db, address_id, start_datetime, end_datetime, filters)
+        if query is None:
+            return iter(())
+        return self._iter_cached_transactions(query, db, batch_size)
+
+    def get_transaction_rows(self, address: str, start_datetime: Optional[datetime] = None,
+                             end_datetime: Optional[datetime] = None, db: Session = None,
+                             depth: Optional[int] = None,
+                             filters: Optional[TransactionFilter] = None) -> List[Any]:
+        """
+        get_transactionsと同じトランザクションを、スキーマに変換せずDBの行のまま返す
+        （app.serialization.transaction_rows で直接レスポンスに変換する高速なシリアライズ用）
+        """
+        address_id = self._sync_address(address, start_datetime, end_datetime, db, depth)
+        query = self._filtered_transactions_query(db, address_id, start_datetime, end_datetime, filters)
+        if query is None:
+            return []
+        return db.execute(query).fetchall()
+
+    def validate_address(self, address: str) -> None:
+        """
+        アドレスの形式を検証する（不正な場合はHTTPExceptionを送出する。既定では検証しない）
+        """
+
+    def _sync_address(self, address: str, start_datetime: Optional[datetime],
+                      end_datetime: Optional[datetime], db: Session,
+                      depth: Optional[int]) -> Optional[int]:
+        """
+        未取得の期間を取得・保存し、アドレスIDを返す（保存済みのトランザクションがない場合はNone）
+        """
+        self.validate_address(address)
+        address = self.normalize_address(address)
+        key = ("sync", self.blockchain_name, address, start_datetime, end_datetime, depth)
+        self._inflight.do(
+            key,
+            lambda: self._sync_transactions(address, start_datetime, end_datetime, db, depth),
+        )
+        return address_registry.get_id(db, self.blockchain_name, address)
+
+    def _iter_cached_transactions(self, query: Select, db: Session,
+                                  batch_size: int) -> Iterator[TransactionSchema]:
+        result = db.execute(query.execution_options(stream_results=True))
+        for rows in result.partitions(batch_size):
+            yield from self.format_transactions(rows)
+
+    def _sync_transactions(self, address: str, start_datetime: Optional[datetime],
+                           end_datetime: Optional[datetime], db: Session,
+                           depth: Optional[int]) -> None:
+        """
+        要求期間のうち未取得の期間を上流APIから取得して保存し、取得済み期間として記録する
+        """
+        covered = get_covered_intervals(db, self.blockchain_name, address)
+        gaps = plan_sync(covered, start_datetime, end_datetime)
+
+        if not gaps:
+            logger.info(f"Using cached transactions for address: {address} ({start_datetime} - {end_datetime})")
+
+        # 未取得の期間のみ上流APIから取得し、取得済み期間として記録
+        for gap_start, gap_end in gaps:
+            logger.info(f"Fetching transactions from API for address: {address} ({gap_start} - {gap_end})")
+            # ページ単位で取得できる上流APIでは、届いたページから順に保存する
+            for page in self.fetch_pages_from_api(address, gap_start, gap_end, db=db):
+                self.save_transactions_to_db(page, db, depth)
+            record_coverage(db, self.blockchain_name, address, gap_start, gap_end)
+
     def get_cached_transactions(self, address: str, start_datetime: Optional[datetime] = None,
                                end_datetime: Optional[datetime] = None, db: Session = None,
-                               depth: Optional[int] = None) -> List[Transaction]:
+                               depth: Optional[int] = None,
+                               filters: Optional[TransactionFilter] = None) -> List[Any]:
         """
         データベースから既存のトランザクションを取得
         
@@ -42,87 +290,442 @@ class BlockchainService(ABC):
         - start_datetime: 開始日時
         - end_datetime: 終了日時
         - db: データベースセッション
-        - depth: ネットワーク探索の深さ（キャッシュ判断に使用）
+        - depth: 互換性のために残している引数（キャッシュ判断はaddress_sync_rangesで行う）
+        - filters: 絞り込み条件（最小金額・取引相手）
         """
         if not db:
             return []
-            
-        query = db.query(Transaction).filter(
-            and_(
-                Transaction.blockchain == self.blockchain_name,
-                (Transaction.from_address == address) | (Transaction.to_address == address)
+
+        address_id = address_registry.get_id(db, self.blockchain_name, self.normalize_address(address))
+        query = self._filtered_transactions_query(db, address_id, start_datetime, end_datetime, filters)
+        if query is None:
+            return []
+        return db.execute(query).fetchall()
+
+    def _filtered_transactions_query(self, db: Session, address_id: Optional[int],
+                                     start_datetime: Optional[datetime], end_datetime: Optional[datetime],
+                                     filters: Optional[TransactionFilter]) -> Optional[Select]:
+        """
+        絞り込み条件を含めたcached_transactions_queryを返す（該当する行がないと分かる場合はNone）
+        """
+        if address_id is None:
+            return None
+        conditions = filters.conditions(db, self.blockchain_name) if filters else []
+        if conditions is None:
+            return None
+        return self.cached_transactions_query(address_id, start_datetime, end_datetime, conditions)
+
+    def cached_transactions_query(self, address_id: int, start_datetime: Optional[datetime],
+                                  end_datetime: Optional[datetime],
+                                  conditions: Sequence[Any] = ()) -> Select:
+        """
+        アドレスIDが送信元または送信先のトランザクションを取得するクエリ
+
+        OR条件ではなく、送信元・送信先それぞれの複合インデックス
+        (from_address_id, timestamp) / (to_address_id, timestamp) を
+        範囲スキャンする2つのクエリのUNION ALLとして組み立てる。
+        アドレス文字列はaddressesテーブルとの結合で復元し、from_address/to_addressとして返す。
+        conditions（TransactionFilter.conditionsの条件式など）は両方のクエリに追加する。
+        """
+        table = Transaction.__table__
+
+        def ranged(*address_conditions: Any) -> Select:
+            query = self._labelled_transactions_select().where(*address_conditions, *conditions)
+            if start_datetime:
+                query = query.where(table.c.timestamp >= start_datetime)
+            if end_datetime:
+                query = query.where(table.c.timestamp <= end_datetime)
+            return query
+
+        sent = ranged(table.c.from_address_id == address_id)
+        # 自分宛の送金（送信元と送信先が同じ）は送信側で取得済みのため除外する
+        received = ranged(
+            table.c.to_address_id == address_id,
+            table.c.from_address_id != address_id,
+        )
+        return union_all(sent, received)
+
+    def get_address_stats(self, address: str, db: Session) -> Optional[AddressStatsSchema]:
+        """
+        アドレスの保存済みトランザクションの集計を返す（保存済みのトランザクションがない場合はNone）
+
+        トランザクションの保存時に更新した集計の1行を読むだけで、transactionsテーブルは参照しない。
+        """
+        normalized_address = self.normalize_address(address)
+        address_id = address_registry.get_id(db, self.blockchain_name, normalized_address)
+        stats = get_address_stats(db, address_id) if address_id is not None else None
+        if stats is None:
+            return None
+        return AddressStatsSchema(
+            blockchain=self.blockchain_name,
+            address=normalized_address,
+            tx_count=stats.in_count + stats.out_count,
+            in_count=stats.in_count,
+            out_count=stats.out_count,
+            in_volume=stats.in_volume,
+            out_volume=stats.out_volume,
+            net_volume=stats.in_volume - stats.out_volume,
+            counterparties=stats.counterparties,
+            first_seen=stats.first_seen,
+            last_seen=stats.last_seen,
+            max_transfer=stats.max_transfer,
+        )
+
+    def get_volume_timeseries(self, address: str, bucket: str, db: Session,
+                              start_datetime: Optional[datetime] = None,
+                              end_datetime: Optional[datetime] = None) -> TimeSeries:
+        """
+        アドレスの受取額・送金額・件数を期間の単位（"hour", "day", "week"）ごとに集計して返す
+
+        未取得の期間は /transactions と同様に上流APIから取得して保存し、集計は保存済みの行に対して行う。
+        """
+        address_id = self._sync_address(address, start_datetime, end_datetime, db, 1)
+        normalized_address = self.normalize_address(address)
+        points = []
+        if address_id is not None:
+            points = volume_timeseries(
+                db, {address_id: normalized_address}, bucket, start_datetime, end_datetime
+            )[address_id]
+        return TimeSeries.construct(
+            blockchain=self.blockchain_name, address=normalized_address, bucket=bucket, points=points
+        )
+
+    def get_volume_timeseries_many(self, addresses: List[str], bucket: str, db: Session,
+                                   start_datetime: Optional[datetime] = None,
+                                   end_datetime: Optional[datetime] = None) -> List[TimeSeries]:
+        """
+        複数のアドレスの時系列をまとめて集計して返す（ネットワークのノード全体などに使用）
+
+        保存済みのトランザクションのみを集計し、上流APIへの問い合わせは行わない。
+        アドレスIDをまとめて引き、IN句で一括して集計するため、アドレスごとにクエリを発行しない。
+        戻り値はaddressesと同じ順序（保存済みのトランザクションがないアドレスは空の時系列）。
+        """
+        normalized = [self.normalize_address(address) for address in addresses]
+        address_ids = address_registry.get_ids(db, self.blockchain_name, set(normalized))
+        series = volume_timeseries(
+            db, {address_id: address for address, address_id in address_ids.items()},
+            bucket, start_datetime, end_datetime,
+        )
+        return [
+            TimeSeries.construct(
+                blockchain=self.blockchain_name,
+                address=address,
+                bucket=bucket,
+                points=series.get(address_ids.get(address), []),
             )
+            for address in dict.fromkeys(normalized)
+        ]
+
+    def get_edge_transactions(self, source: str, target: str, db: Session,
+                              start_datetime: Optional[datetime] = None,
+                              end_datetime: Optional[datetime] = None,
+                              min_amount: Optional[float] = None) -> List[TransactionSchema]:
+        """
+        sourceからtargetへのトランザクションを保存済みの行から取得（集約されたリンクの詳細表示用）
+        """
+        return self.format_transactions(self.get_edge_transaction_rows(
+            source, target, db,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            min_amount=min_amount,
+        ))
+
+    def get_edge_transaction_rows(self, source: str, target: str, db: Session,
+                                  start_datetime: Optional[datetime] = None,
+                                  end_datetime: Optional[datetime] = None,
+                                  min_amount: Optional[float] = None) -> List[Any]:
+        """
+        get_edge_transactionsと同じトランザクションを、スキーマに変換せずDBの行のまま返す
+
+        Parameters:
+        - source: 送信元のアドレス
+        - target: 送信先のアドレス
+        - db: データベースセッション
+        - start_datetime: 開始日時
+        - end_datetime: 終了日時
+        - min_amount: 最小取引金額
+        """
+        address_ids = address_registry.get_ids(
+            db, self.blockchain_name, {self.normalize_address(source), self.normalize_address(target)}
+        )
+        source_id = address_ids.get(self.normalize_address(source))
+        target_id = address_ids.get(self.normalize_address(target))
+        if source_id is None or target_id is None:
+            return []
+
+        table = Transaction.__table__
+        query = self._labelled_transactions_select().where(
+            table.c.from_address_id == source_id,
+            table.c.to_address_id == target_id,
         )
-        
         if start_datetime:
-            query = query.filter(Transaction.timestamp >= start_datetime)
+            query = query.where(table.c.timestamp >= start_datetime)
         if end_datetime:
-            query = query.filter(Transaction.timestamp <= end_datetime)
-            
-        # 探索深度が指定されている場合、その深度以上のトランザクションのみを返す
-        if depth is not None:
-            query = query.filter(
-                (Transaction.fetch_depth >= depth) | (Transaction.fetch_depth.is_(None))
-            )
-            
-        return query.all()
-    
-    def save_transactions_to_db(self, transactions: List[Dict[str, Any]], db: Session, depth: Optional[int] = None) -> List[Transaction]:
+            query = query.where(table.c.timestamp <= end_datetime)
+        if min_amount is not None:
+            query = query.where(table.c.value >= min_amount)
+        query = query.order_by(table.c.timestamp, table.c.id)
+        return db.execute(query).fetchall()
+
+    def _labelled_transactions_select(self) -> Select:
         """
-        トランザクションをデータベースに保存
-        
+        このブロックチェーンのトランザクションを、アドレスIDを文字列に戻した列
+        （from_address / to_address）とともに取得するSELECT
+        """
+        table = Transaction.__table__
+        from_addresses = Address.__table__.alias("from_addresses")
+        to_addresses = Address.__table__.alias("to_addresses")
+        columns = [
+            column for column in table.c
+            if column.name not in ("from_address_id", "to_address_id")
+        ] + [
+            from_addresses.c.address.label("from_address"),
+            to_addresses.c.address.label("to_address"),
+        ]
+        joined = table.join(from_addresses, from_addresses.c.id == table.c.from_address_id) \
+                      .join(to_addresses, to_addresses.c.id == table.c.to_address_id)
+        return select(*columns).select_from(joined).where(table.c.blockchain == self.blockchain_name)
+
+    # 一括upsertの1バッチあたりの行数（PostgreSQLのバインドパラメータ上限を超えないようにする）
+    UPSERT_BATCH_SIZE = 1000
+
+    # 重複判定に使用する一意キー（models.Transactionのuq_transactions_identityと一致させる）
+    IDENTITY_COLUMNS = ("blockchain", "txid", "from_address_id", "to_address_id", "value")
+
+    def save_transactions_to_db(self, transactions: List[Dict[str, Any]], db: Session, depth: Optional[int] = None) -> List[Any]:
+        """
+        トランザクションをデータベースに一括保存
+
         注意：
         - Bitcoinなどの場合、同じtxidが複数の送金先（to_address）を持つことがある（UTXOモデル）
         - 同じtxidでも、送金元、送金先、金額が異なる場合は別のトランザクションとして扱う
-        - 完全に同一のトランザクション（txid, value, from_address, to_addressが全て同じ）は重複として扱われる
-        - 探索深度（depth）が異なる場合は、既存のトランザクションを更新する
+        - 完全に同一のトランザクション（blockchain, txid, value, from_address, to_addressが全て同じ）は重複として扱われる
+        - 探索深度（depth）が既存のトランザクションより深い場合は、既存のトランザクションを更新する
+        - アドレスは正規化したうえでaddressesテーブルの整数IDに置き換えて保存する
+        - 新たに挿入した行の分だけ、同じトランザクション内でaddress_statsの集計を更新する
+        - 保存後のリスナー（キャッシュの無効化など）には、新たに挿入した行に含まれるアドレスのみを通知する
+
+        PostgreSQLでは INSERT ... ON CONFLICT DO UPDATE をバッチ単位で実行するため、行ごとの重複確認クエリは発行しない。
+        戻り値は入力に対応する保存済みの行（新規・既存の両方）で、transactionsテーブルの列名で参照できる
+        （アドレスは from_address_id / to_address_id の整数IDで、アドレスの文字列は含まない）。
         """
-        db_transactions = []
-        
+        rows = self._build_upsert_rows(transactions, depth)
+        if not rows:
+            return []
+
+        # アドレスをまとめて登録し、IDに置き換える
+        address_ids = address_registry.get_ids(
+            db, self.blockchain_name,
+            {row["from_address"] for row in rows} | {row["to_address"] for row in rows},
+            create=True,
+        )
+        encoded_rows = []
+        for row in rows:
+            encoded = dict(row)
+            encoded["from_address_id"] = address_ids[encoded.pop("from_address")]
+            encoded["to_address_id"] = address_ids[encoded.pop("to_address")]
+            encoded_rows.append(encoded)
+
+        dialect = db.bind.dialect.name
+        saved_rows = []
+        inserted_rows = []
+        for i in range(0, len(encoded_rows), self.UPSERT_BATCH_SIZE):
+            batch = encoded_rows[i:i + self.UPSERT_BATCH_SIZE]
+            if dialect == "postgresql":
+                saved, inserted = self._upsert_batch_postgresql(batch, db)
+            elif dialect == "sqlite":
+                saved, inserted = self._upsert_batch_sqlite(batch, db)
+            else:
+                saved, inserted = self._upsert_batch_orm(batch, db)
+            saved_rows.extend(saved)
+            inserted_rows.extend(inserted)
+
+        # 既に保存済みだった行（探索深度の更新のみ）は集計に加えない
+        update_address_stats(db, inserted_rows)
+        db.commit()
+        # 既に保存済みだった行は、構築済みのネットワークなどの内容を変えないため通知しない
+        if inserted_rows:
+            addresses_by_id = {address_id: address for address, address_id in address_ids.items()}
+            self._notify_saved([
+                {"from_address": addresses_by_id[row.from_address_id], "to_address": addresses_by_id[row.to_address_id]}
+                for row in inserted_rows
+            ])
+        logger.info(f"Upserted {len(rows)} transactions ({len(transactions) - len(rows)} duplicates in input) with depth: {depth}")
+        return saved_rows
+
+    @classmethod
+    def add_save_listener(cls, listener: Callable[[str, Set[str]], None]) -> None:
+        """
+        トランザクション保存後に呼び出されるリスナーを登録
+        """
+        cls._save_listeners.append(listener)
+
+    def _notify_saved(self, rows: List[Dict[str, Any]]) -> None:
+        addresses = set()
+        for row in rows:
+            addresses.add(row["from_address"])
+            addresses.add(row["to_address"])
+        for listener in self._save_listeners:
+            listener(self.blockchain_name, addresses)
+
+    def _build_upsert_rows(self, transactions: List[Dict[str, Any]], depth: Optional[int]) -> List[Dict[str, Any]]:
+        """
+        APIから取得したトランザクションをinsert用の行に変換し、入力内の重複を取り除く
+        （同一バッチ内に同じキーがあるとON CONFLICT DO UPDATEが失敗するため）
+        アドレスはこの時点では正規化済みの文字列で、save_transactions_to_dbでIDに置き換える。
+        """
+        rows = []
+        seen = set()
         for tx in transactions:
-            # 重複チェック：同一のtxid, value, from_address, to_addressの組み合わせが既に存在するか確認
-            db_tx = (
-                db.query(Transaction)
-                .filter(
-                    Transaction.txid == tx["txid"],
-                    Transaction.value == tx["value"],
-                    Transaction.from_address == tx["from_address"],
-                    Transaction.to_address == tx["to_address"],
-                )
-                .first()
-            )
-            
-            # 既存のトランザクションが見つかった場合
-            if db_tx:
-                # 探索深度が指定されており、既存のトランザクションの深度と異なる場合は更新
-                if depth is not None and (db_tx.fetch_depth is None or db_tx.fetch_depth < depth):
-                    print(f"Updating transaction depth: {tx['txid']} (from: {tx['from_address']}, to: {tx['to_address']}, value: {tx['value']}) - depth: {db_tx.fetch_depth} -> {depth}")
-                    db_tx.fetch_depth = depth
-                    db_transactions.append(db_tx)
-                else:
-                    print(f"Skip duplicate transaction: {tx['txid']} (from: {tx['from_address']}, to: {tx['to_address']}, value: {tx['value']})")
+            row = {
+                "blockchain": tx["blockchain"],
+                "txid": tx["txid"],
+                "from_address": self.normalize_address(tx["from_address"]),
+                "to_address": self.normalize_address(tx["to_address"]),
+                "value": tx["value"],
+                "timestamp": tx["timestamp"],
+                "block_number": tx["block_number"],
+                "fetch_depth": depth,
+                "is_contract_interaction": tx.get("is_contract_interaction", False),
+                "contract_address": tx.get("contract_address"),
+                "contract_method": tx.get("contract_method"),
+                "contract_input_data": tx.get("contract_input_data"),
+            }
+            key = (row["blockchain"], row["txid"], row["from_address"], row["to_address"], row["value"])
+            if key in seen:
                 continue
-            
-            # 新しいトランザクションを追加
-            print(f"Add new transaction: {tx['txid']} (from: {tx['from_address']}, to: {tx['to_address']}, value: {tx['value']}, depth: {depth})")
-            db_tx = Transaction(
-                blockchain=tx["blockchain"],
-                txid=tx["txid"],
-                from_address=tx["from_address"],
-                to_address=tx["to_address"],
-                value=tx["value"],
-                timestamp=tx["timestamp"],
-                block_number=tx["block_number"],
-                fetch_depth=depth,
+            seen.add(key)
+            rows.append(row)
+        return rows
+
+    def _upsert_batch_postgresql(self, batch: List[Dict[str, Any]], db: Session) -> Tuple[List[Any], List[Any]]:
+        """
+        PostgreSQL: INSERT ... ON CONFLICT DO UPDATE SET fetch_depth = GREATEST(...) RETURNING
+
+        戻り値は (保存済みの行, そのうち新たに挿入した行)。
+        挿入した行はxmaxが0になるため、RETURNINGで新規の行か既存の行の更新かを判定する。
+        """
+        table = Transaction.__table__
+        stmt = postgresql_insert(table).values(batch)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(self.IDENTITY_COLUMNS),
+            # GREATESTはNULLを無視するため、どちらか一方がNULLでも深い方の値が残る
+            set_={
+                "fetch_depth": func.greatest(table.c.fetch_depth, stmt.excluded.fetch_depth),
+                **self._confirmation_updates(table, stmt.excluded),
+            },
+        ).returning(*table.c, literal_column("(xmax = 0)").label("inserted"))
+        saved_rows = db.execute(stmt).fetchall()
+        return saved_rows, [row for row in saved_rows if row.inserted]
+
+    def _upsert_batch_sqlite(self, batch: List[Dict[str, Any]], db: Session) -> Tuple[List[Any], List[Any]]:
+        """
+        SQLite（テスト用）: 1行ずつ INSERT ... ON CONFLICT DO NOTHING で挿入し、既存だった行の探索深度を更新した後、
+        一意キーでバッチ単位に読み戻す（SQLAlchemy 1.4ではSQLiteのRETURNINGが使えないため）
+
+        戻り値は (保存済みの行, そのうち新たに挿入した行)。
+        新しい行は、その行のINSERTの件数（rowcount）と挿入したID（lastrowid）で判定するため、
+        他の接続の書き込みやIDの再利用があっても、既存の行を新しい行として数えない。
+        """
+        table = Transaction.__table__
+        insert_stmt = sqlite_insert(table).on_conflict_do_nothing(index_elements=list(self.IDENTITY_COLUMNS))
+        inserted_ids = set()
+        existing = []
+        for row in batch:
+            result = db.execute(insert_stmt, row)
+            if result.rowcount == 1:
+                inserted_ids.add(result.lastrowid)
+            else:
+                existing.append(row)
+
+        if existing:
+            stmt = sqlite_insert(table).values(existing)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(self.IDENTITY_COLUMNS),
+                # SQLiteにはGREATESTがないため、NULLを補ったうえでスカラー関数maxを使う
+                set_={
+                    "fetch_depth": func.max(
+                        func.coalesce(table.c.fetch_depth, stmt.excluded.fetch_depth),
+                        func.coalesce(stmt.excluded.fetch_depth, table.c.fetch_depth),
+                    ),
+                    **self._confirmation_updates(table, stmt.excluded),
+                },
             )
-            db.add(db_tx)
-            db_transactions.append(db_tx)
-        
-        if db_transactions:
-            db.commit()
-            
-        return db_transactions
-    
+            db.execute(stmt)
+
+        saved_rows = self._select_by_identity(batch, db)
+        return saved_rows, [row for row in saved_rows if row.id in inserted_ids]
+
+    def _upsert_batch_orm(self, batch: List[Dict[str, Any]], db: Session) -> Tuple[List[Any], List[Any]]:
+        """
+        ON CONFLICTに対応していないデータベース: 既存の行を一意キーで読み出し、ない行のみを挿入する
+
+        戻り値は (保存済みの行, そのうち新たに挿入した行)。
+        """
+        existing = {
+            tuple(getattr(row, column) for column in self.IDENTITY_COLUMNS): row
+            for row in self._select_by_identity(batch, db, orm=True)
+        }
+        saved_rows = []
+        inserted_rows = []
+        for row in batch:
+            db_tx = existing.get(tuple(row[column] for column in self.IDENTITY_COLUMNS))
+            if db_tx is None:
+                db_tx = Transaction(**row)
+                db.add(db_tx)
+                inserted_rows.append(db_tx)
+            else:
+                if row["fetch_depth"] is not None and (db_tx.fetch_depth is None or db_tx.fetch_depth < row["fetch_depth"]):
+                    db_tx.fetch_depth = row["fetch_depth"]
+                if db_tx.block_number is not None and db_tx.block_number < 0:
+                    db_tx.block_number = row["block_number"]
+                    db_tx.timestamp = row["timestamp"]
+            saved_rows.append(db_tx)
+        db.flush()
+        return saved_rows, inserted_rows
+
+    @staticmethod
+    def _confirmation_updates(table: Any, excluded: Any) -> Dict[str, Any]:
+        """
+        未承認（ブロック番号が負）で保存済みの行を、新しく取得した行のブロック番号と日時で置き換える更新式
+        """
+        unconfirmed = table.c.block_number < 0
+        return {
+            "block_number": case((unconfirmed, excluded.block_number), else_=table.c.block_number),
+            "timestamp": case((unconfirmed, excluded.timestamp), else_=table.c.timestamp),
+        }
+
+    def _select_by_identity(self, batch: List[Dict[str, Any]], db: Session, orm: bool = False) -> List[Any]:
+        """
+        バッチの行と一意キーが一致する保存済みの行を読み出す（ormがTrueの場合はORMオブジェクトとして返す）
+        """
+        keys = {tuple(row[column] for column in self.IDENTITY_COLUMNS) for row in batch}
+        result = db.execute(
+            select(Transaction if orm else Transaction.__table__).where(
+                Transaction.blockchain.in_({row["blockchain"] for row in batch}),
+                Transaction.txid.in_({row["txid"] for row in batch}),
+            )
+        )
+        candidates = result.scalars().all() if orm else result.fetchall()
+        return [
+            row for row in candidates
+            if tuple(getattr(row, column) for column in self.IDENTITY_COLUMNS) in keys
+        ]
+
+    def _raw_to_schema(self, tx: Dict[str, Any]) -> TransactionSchema:
+        """
+        APIから取得したトランザクションをスキーマに変換
+        """
+        return TransactionSchema(
+            blockchain=tx["blockchain"],
+            txid=tx["txid"],
+            from_address=tx["from_address"],
+            to_address=tx["to_address"],
+            value=tx["value"],
+            timestamp=tx["timestamp"],
+            block_number=tx["block_number"]
+        )
+
     def format_transactions(self, transactions: List[Transaction]) -> List[TransactionSchema]:
         """
         データベースモデルからスキーマへ変換
@@ -137,6 +740,11 @@ class BlockchainService(ABC):
                 timestamp=tx.timestamp,
                 block_number=tx.block_number,
                 fetch_depth=tx.fetch_depth,
+                # NULLの行はスキーマの既定値（False）とする
+                is_contract_interaction=bool(tx.is_contract_interaction),
+                contract_address=tx.contract_address,
+                contract_method=tx.contract_method,
+                contract_input_data=tx.contract_input_data,
             )
             for tx in transactions
         ]
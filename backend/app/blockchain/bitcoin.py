@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 from datetime import datetime
 from sqlalchemy.orm import Session
 import re
@@ -7,14 +7,18 @@ from fastapi import HTTPException
 from ..api.blockcypher import BlockCypherClient
 from ..schemas import Transaction as TransactionSchema
 from .base import BlockchainService
+from .filters import TransactionFilter
+from .coverage import CHAIN_EPOCH, get_sync_state, update_high_water_mark
 from ..config import BLOCKCYPHER_BASE_URL, BLOCKCYPHER_API_KEY
-from ..database.models import Transaction
 
 
 class BitcoinService(BlockchainService):
     """
     Bitcoinブロックチェーン用のサービス実装
     """
+    # BlockCypherは複数のアドレスを1回の呼び出しで取得できる
+    FETCH_BATCH_SIZE = BlockCypherClient.BATCH_SIZE
+
     def __init__(self):
         super().__init__("bitcoin")
         # 設定ファイルからAPIのURLとAPIキーを取得
@@ -38,59 +42,102 @@ class BitcoinService(BlockchainService):
                 re.match(p2sh_pattern, address) is not None or
                 re.match(bech32_pattern, address) is not None)
     
-    def get_transactions(self, address: str, start_datetime: Optional[datetime] = None,
-                        end_datetime: Optional[datetime] = None, db: Session = None,
-                        depth: Optional[int] = None) -> List[TransactionSchema]:
+    def validate_address(self, address: str) -> None:
         """
-        Bitcoinトランザクションの取得と処理
+        Bitcoinアドレスの形式を検証
         """
-        # アドレスの検証
         if not self.validate_bitcoin_address(address):
             raise HTTPException(
                 status_code=400,
                 detail=f"Invalid Bitcoin address format: {address}"
             )
-            
-        # データベースからキャッシュされたトランザクションを取得
-        cached_transactions = []
-        if db:
-            cached_transactions = self.get_cached_transactions(
-                address=address,
-                start_datetime=start_datetime,
-                end_datetime=end_datetime,
-                db=db,
-                depth=depth
-            )
-            
-            # キャッシュデータが存在する場合は、それをそのまま返す
-            if cached_transactions:
-                print(f"Using cached transactions for address: {address} with depth: {depth}")
-                return self.format_transactions(cached_transactions)
-        
-        # キャッシュがない場合はAPIからトランザクションを取得
-        print(f"Fetching transactions from API for address: {address}")
-        raw_transactions = self.client.get_transactions(
+
+    def get_transactions(self, address: str, start_datetime: Optional[datetime] = None,
+                        end_datetime: Optional[datetime] = None, db: Session = None,
+                        depth: Optional[int] = None,
+                        filters: Optional[TransactionFilter] = None) -> List[TransactionSchema]:
+        """
+        Bitcoinトランザクションの取得と処理
+        """
+        # アドレスの検証
+        self.validate_address(address)
+
+        return super().get_transactions(
             address=address,
             start_datetime=start_datetime,
-            end_datetime=end_datetime
+            end_datetime=end_datetime,
+            db=db,
+            depth=depth,
+            filters=filters,
         )
-        
-        # データベースに保存
-        if db:
-            db_transactions = self.save_transactions_to_db(raw_transactions, db, depth)
-            # データベースから取得したトランザクションをスキーマに変換して返す
-            return self.format_transactions(db_transactions)
-        
-        # データベースを使用しない場合は直接スキーマに変換
-        return [
-            TransactionSchema(
-                blockchain=tx["blockchain"],
-                txid=tx["txid"],
-                from_address=tx["from_address"],
-                to_address=tx["to_address"],
-                value=tx["value"],
-                timestamp=tx["timestamp"],
-                block_number=tx["block_number"]
-            )
-            for tx in raw_transactions
-        ]
+
+    def fetch_from_api(self, address: str, start_datetime: datetime,
+                       end_datetime: datetime, db: Session = None) -> List[Dict[str, Any]]:
+        """
+        BlockCypher APIからトランザクションを取得（全ページ）
+        """
+        transactions = []
+        for page in self.fetch_pages_from_api(address, start_datetime, end_datetime, db=db):
+            transactions.extend(page)
+        return transactions
+
+    def fetch_many_from_api(self, addresses: List[str], start_datetime: datetime,
+                            end_datetime: datetime, db: Session = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        BlockCypher APIから複数のアドレスのトランザクションをまとめて取得
+
+        ハイウォーターマーク以降の取得（afterを指定できるアドレス）はアドレスごとに取得し、
+        それ以外のアドレスは addrs/{a;b;c}/full でまとめて取得する。
+        """
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        batch = []
+        for address in addresses:
+            state = get_sync_state(db, self.blockchain_name, address) if db else None
+            if state and start_datetime >= state.synced_until:
+                results[address] = self.fetch_from_api(address, start_datetime, end_datetime, db=db)
+            else:
+                batch.append(address)
+
+        results.update(self.client.get_transactions_many(batch, start_datetime, end_datetime))
+
+        # ジェネシスから取得した場合のみハイウォーターマークを更新（fetch_pages_from_apiと同じ条件）
+        if db and start_datetime <= CHAIN_EPOCH:
+            for address in batch:
+                heights = [
+                    tx["block_number"] for tx in results[address]
+                    if tx.get("block_number") is not None and tx["block_number"] >= 0
+                ]
+                if heights:
+                    update_high_water_mark(db, self.blockchain_name, address, max(heights), end_datetime)
+        return results
+
+    def fetch_pages_from_api(self, address: str, start_datetime: datetime,
+                             end_datetime: datetime, db: Session = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        BlockCypher APIからトランザクションをページ単位で取得
+
+        ハイウォーターマーク（同期済みの最終ブロック高）以降の取得では after を指定し、
+        既に保存済みのブロックに到達した時点でページングを終了する。
+        """
+        state = get_sync_state(db, self.blockchain_name, address) if db else None
+        after_height = None
+        if state and start_datetime >= state.synced_until:
+            after_height = state.last_synced_block
+
+        max_height = None
+        for page in self.client.iter_transaction_pages(
+            address,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            after_height=after_height
+        ):
+            for tx in page:
+                block_number = tx.get("block_number")
+                if block_number is not None and block_number >= 0:
+                    max_height = block_number if max_height is None else max(max_height, block_number)
+            yield page
+
+        # ジェネシスまたは既存のハイウォーターマークから途切れずに取得できた場合のみ更新
+        contiguous = after_height is not None or start_datetime <= CHAIN_EPOCH
+        if db and contiguous and max_height is not None:
+            update_high_water_mark(db, self.blockchain_name, address, max_height, end_datetime)
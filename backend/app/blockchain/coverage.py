@@ -0,0 +1,208 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from ..database.models import AddressSyncRange, AddressSyncState
+
+# 期間の開始が指定されていない場合に使用する下限（ビットコインのジェネシスブロック以前）
+CHAIN_EPOCH = datetime(2009, 1, 1)
+
+# 終了日時が未指定の要求で、この時間以内に同期済みなら最新とみなす
+SYNC_FRESHNESS = timedelta(seconds=int(os.getenv("SYNC_FRESHNESS_SECONDS", "600")))
+
+# IN句でまとめて参照するアドレス数
+LOOKUP_BATCH_SIZE = 1000
+
+Interval = Tuple[datetime, datetime]
+
+# 取得済み期間の更新をアドレスごとに直列化するロック（アドレスのハッシュで振り分ける）
+_coverage_locks = [threading.Lock() for _ in range(64)]
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    """
+    重なっている、または隣接している期間を1つにまとめる
+    """
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_intervals(covered: List[Interval], start: datetime, end: datetime) -> List[Interval]:
+    """
+    [start, end] のうち、取得済みの期間（covered）に含まれない部分を返す
+    """
+    gaps: List[Interval] = []
+    cursor = start
+    for covered_start, covered_end in merge_intervals(covered):
+        if covered_end < cursor:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def plan_sync(covered: List[Interval], start_datetime: Optional[datetime],
+              end_datetime: Optional[datetime], now: Optional[datetime] = None) -> List[Interval]:
+    """
+    要求期間のうち、上流APIから取得する必要がある期間を返す
+
+    終了日時が指定されていない場合は現在時刻までを対象とするが、
+    SYNC_FRESHNESS 以内に同期済みであれば末尾の短い期間は取得しない。
+    """
+    now = now or datetime.utcnow()
+    start = start_datetime or CHAIN_EPOCH
+    if end_datetime is not None:
+        return missing_intervals(covered, start, end_datetime)
+
+    fresh_until = now - SYNC_FRESHNESS
+    gaps = missing_intervals(covered, start, fresh_until)
+    # 末尾の期間を取得する場合は、現在時刻まで取得する
+    if gaps and gaps[-1][1] == fresh_until:
+        gaps[-1] = (gaps[-1][0], now)
+    return gaps
+
+
+def find_unsynced_addresses(db: Session, blockchain: str, addresses: List[str],
+                            start_datetime: Optional[datetime],
+                            end_datetime: Optional[datetime]) -> List[str]:
+    """
+    要求期間に未取得の部分があるアドレスを、addressesの順序のまま返す
+    （アドレスごとにクエリを発行せず、まとめて取得済み期間を参照する）
+    """
+    covered: Dict[str, List[Interval]] = {address: [] for address in addresses}
+    for i in range(0, len(addresses), LOOKUP_BATCH_SIZE):
+        batch = addresses[i:i + LOOKUP_BATCH_SIZE]
+        rows = (
+            db.query(AddressSyncRange.address, AddressSyncRange.range_start, AddressSyncRange.range_end)
+            .filter(
+                AddressSyncRange.blockchain == blockchain,
+                AddressSyncRange.address.in_(batch),
+            )
+            .all()
+        )
+        for row in rows:
+            covered[row.address].append((row.range_start, row.range_end))
+
+    now = datetime.utcnow()
+    return [
+        address for address in addresses
+        if plan_sync(covered[address], start_datetime, end_datetime, now=now)
+    ]
+
+
+def get_covered_intervals(db: Session, blockchain: str, address: str) -> List[Interval]:
+    """
+    アドレスの取得済み期間を取得
+    """
+    rows = (
+        db.query(AddressSyncRange.range_start, AddressSyncRange.range_end)
+        .filter(
+            AddressSyncRange.blockchain == blockchain,
+            AddressSyncRange.address == address,
+        )
+        .order_by(AddressSyncRange.range_start)
+        .all()
+    )
+    return [(row.range_start, row.range_end) for row in rows]
+
+
+def record_coverage(db: Session, blockchain: str, address: str,
+                    start: datetime, end: datetime) -> None:
+    """
+    [start, end] を取得済み期間として記録する
+
+    重なる・隣接する既存の記録は1行にまとめるため、アドレスごとの行数は
+    取得済み期間の「穴」の数に比例する。
+    同じアドレスの記録は、プロセス内ではロックで、PostgreSQLではトランザクション単位の
+    アドバイザリロックでワーカー間でも直列化するため、同時に記録しても期間が重複した行は残らない。
+    """
+    with _coverage_locks[hash((blockchain, address)) % len(_coverage_locks)]:
+        if db.bind.dialect.name == "postgresql":
+            db.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"{blockchain}:{address}"))))
+
+        overlapping = (
+            db.query(AddressSyncRange.id, AddressSyncRange.range_start, AddressSyncRange.range_end)
+            .filter(
+                and_(
+                    AddressSyncRange.blockchain == blockchain,
+                    AddressSyncRange.address == address,
+                    AddressSyncRange.range_start <= end,
+                    AddressSyncRange.range_end >= start,
+                )
+            )
+            .all()
+        )
+
+        merged_start = min([start] + [row.range_start for row in overlapping])
+        merged_end = max([end] + [row.range_end for row in overlapping])
+        if overlapping:
+            # 一括で削除するため、既に削除されている行があってもエラーにならない
+            (
+                db.query(AddressSyncRange)
+                .filter(AddressSyncRange.id.in_([row.id for row in overlapping]))
+                .delete(synchronize_session=False)
+            )
+
+        db.add(AddressSyncRange(
+            blockchain=blockchain,
+            address=address,
+            range_start=merged_start,
+            range_end=merged_end,
+            synced_at=datetime.utcnow(),
+        ))
+        db.commit()
+
+
+def get_sync_state(db: Session, blockchain: str, address: str) -> Optional[AddressSyncState]:
+    """
+    アドレスの同期済みブロックのハイウォーターマークを取得
+    """
+    return (
+        db.query(AddressSyncState)
+        .filter(
+            AddressSyncState.blockchain == blockchain,
+            AddressSyncState.address == address,
+        )
+        .first()
+    )
+
+
+def update_high_water_mark(db: Session, blockchain: str, address: str,
+                           block_number: int, synced_until: datetime) -> None:
+    """
+    ハイウォーターマークを更新する（既存の値より大きい場合のみ。ブロックが同じ場合は同期済みの日時のみを進める）
+    """
+    state = get_sync_state(db, blockchain, address)
+    if state is None:
+        db.add(AddressSyncState(
+            blockchain=blockchain,
+            address=address,
+            last_synced_block=block_number,
+            synced_until=synced_until,
+            updated_at=datetime.utcnow(),
+        ))
+    elif block_number > state.last_synced_block or (
+        block_number == state.last_synced_block and synced_until > state.synced_until
+    ):
+        state.last_synced_block = block_number
+        state.synced_until = max(state.synced_until, synced_until)
+        state.updated_at = datetime.utcnow()
+    else:
+        return
+    db.commit()
@@ -1,13 +1,14 @@
 import logging
-from typing import List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 from datetime import datetime
 from sqlalchemy.orm import Session
 
 from ..api.etherscan import EtherscanClient
 from ..schemas import Transaction as TransactionSchema
 from .base import BlockchainService
+from .filters import TransactionFilter
+from .coverage import CHAIN_EPOCH, get_sync_state, update_high_water_mark
 from ..config import ETHERSCAN_BASE_URL, ETHERSCAN_API_KEY
-from ..database.models import Transaction
 
 logger = logging.getLogger(__name__)
 
@@ -22,52 +23,84 @@ class EthereumService(BlockchainService):
     
     def get_transactions(self, address: str, start_datetime: Optional[datetime] = None,
                         end_datetime: Optional[datetime] = None, db: Session = None,
-                        depth: Optional[int] = None) -> List[TransactionSchema]:
+                        depth: Optional[int] = None,
+                        filters: Optional[TransactionFilter] = None) -> List[TransactionSchema]:
         """
         Ethereumトランザクションの取得と処理
         """
         logger.info(f"Fetching transactions for address: {address}, start_datetime: {start_datetime}, end_datetime: {end_datetime}, depth: {depth}")
-        # データベースからキャッシュされたトランザクションを取得
-        cached_transactions = []
-        if db:
-            cached_transactions = self.get_cached_transactions(
-                address=address,
-                start_datetime=start_datetime,
-                end_datetime=end_datetime,
-                db=db,
-                depth=depth
-            )
-            
-            # キャッシュデータが存在する場合は、それをそのまま返す
-            if cached_transactions:
-                logger.info(f"Using cached transactions for address: {address} with depth: {depth}")
-                return self.format_transactions(cached_transactions)
-                
-        # キャッシュがない場合はAPIからトランザクションを取得
-        raw_transactions = self.client.get_transactions(
+        return super().get_transactions(
             address=address,
             start_datetime=start_datetime,
-            end_datetime=end_datetime
+            end_datetime=end_datetime,
+            db=db,
+            depth=depth,
+            filters=filters,
         )
-        logger.info(f"Fetched {len(raw_transactions)} raw transactions from API for address: {address}")
-        
-        # データベースに保存
-        if db:
-            db_transactions = self.save_transactions_to_db(raw_transactions, db, depth)
-            logger.info(f"Saved {len(db_transactions)} transactions to database for address: {address} with depth: {depth}")
-            # データベースから取得したトランザクションをスキーマに変換して返す
-            return self.format_transactions(db_transactions)
-        
-        # データベースを使用しない場合は直接スキーマに変換
-        return [
-            TransactionSchema(
-                blockchain=tx["blockchain"],
-                txid=tx["txid"],
-                from_address=tx["from_address"],
-                to_address=tx["to_address"],
-                value=tx["value"],
-                timestamp=tx["timestamp"],
-                block_number=tx["block_number"]
-            )
-            for tx in raw_transactions
-        ]
+
+    def fetch_from_api(self, address: str, start_datetime: datetime,
+                       end_datetime: datetime, db: Session = None) -> List[Dict[str, Any]]:
+        """
+        Etherscan APIからトランザクションを取得（全件）
+        """
+        transactions = []
+        for page in self.fetch_pages_from_api(address, start_datetime, end_datetime, db=db):
+            transactions.extend(page)
+        return transactions
+
+    def fetch_pages_from_api(self, address: str, start_datetime: datetime,
+                             end_datetime: datetime, db: Session = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Etherscan APIからトランザクションをバッチ単位で取得
+
+        日時の範囲をブロック番号の範囲に変換し、必要なブロックのみを上流に要求する（終了日時が直近の場合は最新のブロックまで）。
+        ハイウォーターマーク（同期済みの最終ブロック）以降の取得では last_synced_block + 1 から要求する。
+        レスポンスは解析しながらバッチごとに返すため、呼び出し側は届いたバッチから順に保存できる。
+        """
+        state = get_sync_state(db, self.blockchain_name, address) if db else None
+
+        if state and start_datetime >= state.synced_until:
+            start_block = state.last_synced_block + 1
+        elif start_datetime <= CHAIN_EPOCH:
+            start_block = 0
+        else:
+            start_block = self.client.get_block_number_by_time(start_datetime, closest="after") or 0
+
+        # 終了日時が直近の場合（終了日を指定しない取得など）はブロック番号に変換せず、最新のブロックまで要求する
+        # （キャッシュできない問い合わせでレート制限を消費しない。範囲外のトランザクションは日時で除外される）
+        end_block = None
+        if not self.client.is_recent(end_datetime):
+            end_block = self.client.get_block_number_by_time(end_datetime, closest="before")
+        if end_block is None:
+            end_block = self.client.LATEST_BLOCK
+
+        if start_block > end_block:
+            logger.info(f"No new blocks to fetch for address: {address} (start_block: {start_block}, end_block: {end_block})")
+            return
+
+        count = 0
+        # 実際に受け取ったトランザクションの最後のブロック
+        last_received_block = None
+        for page in self.client.iter_transaction_pages(
+            address=address,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            start_block=start_block,
+            end_block=end_block
+        ):
+            count += len(page)
+            if page:
+                last_received_block = max(last_received_block or 0, max(tx["block_number"] for tx in page))
+            yield page
+        logger.info(f"Fetched {count} raw transactions from API for address: {address} (blocks {start_block} - {end_block})")
+
+        # ジェネシスまたは既存のハイウォーターマークから途切れずに取得できた場合のみ更新
+        contiguous = start_block == 0 or (state is not None and start_block <= state.last_synced_block + 1)
+        # 上限の件数を超える分は続けて要求しているため、end_blockまで取得済み。
+        # end_blockを指定しなかった場合は、受け取った最後のブロックまでのみを同期済みとする
+        # 新しいトランザクションがなかった場合も、ハイウォーターマークから取得した場合は同期済みの日時のみを進める
+        synced_block = end_block if end_block != self.client.LATEST_BLOCK else last_received_block
+        if synced_block is None and state is not None and start_block == state.last_synced_block + 1:
+            synced_block = state.last_synced_block
+        if db and contiguous and synced_block is not None:
+            update_high_water_mark(db, self.blockchain_name, address, synced_block, end_datetime)
@@ -0,0 +1,67 @@
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from ..database.models import Transaction
+from .addresses import address_registry, normalize_address
+
+
+class TransactionFilter:
+    """
+    保存済みのトランザクションを読み出す際の絞り込み条件
+
+    - min_amount: 最小取引金額
+    - counterparty: 取引相手のアドレス（このアドレスとの間のトランザクションのみを返す）
+
+    条件はSQLのWHERE句として適用し、条件を満たさない行は読み出さない。
+    期間（start_datetime / end_datetime）は上流APIから取得する範囲も決めるため、この条件には含めず
+    これまでどおり引数で渡す（上流APIへの要求では、ブロック範囲やページングの打ち切りとして適用される）。
+    金額と取引相手は上流APIで絞り込めないうえ、取得済み期間の記録と矛盾しないよう取得した行はすべて保存する。
+    """
+    def __init__(self, min_amount: Optional[float] = None, counterparty: Optional[str] = None):
+        self.min_amount = min_amount
+        self.counterparty = counterparty
+
+    def key(self) -> tuple:
+        """
+        同時リクエストをまとめる際のキーに含める値
+        """
+        return (self.min_amount, self.counterparty)
+
+    def conditions(self, db: Session, blockchain: str) -> Optional[List[Any]]:
+        """
+        transactionsテーブルに対する条件式を返す
+        （取引相手が保存済みのアドレスにない場合は、該当する行がないためNone）
+        """
+        table = Transaction.__table__
+        conditions = []
+        if self.min_amount is not None:
+            conditions.append(table.c.value >= self.min_amount)
+        if self.counterparty is not None:
+            counterparty_id = address_registry.get_id(
+                db, blockchain, normalize_address(blockchain, self.counterparty)
+            )
+            if counterparty_id is None:
+                return None
+            conditions.append(or_(
+                table.c.from_address_id == counterparty_id,
+                table.c.to_address_id == counterparty_id,
+            ))
+        return conditions
+
+    def matches(self, blockchain: str, tx: Dict[str, Any]) -> bool:
+        """
+        上流APIから取得したトランザクションが条件を満たすか（データベースを使用しない場合に使用）
+        """
+        if self.min_amount is not None and tx["value"] < self.min_amount:
+            return False
+        if self.counterparty is not None:
+            counterparty = normalize_address(blockchain, self.counterparty)
+            endpoints = {
+                normalize_address(blockchain, tx["from_address"]),
+                normalize_address(blockchain, tx["to_address"]),
+            }
+            if counterparty not in endpoints:
+                return False
+        return True
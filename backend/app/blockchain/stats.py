@@ -0,0 +1,227 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, literal, select, union, union_all
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from ..database.models import AddressCounterparty, AddressStats, Transaction
+
+logger = logging.getLogger(__name__)
+
+# 1回のINSERTでまとめて書き込む行数
+STATS_BATCH_SIZE = 500
+
+# address_statsの加算する列と、最小値・最大値を取る列
+_SUM_COLUMNS = ("in_count", "out_count", "in_volume", "out_volume", "counterparties")
+_MIN_COLUMNS = ("first_seen",)
+_MAX_COLUMNS = ("last_seen", "max_transfer")
+
+
+def update_address_stats(db: Session, rows: Iterable[Any]) -> None:
+    """
+    新たに保存したトランザクションの行をaddress_statsに加算する
+
+    Parameters:
+    - db: データベースセッション（save_transactions_to_dbと同じトランザクション内で呼び出し、コミットは呼び出し側で行う）
+    - rows: 新たに挿入した行（from_address_id, to_address_id, value, timestamp を持つこと）。
+      既に保存済みだった行を含めると二重に数えるため、呼び出し側で取り除くこと
+
+    集計はアドレスごとの差分としてPythonでまとめ、1バッチにつき1回のUPSERTで既存の値に加算する。
+    取引相手の数は address_counterparties に新しく追加された組の数だけ増やす。
+    """
+    deltas: Dict[int, Dict[str, Any]] = {}
+    pairs: Set[Tuple[int, int]] = set()
+    for row in rows:
+        from_id, to_id = row.from_address_id, row.to_address_id
+        value = row.value or 0.0
+        _add(deltas, from_id, "out", value, row.timestamp)
+        _add(deltas, to_id, "in", value, row.timestamp)
+        if from_id != to_id:
+            pairs.add((from_id, to_id))
+            pairs.add((to_id, from_id))
+    if not deltas:
+        return
+
+    for address_id in _insert_counterparties(db, sorted(pairs)):
+        deltas[address_id]["counterparties"] += 1
+    # 複数のワーカーが同時に更新する場合のデッドロックを避けるため、ID順に書き込む
+    _upsert_stats(db, [deltas[address_id] for address_id in sorted(deltas)])
+
+
+def get_address_stats(db: Session, address_id: int) -> Optional[AddressStats]:
+    """
+    アドレスIDの集計を返す（主キーで1行を読むだけで、transactionsは参照しない）
+    """
+    return db.get(AddressStats, address_id)
+
+
+def rebuild_address_stats(db: Session) -> int:
+    """
+    transactionsテーブル全体からaddress_statsとaddress_counterpartiesを作り直し、集計したアドレス数を返す
+    （集計テーブルを追加する前に保存されたトランザクションの取り込みに使用する。
+    マイグレーションスクリプト app/database/add_address_stats.py から呼び出す）
+    """
+    transactions = Transaction.__table__
+    counterparties_table = AddressCounterparty.__table__
+    stats_table = AddressStats.__table__
+
+    db.execute(stats_table.delete())
+    db.execute(counterparties_table.delete())
+
+    # 送金・受取の両方向の組をUNIONで重複なく登録
+    not_self = transactions.c.from_address_id != transactions.c.to_address_id
+    pairs = union(
+        select(transactions.c.from_address_id, transactions.c.to_address_id).where(not_self),
+        select(transactions.c.to_address_id, transactions.c.from_address_id).where(not_self),
+    )
+    db.execute(counterparties_table.insert().from_select(["address_id", "counterparty_id"], pairs))
+
+    value = func.coalesce(transactions.c.value, 0.0)
+    sides = union_all(
+        select(
+            transactions.c.from_address_id.label("address_id"),
+            literal(0).label("in_count"), literal(1).label("out_count"),
+            literal(0.0).label("in_volume"), value.label("out_volume"),
+            value.label("value"), transactions.c.timestamp.label("timestamp"),
+        ),
+        select(
+            transactions.c.to_address_id.label("address_id"),
+            literal(1).label("in_count"), literal(0).label("out_count"),
+            value.label("in_volume"), literal(0.0).label("out_volume"),
+            value.label("value"), transactions.c.timestamp.label("timestamp"),
+        ),
+    ).subquery()
+    counts = (
+        select(counterparties_table.c.address_id, func.count().label("counterparties"))
+        .group_by(counterparties_table.c.address_id)
+        .subquery()
+    )
+    aggregated = (
+        select(
+            sides.c.address_id,
+            func.sum(sides.c.in_count),
+            func.sum(sides.c.out_count),
+            func.sum(sides.c.in_volume),
+            func.sum(sides.c.out_volume),
+            func.coalesce(func.max(counts.c.counterparties), 0),
+            func.min(sides.c.timestamp),
+            func.max(sides.c.timestamp),
+            func.max(sides.c.value),
+        )
+        .select_from(sides.outerjoin(counts, counts.c.address_id == sides.c.address_id))
+        .group_by(sides.c.address_id)
+    )
+    db.execute(stats_table.insert().from_select(
+        ["address_id", "in_count", "out_count", "in_volume", "out_volume", "counterparties",
+         "first_seen", "last_seen", "max_transfer"],
+        aggregated,
+    ))
+    db.commit()
+    rebuilt = db.execute(select(func.count()).select_from(stats_table)).scalar()
+    logger.info(f"Rebuilt address stats for {rebuilt} addresses")
+    return rebuilt
+
+
+def _add(deltas: Dict[int, Dict[str, Any]], address_id: int, direction: str,
+         value: float, timestamp: datetime) -> None:
+    delta = deltas.get(address_id)
+    if delta is None:
+        delta = deltas[address_id] = {
+            "address_id": address_id,
+            "in_count": 0, "out_count": 0, "in_volume": 0.0, "out_volume": 0.0, "counterparties": 0,
+            "first_seen": timestamp, "last_seen": timestamp, "max_transfer": value,
+        }
+    delta[f"{direction}_count"] += 1
+    delta[f"{direction}_volume"] += value
+    delta["first_seen"] = min(delta["first_seen"], timestamp)
+    delta["last_seen"] = max(delta["last_seen"], timestamp)
+    delta["max_transfer"] = max(delta["max_transfer"], value)
+
+
+def _insert_counterparties(db: Session, pairs: List[Tuple[int, int]]) -> List[int]:
+    """
+    アドレスと取引相手の組を登録し、新しく追加された組のアドレスIDを返す（組ごとに1つ）
+    """
+    table = AddressCounterparty.__table__
+    dialect = db.bind.dialect.name
+    added: List[int] = []
+    for i in range(0, len(pairs), STATS_BATCH_SIZE):
+        batch = pairs[i:i + STATS_BATCH_SIZE]
+        values = [{"address_id": address_id, "counterparty_id": counterparty_id}
+                  for address_id, counterparty_id in batch]
+        if dialect == "postgresql":
+            # 同時に登録された組は一方にのみ返るため、ワーカー間で二重に数えない
+            stmt = postgresql_insert(table).values(values).on_conflict_do_nothing().returning(table.c.address_id)
+            added.extend(row.address_id for row in db.execute(stmt))
+        elif dialect == "sqlite":
+            # SQLite（テスト用）: RETURNINGが使えないため1組ずつ挿入し、挿入した件数で新しい組を判定する
+            stmt = sqlite_insert(table).on_conflict_do_nothing()
+            added.extend(value["address_id"] for value in values if db.execute(stmt, value).rowcount == 1)
+        else:
+            # ON CONFLICTに対応していないデータベース: 既存の組を読み出し、ない組のみを挿入する
+            existing = {tuple(row) for row in db.execute(
+                select(table.c.address_id, table.c.counterparty_id).where(
+                    table.c.address_id.in_({address_id for address_id, _ in batch}),
+                    table.c.counterparty_id.in_({counterparty_id for _, counterparty_id in batch}),
+                )
+            )}
+            new_values = [value for value in values
+                          if (value["address_id"], value["counterparty_id"]) not in existing]
+            if new_values:
+                db.execute(table.insert(), new_values)
+                added.extend(value["address_id"] for value in new_values)
+    return added
+
+
+def _upsert_stats(db: Session, deltas: List[Dict[str, Any]]) -> None:
+    """
+    INSERT ... ON CONFLICT DO UPDATE で差分を既存の集計に加算する
+    """
+    table = AddressStats.__table__
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        insert, least, greatest = postgresql_insert, func.least, func.greatest
+    elif dialect == "sqlite":
+        # SQLiteでは引数が2つ以上のmin/maxがスカラー関数として動作する
+        insert, least, greatest = sqlite_insert, func.min, func.max
+    else:
+        _merge_stats(db, deltas)
+        return
+
+    for i in range(0, len(deltas), STATS_BATCH_SIZE):
+        stmt = insert(table).values(deltas[i:i + STATS_BATCH_SIZE])
+        excluded = stmt.excluded
+        updates = {name: table.c[name] + excluded[name] for name in _SUM_COLUMNS}
+        # 集計の追加前の行（NULL）は、新しい値をそのまま使う
+        updates.update({
+            name: least(func.coalesce(table.c[name], excluded[name]), excluded[name])
+            for name in _MIN_COLUMNS
+        })
+        updates.update({
+            name: greatest(func.coalesce(table.c[name], excluded[name]), excluded[name])
+            for name in _MAX_COLUMNS
+        })
+        db.execute(stmt.on_conflict_do_update(index_elements=["address_id"], set_=updates))
+
+
+def _merge_stats(db: Session, deltas: List[Dict[str, Any]]) -> None:
+    """
+    ON CONFLICTに対応していないデータベース: 既存の集計を読み出してPythonで加算する
+    """
+    for delta in deltas:
+        stats = db.get(AddressStats, delta["address_id"])
+        if stats is None:
+            db.add(AddressStats(**delta))
+            continue
+        for name in _SUM_COLUMNS:
+            setattr(stats, name, getattr(stats, name) + delta[name])
+        for name in _MIN_COLUMNS:
+            current = getattr(stats, name)
+            setattr(stats, name, delta[name] if current is None else min(current, delta[name]))
+        for name in _MAX_COLUMNS:
+            current = getattr(stats, name)
+            setattr(stats, name, delta[name] if current is None else max(current, delta[name]))
+    db.flush()
@@ -0,0 +1,217 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import Integer, case, cast, func, literal, literal_column, select, union_all
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from .. import schemas
+from ..database.models import Transaction
+from .coverage import LOOKUP_BATCH_SIZE
+
+try:
+    import numpy as np
+except ImportError:  # numpyがない環境ではPythonのループで同じ結果を集計する
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 集計の単位（PostgreSQLのdate_truncと同じ名前。週は月曜日始まり）
+TIMESERIES_BUCKETS = ("hour", "day", "week")
+
+# 単位の長さ（秒）
+_HOUR = 3600
+_DAY = 86400
+# 1970-01-01（木曜日）から見た、直前の月曜日までの日数
+_EPOCH_MONDAY_OFFSET = 3
+
+# SQLiteで読み出す列（_flows_queryの列の順）
+_FLOW_DTYPE = np.dtype([
+    ("address_id", np.int64),
+    ("seconds", np.int64),
+    ("inflow", np.float64),
+    ("outflow", np.float64),
+    ("count", np.float64),
+]) if np is not None else None
+
+
+def volume_timeseries(db: Session, address_ids: Dict[int, str], bucket: str,
+                      start_datetime: Optional[datetime] = None,
+                      end_datetime: Optional[datetime] = None) -> Dict[int, List[schemas.TimeSeriesPoint]]:
+    """
+    アドレスごとの受取額・送金額・件数を期間の単位ごとに集計する
+
+    Parameters:
+    - db: データベースセッション
+    - address_ids: 集計するアドレスID -> 正規化済みアドレス
+    - bucket: 集計の単位（"hour", "day", "week"）
+    - start_datetime: 開始日時
+    - end_datetime: 終了日時
+
+    戻り値はアドレスIDごとの集計（取引のない単位は含めない）。
+    PostgreSQLではdate_truncでGROUP BYし、集計済みの行だけを読み出す。
+    SQLiteでは日時をUNIX時間（整数）として列ごとに読み出し、numpyの配列演算で単位ごとにまとめる。
+    自分宛の送金は受取・送金の両方に含め、件数は1件として数える。
+    """
+    if bucket not in TIMESERIES_BUCKETS:
+        raise ValueError(f"Unsupported time series bucket: {bucket}")
+
+    ids = sorted(address_ids)
+    series: Dict[int, List[schemas.TimeSeriesPoint]] = {address_id: [] for address_id in ids}
+    dialect = db.bind.dialect.name
+    for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        batch = ids[i:i + LOOKUP_BATCH_SIZE]
+        if dialect == "postgresql":
+            flows = _flows_query(batch, start_datetime, end_datetime, Transaction.__table__.c.timestamp)
+            series.update(_aggregate_in_database(db, flows, bucket))
+        else:
+            # 日時の文字列の解析はSQLite側で行い、Pythonのdatetimeを経由しない
+            seconds = cast(func.strftime("%s", Transaction.__table__.c.timestamp), Integer)
+            flows = _flows_query(batch, start_datetime, end_datetime, seconds)
+            series.update(_aggregate_in_memory(db, flows, bucket))
+    return series
+
+
+def _flows_query(address_ids: List[int], start_datetime: Optional[datetime],
+                 end_datetime: Optional[datetime], timestamp: Any) -> Select:
+    """
+    アドレスごとの送金・受取を1行ずつ返すクエリ
+    （送信元・送信先それぞれの複合インデックスを範囲スキャンする2つのクエリのUNION ALL）
+
+    timestampは日時として返す式（PostgreSQLでは日時の列、SQLiteではUNIX時間）。
+    """
+    table = Transaction.__table__
+    value = func.coalesce(table.c.value, 0.0)
+
+    def ranged(query: Select) -> Select:
+        if start_datetime:
+            query = query.where(table.c.timestamp >= start_datetime)
+        if end_datetime:
+            query = query.where(table.c.timestamp <= end_datetime)
+        return query
+
+    sent = ranged(select(
+        table.c.from_address_id.label("address_id"),
+        timestamp.label("timestamp"),
+        literal(0.0).label("inflow"),
+        value.label("outflow"),
+        literal(1).label("count"),
+    ).where(table.c.from_address_id.in_(address_ids)))
+    received = ranged(select(
+        table.c.to_address_id.label("address_id"),
+        timestamp.label("timestamp"),
+        value.label("inflow"),
+        literal(0.0).label("outflow"),
+        # 自分宛の送金は送信側で数えているため、件数に含めない
+        case((table.c.from_address_id == table.c.to_address_id, 0), else_=1).label("count"),
+    ).where(table.c.to_address_id.in_(address_ids)))
+    return union_all(sent, received)
+
+
+def _aggregate_in_database(db: Session, flows: Select,
+                           bucket: str) -> Dict[int, List[schemas.TimeSeriesPoint]]:
+    """
+    PostgreSQL: date_truncで単位ごとにGROUP BYする
+    """
+    flows = flows.subquery()
+    # 単位をバインドパラメータにすると、SELECTとGROUP BYの式が別のものとして扱われるため、検証済みの値を埋め込む
+    bucket_start = func.date_trunc(literal_column(f"'{bucket}'"), flows.c.timestamp).label("bucket")
+    query = (
+        select(
+            flows.c.address_id,
+            bucket_start,
+            func.sum(flows.c.inflow).label("inflow"),
+            func.sum(flows.c.outflow).label("outflow"),
+            func.sum(flows.c.count).label("count"),
+        )
+        .group_by(flows.c.address_id, bucket_start)
+        .order_by(flows.c.address_id, bucket_start)
+    )
+    series: Dict[int, List[schemas.TimeSeriesPoint]] = defaultdict(list)
+    for row in db.execute(query):
+        series[row.address_id].append(_point(row.bucket, row.inflow, row.outflow, row.count))
+    return series
+
+
+def _aggregate_in_memory(db: Session, flows: Select,
+                         bucket: str) -> Dict[int, List[schemas.TimeSeriesPoint]]:
+    """
+    SQLite: 列ごとの配列として読み出し、(アドレスID, 単位の番号) の組ごとに合計する
+    """
+    rows = db.execute(flows).fetchall()
+    if not rows:
+        return {}
+    if np is None:
+        return _aggregate_rows(rows, bucket)
+
+    # 行を列ごとの配列に変換する（Pythonのオブジェクトを列ごとに作り直さず、1回の走査で埋める）
+    columns = np.fromiter(map(tuple, rows), dtype=_FLOW_DTYPE, count=len(rows))
+    numbers = _bucket_numbers(columns["seconds"], bucket)
+    # 組を1つの整数のキーにまとめて番号を振る（単位の番号は32ビットに収まる）
+    keys = (columns["address_id"] << 32) | numbers
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    inflow_sums = np.bincount(inverse, weights=columns["inflow"])
+    outflow_sums = np.bincount(inverse, weights=columns["outflow"])
+    count_sums = np.bincount(inverse, weights=columns["count"])
+
+    series: Dict[int, List[schemas.TimeSeriesPoint]] = defaultdict(list)
+    # np.uniqueの結果はキーの順（アドレスID、日時の順）に並んでいる
+    starts = (_bucket_start_seconds(unique_keys & 0xFFFFFFFF, bucket)).astype("datetime64[s]").astype(datetime)
+    for address_id, start, inflow, outflow, count in zip(
+        (unique_keys >> 32).tolist(), starts, inflow_sums.tolist(), outflow_sums.tolist(), count_sums.tolist()
+    ):
+        series[address_id].append(_point(start, inflow, outflow, int(count)))
+    return series
+
+
+def _bucket_numbers(seconds: Any, bucket: str) -> Any:
+    """
+    UNIX時間を1970-01-01からの単位の番号に変換する（整数とnumpyの配列のどちらにも使用できる）
+    """
+    if bucket == "hour":
+        return seconds // _HOUR
+    if bucket == "week":
+        # 月曜日始まりの週に揃える（1970-01-01は木曜日）
+        return (seconds // _DAY + _EPOCH_MONDAY_OFFSET) // 7
+    return seconds // _DAY
+
+
+def _bucket_start_seconds(numbers: Any, bucket: str) -> Any:
+    """
+    単位の番号をその単位の開始日時のUNIX時間に変換する
+    """
+    if bucket == "hour":
+        return numbers * _HOUR
+    if bucket == "week":
+        return (numbers * 7 - _EPOCH_MONDAY_OFFSET) * _DAY
+    return numbers * _DAY
+
+
+def _aggregate_rows(rows: Iterable[Any], bucket: str) -> Dict[int, List[schemas.TimeSeriesPoint]]:
+    """
+    numpyがない場合の集計（_aggregate_in_memoryと同じ結果）
+    """
+    totals: Dict[Any, List[Any]] = {}
+    for address_id, second, inflow, outflow, count in rows:
+        total = totals.setdefault((address_id, _bucket_numbers(second, bucket)), [0.0, 0.0, 0])
+        total[0] += inflow
+        total[1] += outflow
+        total[2] += count
+
+    series: Dict[int, List[schemas.TimeSeriesPoint]] = defaultdict(list)
+    for (address_id, number), (inflow, outflow, count) in sorted(totals.items()):
+        start = datetime.utcfromtimestamp(_bucket_start_seconds(number, bucket))
+        series[address_id].append(_point(start, inflow, outflow, count))
+    return series
+
+
+def _point(timestamp: datetime, inflow: float, outflow: float, count: int) -> schemas.TimeSeriesPoint:
+    return schemas.TimeSeriesPoint.construct(
+        timestamp=timestamp,
+        inflow=inflow,
+        outflow=outflow,
+        net=inflow - outflow,
+        count=count,
+    )
@@ -1,4 +1,4 @@
 from .database import Base, engine, SessionLocal
-from .models import Transaction
+from .models import Address, Transaction, AddressSyncRange, AddressSyncState, RateLimitBucket, CrawlJob
 
-__all__ = ['Base', 'engine', 'SessionLocal', 'Transaction']
+__all__ = ['Base', 'engine', 'SessionLocal', 'Address', 'Transaction', 'AddressSyncRange', 'AddressSyncState', 'RateLimitBucket', 'CrawlJob']
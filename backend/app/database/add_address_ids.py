@@ -0,0 +1,128 @@
+from sqlalchemy import create_engine, inspect
+import sys
+import os
+
+# 親ディレクトリをパスに追加して、appモジュールをインポートできるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.database.database import DATABASE_URL
+from app.database.models import Address
+
+# app.blockchain.addresses.normalize_address と同じ規則のSQL式
+# （Ethereumと、BitcoinのBech32アドレスは小文字に揃える）
+NORMALIZED = """
+    CASE WHEN {blockchain} = 'ethereum' OR lower(left({address}, 3)) = 'bc1'
+         THEN lower({address}) ELSE {address} END
+"""
+
+
+def normalized(address: str, blockchain: str = "blockchain") -> str:
+    return NORMALIZED.format(blockchain=blockchain, address=address)
+
+
+def add_address_ids():
+    """
+    transactionsのアドレス文字列を、addressesテーブルの整数IDに置き換えるマイグレーションスクリプト
+
+    1. addressesテーブルを作成し、既存のアドレスを正規化して登録する
+    2. from_address_id / to_address_id 列を追加して値を埋める
+    3. 正規化によって重複した行を fetch_depth の最大値に寄せて1行にまとめる
+    4. 文字列の列と、それを使う一意制約・インデックスを削除し、ID列で作り直す
+
+    取得済み期間（address_sync_ranges / address_sync_states）は正規化前のアドレスで記録されているため削除する。
+    各アドレスの初回アクセス時に一度だけ上流APIから再取得される（重複行は一意キーにより保存されない）。
+    """
+    print("データベースに接続中...")
+    engine = create_engine(DATABASE_URL)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("transactions")}
+    if "from_address_id" in columns and "from_address" not in columns:
+        print("アドレスIDへの移行は既に完了しています")
+        print("マイグレーション完了")
+        return
+
+    Address.__table__.create(bind=engine, checkfirst=True)
+
+    with engine.begin() as conn:
+        print("アドレスを登録中...")
+        conn.execute(f"""
+            INSERT INTO addresses (blockchain, address)
+            SELECT blockchain, {normalized('from_address')} FROM transactions
+            UNION
+            SELECT blockchain, {normalized('to_address')} FROM transactions
+            ON CONFLICT (blockchain, address) DO NOTHING
+        """)
+
+        print("アドレスID列を追加中...")
+        conn.execute("""
+            ALTER TABLE transactions
+            ADD COLUMN IF NOT EXISTS from_address_id INTEGER,
+            ADD COLUMN IF NOT EXISTS to_address_id INTEGER
+        """)
+        conn.execute(f"""
+            UPDATE transactions AS t
+            SET from_address_id = f.id, to_address_id = r.id
+            FROM addresses AS f, addresses AS r
+            WHERE f.blockchain = t.blockchain AND f.address = {normalized('t.from_address', 't.blockchain')}
+              AND r.blockchain = t.blockchain AND r.address = {normalized('t.to_address', 't.blockchain')}
+        """)
+
+        print("正規化により重複したトランザクションをまとめています...")
+        conn.execute("""
+            UPDATE transactions AS t
+            SET fetch_depth = d.max_depth
+            FROM (
+                SELECT MIN(id) AS keep_id, MAX(fetch_depth) AS max_depth
+                FROM transactions
+                GROUP BY blockchain, txid, from_address_id, to_address_id, value
+                HAVING COUNT(*) > 1
+            ) AS d
+            WHERE t.id = d.keep_id
+        """)
+        result = conn.execute("""
+            DELETE FROM transactions AS t
+            USING transactions AS k
+            WHERE t.blockchain = k.blockchain
+              AND t.txid = k.txid
+              AND t.from_address_id = k.from_address_id
+              AND t.to_address_id = k.to_address_id
+              AND t.value = k.value
+              AND t.id > k.id
+        """)
+        print(f"{result.rowcount}件の重複を削除しました")
+
+        print("文字列のアドレス列を削除中...")
+        conn.execute("ALTER TABLE transactions DROP CONSTRAINT IF EXISTS uq_transactions_identity")
+        conn.execute("DROP INDEX IF EXISTS ix_transactions_from_time")
+        conn.execute("DROP INDEX IF EXISTS ix_transactions_to_time")
+        # from_address / to_address の単一列インデックスは列とともに削除される
+        conn.execute("ALTER TABLE transactions DROP COLUMN from_address, DROP COLUMN to_address")
+
+        print("一意制約と外部キーを追加中...")
+        conn.execute("""
+            ALTER TABLE transactions
+            ALTER COLUMN from_address_id SET NOT NULL,
+            ALTER COLUMN to_address_id SET NOT NULL,
+            ADD FOREIGN KEY (from_address_id) REFERENCES addresses (id),
+            ADD FOREIGN KEY (to_address_id) REFERENCES addresses (id),
+            ADD CONSTRAINT uq_transactions_identity
+                UNIQUE (blockchain, txid, from_address_id, to_address_id, value)
+        """)
+
+        print("複合インデックスを作成中...")
+        conn.execute("CREATE INDEX ix_transactions_from_time ON transactions (from_address_id, timestamp)")
+        conn.execute("CREATE INDEX ix_transactions_to_time ON transactions (to_address_id, timestamp)")
+
+        print("取得済み期間の記録を削除中...")
+        conn.execute("DELETE FROM address_sync_ranges")
+        conn.execute("DELETE FROM address_sync_states")
+
+    with engine.connect() as conn:
+        conn.execute("ANALYZE transactions")
+        conn.execute("ANALYZE addresses")
+
+    print("マイグレーション完了")
+
+
+if __name__ == "__main__":
+    add_address_ids()
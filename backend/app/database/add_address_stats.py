@@ -0,0 +1,42 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+# 親ディレクトリをパスに追加して、appモジュールをインポートできるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.database.database import DATABASE_URL
+from app.database.models import AddressCounterparty, AddressStats
+from app.blockchain.stats import rebuild_address_stats
+
+
+def add_address_stats():
+    """
+    address_stats / address_counterparties テーブルを作成し、保存済みのトランザクション全体から
+    集計を作り直すマイグレーションスクリプト
+
+    集計テーブルの追加前に保存されたトランザクションを取り込むために使用する。
+    集計は保存時に差分で更新されるため、作り直しの途中に保存された行を二重に数えないよう、
+    サーバーを停止してから実行すること。
+    """
+    print("データベースに接続中...")
+    engine = create_engine(DATABASE_URL)
+
+    print("集計テーブルを作成中...")
+    AddressStats.__table__.create(bind=engine, checkfirst=True)
+    AddressCounterparty.__table__.create(bind=engine, checkfirst=True)
+
+    print("保存済みのトランザクションから集計を作り直し中...")
+    db = sessionmaker(bind=engine)()
+    try:
+        rebuilt = rebuild_address_stats(db)
+    finally:
+        db.close()
+    print(f"{rebuilt}件のアドレスの集計を作成しました")
+
+    print("マイグレーション完了")
+
+
+if __name__ == "__main__":
+    add_address_stats()
@@ -0,0 +1,106 @@
+from sqlalchemy import create_engine, inspect, text
+from typing import List, Optional
+import sys
+import os
+
+# 親ディレクトリをパスに追加して、appモジュールをインポートできるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.database.database import DATABASE_URL
+
+# (インデックス名, 列)（models.Transactionの__table_args__と同じ定義）
+COMPOSITE_INDEXES = [
+    ("ix_transactions_from_time", "from_address_id, timestamp"),
+    ("ix_transactions_to_time", "to_address_id, timestamp"),
+]
+
+# cached_transactions_query と同じ形のクエリ（UNION ALLの各枝がインデックスを使うことを確認する）
+# アドレス文字列はaddressesテーブルの一意制約で引き、アドレスIDで範囲スキャンする
+EXPLAIN_QUERY = """
+    SELECT t.* FROM transactions t
+    JOIN addresses a ON a.id = t.from_address_id
+    WHERE a.blockchain = :blockchain AND a.address = :address AND t.timestamp >= :start
+    UNION ALL
+    SELECT t.* FROM transactions t
+    JOIN addresses a ON a.id = t.to_address_id
+    WHERE a.blockchain = :blockchain AND a.address = :address AND t.from_address_id != a.id
+      AND t.timestamp >= :start
+"""
+
+
+def add_composite_indexes():
+    """
+    既存のtransactionsテーブルに (from_address_id, timestamp) と
+    (to_address_id, timestamp) の複合インデックスを追加するマイグレーションスクリプト
+    （add_address_ids.pyを適用済みのテーブルが対象）
+
+    稼働中のテーブルをロックしないよう CREATE INDEX CONCURRENTLY を使用する。
+    """
+    print("データベースに接続中...")
+    # CONCURRENTLYはトランザクション内で実行できないため、自動コミットで接続する
+    engine = create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT")
+
+    existing = {index["name"] for index in inspect(engine).get_indexes("transactions")}
+
+    with engine.connect() as conn:
+        for name, columns in COMPOSITE_INDEXES:
+            if name in existing:
+                print(f"{name}インデックスは既に存在します")
+                continue
+            print(f"{name}インデックスを作成中...")
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY {name} ON transactions ({columns})"))
+            print(f"{name}インデックスが正常に作成されました")
+
+        conn.execute(text("ANALYZE transactions"))
+
+    verify_index_usage(engine)
+    print("マイグレーション完了")
+
+
+def explain(conn, query: str, params: dict) -> str:
+    """
+    クエリの実行計画を文字列で返す（SQLiteではEXPLAIN QUERY PLAN、それ以外ではEXPLAINを使用）
+    """
+    if conn.dialect.name == "sqlite":
+        # 各行の最後の列が計画の説明（例: "SEARCH t USING INDEX ix_transactions_from_time ..."）
+        return "\n".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {query}"), params))
+    return "\n".join(row[0] for row in conn.execute(text(f"EXPLAIN {query}"), params))
+
+
+def verify_index_usage(engine, blockchain: str = "ethereum", address: str = None) -> Optional[List[str]]:
+    """
+    実行計画で、アドレス検索の各枝が複合インデックスを使用しているか確認する
+
+    使用されていないインデックス名のリストを返す（トランザクションがなく確認できない場合はNone）。
+    """
+    with engine.connect() as conn:
+        if address is None:
+            row = conn.execute(
+                text("""
+                    SELECT a.address FROM transactions t
+                    JOIN addresses a ON a.id = t.from_address_id
+                    WHERE a.blockchain = :blockchain LIMIT 1
+                """),
+                {"blockchain": blockchain},
+            ).first()
+            if row is None:
+                print(f"{blockchain}のトランザクションがないため、実行計画の確認をスキップします")
+                return None
+            address = row.address
+
+        plan = explain(conn, EXPLAIN_QUERY, {"blockchain": blockchain, "address": address, "start": "2009-01-01"})
+
+    print("実行計画:")
+    print(plan)
+    unused = []
+    for name, _ in COMPOSITE_INDEXES:
+        if name in plan:
+            print(f"OK: {name}が使用されています")
+        else:
+            unused.append(name)
+            print(f"WARNING: {name}が使用されていません（データ量が少ない場合はシーケンシャルスキャンが選ばれることがあります）")
+    return unused
+
+
+if __name__ == "__main__":
+    add_composite_indexes()
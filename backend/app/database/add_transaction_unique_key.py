@@ -0,0 +1,70 @@
+from sqlalchemy import create_engine, inspect
+import sys
+import os
+
+# 親ディレクトリをパスに追加して、appモジュールをインポートできるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.database.database import DATABASE_URL
+
+CONSTRAINT_NAME = "uq_transactions_identity"
+
+
+def add_transaction_unique_key():
+    """
+    既存のtransactionsテーブルに (blockchain, txid, from_address, to_address, value) の
+    一意制約を追加するマイグレーションスクリプト
+
+    制約を追加する前に、同じキーを持つ重複行を fetch_depth の最大値に寄せて1行にまとめる。
+    """
+    print("データベースに接続中...")
+    engine = create_engine(DATABASE_URL)
+
+    inspector = inspect(engine)
+    constraints = [c["name"] for c in inspector.get_unique_constraints("transactions")]
+
+    if CONSTRAINT_NAME in constraints:
+        print(f"{CONSTRAINT_NAME}制約は既に存在します")
+        print("マイグレーション完了")
+        return
+
+    with engine.begin() as conn:
+        print("重複したトランザクションの深度をまとめています...")
+        conn.execute("""
+            UPDATE transactions AS t
+            SET fetch_depth = d.max_depth
+            FROM (
+                SELECT MIN(id) AS keep_id, MAX(fetch_depth) AS max_depth
+                FROM transactions
+                GROUP BY blockchain, txid, from_address, to_address, value
+                HAVING COUNT(*) > 1
+            ) AS d
+            WHERE t.id = d.keep_id
+        """)
+
+        print("重複したトランザクションを削除中...")
+        result = conn.execute("""
+            DELETE FROM transactions AS t
+            USING transactions AS k
+            WHERE t.blockchain = k.blockchain
+              AND t.txid = k.txid
+              AND t.from_address = k.from_address
+              AND t.to_address = k.to_address
+              AND t.value = k.value
+              AND t.id > k.id
+        """)
+        print(f"{result.rowcount}件の重複を削除しました")
+
+        print(f"{CONSTRAINT_NAME}制約を追加中...")
+        conn.execute(f"""
+            ALTER TABLE transactions
+            ADD CONSTRAINT {CONSTRAINT_NAME}
+            UNIQUE (blockchain, txid, from_address, to_address, value)
+        """)
+        print(f"{CONSTRAINT_NAME}制約が正常に追加されました")
+
+    print("マイグレーション完了")
+
+
+if __name__ == "__main__":
+    add_transaction_unique_key()
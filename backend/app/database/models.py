@@ -1,17 +1,44 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Index, Text, UniqueConstraint
 
 from .database import Base
 
 
+class Address(Base):
+    """
+    正規化済みアドレスと整数IDの対応表
+    （transactionsはアドレス文字列の代わりにこのIDを参照する）
+    """
+    __tablename__ = "addresses"
+    __table_args__ = (
+        UniqueConstraint("blockchain", "address", name="uq_addresses_address"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    blockchain = Column(String, nullable=False)
+    # ブロックチェーンごとに正規化したアドレス（app.blockchain.addresses.normalize_address）
+    address = Column(String, nullable=False)
+
+
 class Transaction(Base):
     __tablename__ = "transactions"
+    # 同一トランザクションの重複保存を防ぐための一意キー（一括upsertの衝突判定に使用）
+    __table_args__ = (
+        UniqueConstraint(
+            "blockchain", "txid", "from_address_id", "to_address_id", "value",
+            name="uq_transactions_identity",
+        ),
+        # アドレスと期間で絞り込むための複合インデックス（送信元・送信先それぞれの範囲スキャン用）
+        # アドレスIDはブロックチェーンごとに異なるため、blockchain列は含めない
+        Index("ix_transactions_from_time", "from_address_id", "timestamp"),
+        Index("ix_transactions_to_time", "to_address_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     blockchain = Column(String, index=True)
     # txidは被る可能性あり。なぜかと言うと、UTXOだと同じtxで、transaction inputとoutputがあるため。
     txid = Column(String, index=True)
-    from_address = Column(String, index=True)
-    to_address = Column(String, index=True)
+    from_address_id = Column(Integer, ForeignKey("addresses.id"), nullable=False)
+    to_address_id = Column(Integer, ForeignKey("addresses.id"), nullable=False)
     value = Column(Float)
     timestamp = Column(DateTime, index=True)
     block_number = Column(Integer)
@@ -22,3 +49,108 @@ class Transaction(Base):
     contract_address = Column(String, index=True, nullable=True)
     contract_method = Column(String, nullable=True)
     contract_input_data = Column(String, nullable=True)
+
+
+class AddressStats(Base):
+    """
+    アドレスごとの保存済みトランザクションの集計
+    （save_transactions_to_dbで新たに保存した行の分だけ、同じトランザクション内で加算する）
+    """
+    __tablename__ = "address_stats"
+
+    address_id = Column(Integer, ForeignKey("addresses.id"), primary_key=True)
+    in_count = Column(Integer, nullable=False, default=0)
+    out_count = Column(Integer, nullable=False, default=0)
+    in_volume = Column(Float, nullable=False, default=0.0)
+    out_volume = Column(Float, nullable=False, default=0.0)
+    # 取引相手の数（自分自身への送金は含めない）
+    counterparties = Column(Integer, nullable=False, default=0)
+    first_seen = Column(DateTime, nullable=True)
+    last_seen = Column(DateTime, nullable=True)
+    # 1回の取引の最大金額（送金・受取の両方）
+    max_transfer = Column(Float, nullable=False, default=0.0)
+
+
+class AddressCounterparty(Base):
+    """
+    アドレスと取引相手の組（address_statsの取引相手の数を差分で更新するために使用）
+    """
+    __tablename__ = "address_counterparties"
+
+    address_id = Column(Integer, ForeignKey("addresses.id"), primary_key=True)
+    counterparty_id = Column(Integer, ForeignKey("addresses.id"), primary_key=True)
+
+
+class AddressSyncRange(Base):
+    """
+    アドレスごとに上流APIから取得済みの期間を記録するテーブル
+    （この期間内のトランザクションはDBに全て保存済みとみなす）
+    """
+    __tablename__ = "address_sync_ranges"
+    __table_args__ = (
+        Index("ix_address_sync_ranges_lookup", "blockchain", "address", "range_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    blockchain = Column(String, nullable=False)
+    address = Column(String, nullable=False)
+    range_start = Column(DateTime, nullable=False)
+    range_end = Column(DateTime, nullable=False)
+    synced_at = Column(DateTime, nullable=False)
+
+
+class AddressSyncState(Base):
+    """
+    アドレスごとの同期済みブロックの最高値（ハイウォーターマーク）
+    （ジェネシスからlast_synced_blockまでのトランザクションはDBに保存済み）
+    """
+    __tablename__ = "address_sync_states"
+    __table_args__ = (
+        UniqueConstraint("blockchain", "address", name="uq_address_sync_states_address"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    blockchain = Column(String, nullable=False)
+    address = Column(String, nullable=False)
+    last_synced_block = Column(Integer, nullable=False)
+    # last_synced_blockに対応する日時（この日時以降の取得はlast_synced_block + 1から開始できる）
+    synced_until = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class RateLimitBucket(Base):
+    """
+    上流APIごとのトークンバケットの状態（uvicornワーカー間で共有）
+    """
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # 最終更新時刻（UNIX時間）
+    updated_at = Column(Float, nullable=False)
+
+
+class CrawlJob(Base):
+    """
+    非同期で実行するネットワーク構築ジョブ
+    （パラメータと進捗をDBに保存し、サーバーの再起動後に再開できるようにする）
+    """
+    __tablename__ = "crawl_jobs"
+
+    id = Column(String, primary_key=True)
+    blockchain = Column(String, nullable=False)
+    address = Column(String, nullable=False)
+    # build_transaction_networkに渡すパラメータ（JSON）
+    params = Column(Text, nullable=False)
+    # "queued", "running", "completed", "failed"
+    status = Column(String, nullable=False, index=True)
+    # 進捗（取得を終えたアドレス数・残りのアドレス数・上流APIから取得したアドレス数）
+    addresses_done = Column(Integer, nullable=False, default=0)
+    addresses_remaining = Column(Integer, nullable=False, default=0)
+    upstream_calls = Column(Integer, nullable=False, default=0)
+    # 途中結果または最終結果のネットワーク（JSON）
+    result = Column(Text, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    # 実行中のジョブは進捗のたびに更新する（止まったジョブの検出に使用）
+    updated_at = Column(DateTime, nullable=False)
@@ -0,0 +1,23 @@
+from .analytics import ANALYTICS_WEIGHTS, analytics_available, analyze_network
+from .builder import build_transaction_network, fetch_frontier, iter_transaction_network
+from .budget import RANK_MODES, TraversalBudget
+from .cache import NetworkCache, network_cache
+from .explore import ExplorationStore, expand_network_node, exploration_sessions
+from .jobs import CrawlJobManager
+from .paths import PATH_RANK_MODES, find_transaction_paths
+from .streaming import NDJSON_MEDIA_TYPE, stream_network, stream_network_levels, stream_transactions
+from ..blockchain.base import BlockchainService
+
+# トランザクションが保存されたら、そのアドレス（正規化済み）を含むキャッシュ済みネットワークを無効化する
+BlockchainService.add_save_listener(network_cache.invalidate_addresses)
+# 探索セッションでは、そのアドレスを未展開に戻す（次の展開で新しいトランザクションを返す）
+BlockchainService.add_save_listener(exploration_sessions.invalidate_addresses)
+
+__all__ = [
+    'ANALYTICS_WEIGHTS', 'analytics_available', 'analyze_network',
+    'build_transaction_network', 'fetch_frontier', 'iter_transaction_network',
+    'RANK_MODES', 'TraversalBudget', 'NetworkCache', 'network_cache', 'CrawlJobManager',
+    'ExplorationStore', 'expand_network_node', 'exploration_sessions',
+    'PATH_RANK_MODES', 'find_transaction_paths',
+    'NDJSON_MEDIA_TYPE', 'stream_network', 'stream_network_levels', 'stream_transactions',
+]
@@ -0,0 +1,292 @@
+import logging
+import os
+import time
+from itertools import repeat
+from operator import attrgetter
+from typing import Any, Dict, Tuple
+
+from .. import schemas
+
+try:
+    import numpy as np
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+except ImportError:  # numpy・scipyがない環境では分析を行わない（/network?analytics=true はエラーを返す）
+    np = None
+    sparse = None
+    connected_components = None
+
+logger = logging.getLogger(__name__)
+
+# リンクの重み（"value": 金額の合計, "count": トランザクション数）
+ANALYTICS_WEIGHTS = ("value", "count")
+
+# PageRankの設定
+PAGERANK_DAMPING = 0.85
+PAGERANK_MAX_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-8
+# 媒介中心性の近似に使用する起点の数（ノード数がこれ以下の場合は全ノードから求めた厳密な値）
+NETWORK_BETWEENNESS_SAMPLES = int(os.getenv("NETWORK_BETWEENNESS_SAMPLES", "32"))
+# コミュニティ検出（ラベル伝播）の最大反復回数
+LABEL_PROPAGATION_MAX_ITERATIONS = 20
+
+
+def analytics_available() -> bool:
+    return np is not None and sparse is not None
+
+
+def analyze_network(network: schemas.NetworkResponse, weight: str = "value",
+                    betweenness: bool = False) -> schemas.NetworkResponse:
+    """
+    ネットワークの各ノードの指標を計算し、ノードのmetricsに設定したネットワークを返す
+
+    Parameters:
+    - network: 構築済みのネットワーク（キャッシュと共有しているため変更せず、ノードをコピーして返す）
+    - weight: リンクの重み（"value": 金額, "count": トランザクション数。集約済みのリンクは件数を使用）
+    - betweenness: 媒介中心性を計算するかどうか（他の指標より桁違いに時間がかかるため、既定では計算せずNoneを設定）
+
+    グラフを送信元 -> 送信先の重み付き隣接行列（CSR）として1回だけ組み立て、すべての指標を疎行列の演算で求める。
+    - pagerank: 重み付きPageRank（送金先のない（出次数0の）ノードの値は全ノードに均等に配分）
+    - in_strength / out_strength: 受取・送金のリンクの重みの合計
+    - betweenness: 媒介中心性（向きのある最短ホップ数のパス。起点を抽出して求めた近似値を (n-1)(n-2) で正規化。
+      betweennessがTrueの場合のみ）
+    - component: 弱連結成分の番号（大きい順に0から）
+    - community: 重みを使ったラベル伝播によるコミュニティの番号（大きい順に0から）
+    """
+    if not analytics_available():
+        raise RuntimeError("Network analytics requires numpy and scipy")
+    if weight not in ANALYTICS_WEIGHTS:
+        raise ValueError(f"Unsupported analytics weight: {weight}")
+
+    started = time.perf_counter()
+    nodes = network.nodes
+    n = len(nodes)
+    if n == 0:
+        return network
+
+    adjacency = _adjacency_matrix(network, weight)
+    # 重みが0のリンク（金額0のトランザクションのみ）もつながりとして扱うため、重みを1にした行列を別に持つ
+    edges = adjacency.copy()
+    edges.data = np.ones_like(edges.data)
+    out_strength = np.asarray(adjacency.sum(axis=1)).ravel()
+    in_strength = np.asarray(adjacency.sum(axis=0)).ravel()
+    pagerank = _pagerank(adjacency, out_strength)
+    centralities = _betweenness(edges).tolist() if betweenness else [None] * n
+    _, components = connected_components(edges, directed=True, connection="weak")
+    communities = _label_propagation(adjacency)
+
+    metrics = zip(
+        pagerank.tolist(),
+        in_strength.tolist(),
+        out_strength.tolist(),
+        centralities,
+        _rank_by_size(components).tolist(),
+        _rank_by_size(communities).tolist(),
+    )
+    # 指標はNodeMetricsと同じ形のdictとして設定する（response_modelによる検証を行う場合はそこでモデルに変換される）
+    annotated = [
+        node.__class__.construct(**{
+            **node.__dict__,
+            "metrics": {
+                "pagerank": rank,
+                "in_strength": received,
+                "out_strength": sent,
+                "betweenness": centrality,
+                "component": component,
+                "community": community,
+            },
+        })
+        for node, (rank, received, sent, centrality, component, community) in zip(nodes, metrics)
+    ]
+    logger.info(
+        f"Analyzed network with {n} nodes and {adjacency.nnz} edges in {time.perf_counter() - started:.3f}s"
+    )
+    return network.copy(update={"nodes": annotated})
+
+
+def _adjacency_matrix(network: schemas.NetworkResponse, weight: str) -> Any:
+    """
+    送信元 -> 送信先の重み付き隣接行列（CSR）を作成する（同じ組の複数のリンクは合計する）
+    """
+    index: Dict[str, int] = {node.id: i for i, node in enumerate(network.nodes)}
+    links = network.links
+    count = len(links)
+    # リンクの属性の取り出しとIDの変換をPythonのループを書かずに行う（ネットワークにないノードは-1）
+    sources = np.fromiter(map(index.get, map(attrgetter("source"), links), repeat(-1)), dtype=np.int64, count=count)
+    targets = np.fromiter(map(index.get, map(attrgetter("target"), links), repeat(-1)), dtype=np.int64, count=count)
+    if weight == "value":
+        weights = np.fromiter(map(attrgetter("value"), links), dtype=np.float64, count=count)
+    elif network.aggregated:
+        weights = np.fromiter(map(attrgetter("count"), links), dtype=np.float64, count=count)
+    else:
+        weights = np.ones(count)
+    known = (sources >= 0) & (targets >= 0)
+    if not known.all():
+        sources, targets, weights = sources[known], targets[known], weights[known]
+    n = len(index)
+    adjacency = sparse.csr_matrix((weights, (sources, targets)), shape=(n, n))
+    adjacency.sum_duplicates()
+    return adjacency
+
+
+def _pagerank(adjacency: Any, out_strength: Any) -> Any:
+    """
+    べき乗法による重み付きPageRank（1回の反復は転置した遷移行列とベクトルの積1回）
+    """
+    n = adjacency.shape[0]
+    dangling = out_strength <= 0
+    inverse_strength = np.divide(1.0, out_strength, out=np.zeros(n), where=~dangling)
+    transition = adjacency.T.tocsr()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(PAGERANK_MAX_ITERATIONS):
+        spread = PAGERANK_DAMPING * (transition @ (rank * inverse_strength))
+        # 送金先のないノードの値とテレポートの分を全ノードに均等に配分する
+        spread += (PAGERANK_DAMPING * rank[dangling].sum() + 1.0 - PAGERANK_DAMPING) / n
+        converged = np.abs(spread - rank).sum() < PAGERANK_TOLERANCE
+        rank = spread
+        if converged:
+            break
+    return rank / rank.sum()
+
+
+def _betweenness(edges: Any) -> Any:
+    """
+    Brandesのアルゴリズムで媒介中心性を求める（リンクの向きに沿った最短ホップ数のパス）
+
+    抽出した起点をすべて行列の列として同時に扱い、BFSの1階層と依存度の逆伝播の1階層を
+    それぞれ疎行列の積1回で計算する。起点の抽出は固定のシードで行い、同じグラフには同じ値を返す。
+    """
+    n = edges.shape[0]
+    if n <= 2:
+        return np.zeros(n)
+    samples = min(n, max(1, NETWORK_BETWEENNESS_SAMPLES))
+    if samples == n:
+        sources = np.arange(n)
+    else:
+        sources = np.sort(np.random.default_rng(0).choice(n, size=samples, replace=False))
+    columns = np.arange(samples)
+
+    edges_t = edges.T.tocsr()
+
+    # sigma: 起点からの最短パスの数（(ノード, 起点) の組をノード x 起点の行列の1次元の添字で表す）
+    # levels: 起点からのホップ数ごとに、到達した組の添字
+    sigma = np.zeros(n * samples)
+    start = sources * samples + columns
+    sigma[start] = 1.0
+    visited = np.zeros(n * samples, dtype=bool)
+    visited[start] = True
+    levels = [start]
+    # 階層の組のみを持つ疎行列として扱い、1階層の計算量をその階層から出るリンクの数に比例させる
+    frontier = _sparse_columns(start, sigma[start], n, samples)
+    while True:
+        # 前の階層のノードから到達するパスの数を、送信先ごとに合計する
+        reached = (edges_t @ frontier).tocoo()
+        positions = reached.row.astype(np.int64) * samples + reached.col
+        unvisited = ~visited[positions]
+        new = positions[unvisited]
+        if new.size == 0:
+            break
+        visited[new] = True
+        sigma[new] = reached.data[unvisited]
+        frontier = _sparse_columns(new, sigma[new], n, samples)
+        levels.append(new)
+
+    # 遠い階層から順に、依存度 delta[v] += sigma[v] * Σ_(v->w) (1 + delta[w]) / sigma[w] を逆伝播する
+    delta = np.zeros(n * samples)
+    propagated = np.zeros(n * samples)
+    for level in range(len(levels) - 1, 0, -1):
+        current, previous = levels[level], levels[level - 1]
+        coefficient = _sparse_columns(current, (1.0 + delta[current]) / sigma[current], n, samples)
+        result = (edges @ coefficient).tocoo()
+        positions = result.row.astype(np.int64) * samples + result.col
+        propagated[positions] = result.data
+        delta[previous] += sigma[previous] * propagated[previous]
+        propagated[positions] = 0.0
+    delta[start] = 0.0
+    delta = delta.reshape(n, samples)
+
+    centrality = delta.sum(axis=1) * (n / samples)
+    return centrality / ((n - 1) * (n - 2))
+
+
+def _sparse_columns(positions: Any, values: Any, n: int, samples: int) -> Any:
+    """
+    ノード x 起点の行列の1次元の添字と値から、疎行列（CSR）を作成する
+    """
+    return sparse.csr_matrix((values, (positions // samples, positions % samples)), shape=(n, samples))
+
+
+def _label_propagation(adjacency: Any) -> Any:
+    """
+    重み付きラベル伝播によるコミュニティ検出（リンクの向きは区別しない）
+
+    各ノードは隣接ノードのラベルのうち重みの合計が最大のものを選ぶ（同点の場合は現在のラベル、次に小さいラベル）。
+    すべてのノードを同時に更新すると二部グラフ（ハブと葉など）で振動するため、反復ごとにノードを2つに分け、
+    半分ずつ更新する（分け方は固定のシードで決め、同じグラフには同じ結果を返す）。
+    """
+    n = adjacency.shape[0]
+    # 重みが0のリンクは、行列の和で取り除かれないよう最小の重みを持たせる
+    weighted = adjacency.copy()
+    weighted.data = np.maximum(weighted.data, np.finfo(np.float64).tiny)
+    undirected = (weighted + weighted.T).tocoo()
+    keep = undirected.row != undirected.col
+    rows = undirected.row[keep].astype(np.int64)
+    cols = undirected.col[keep].astype(np.int64)
+    weights = undirected.data[keep]
+
+    labels = np.arange(n, dtype=np.int64)
+    if rows.size == 0:
+        return labels
+    random = np.random.default_rng(0)
+    for _ in range(LABEL_PROPAGATION_MAX_ITERATIONS):
+        # 分け方を反復ごとに変え、同じノードの組が入れ替わり続けるのを防ぐ
+        halves = random.integers(0, 2, size=n).astype(bool)
+        changed = False
+        for half in (halves, ~halves):
+            selected = half[rows]
+            nodes, best = _best_labels(rows[selected], cols[selected], weights[selected], labels, n)
+            update = labels[nodes] != best
+            if update.any():
+                labels[nodes[update]] = best[update]
+                changed = True
+        if not changed:
+            break
+    return labels
+
+
+def _best_labels(rows: Any, cols: Any, weights: Any, labels: Any, n: int) -> Tuple[Any, Any]:
+    """
+    ノードごとに、隣接ノードのラベルの重みの合計が最大のラベルを返す（rowsに含まれるノードのみ）
+    """
+    # ノード x ラベルの行列を作ると、(ノード, ラベル) の組ごとの合計が得られ、各行のラベルは昇順に並ぶ
+    scores = sparse.csr_matrix((weights, (rows, labels[cols])), shape=(n, n))
+    scores.sum_duplicates()
+    counts = np.diff(scores.indptr)
+    nodes = np.flatnonzero(counts)
+    owners = np.repeat(np.arange(n), counts)
+    row_max = np.maximum.reduceat(scores.data, scores.indptr[nodes])
+    maximal = scores.data >= np.repeat(row_max, counts[nodes])
+
+    # 最大のラベルのうち、現在のラベルがあればそれを、なければ最も小さいラベル（行の最初の候補）を選ぶ
+    positions = np.flatnonzero(maximal)
+    first = np.ones(positions.size, dtype=bool)
+    first[1:] = owners[positions[1:]] != owners[positions[:-1]]
+    best = scores.indices[positions[first]].astype(np.int64)
+    current = positions[scores.indices[positions] == labels[owners[positions]]]
+    keep = np.zeros(n, dtype=bool)
+    keep[owners[current]] = True
+    best = np.where(keep[nodes], labels[nodes], best)
+    return nodes, best
+
+
+def _rank_by_size(labels: Any) -> Any:
+    """
+    ラベルを大きさの降順（同じ大きさの場合は最初に現れる順）に0から番号を振り直す
+    """
+    unique_labels, first_index, inverse, sizes = np.unique(
+        labels, return_index=True, return_inverse=True, return_counts=True
+    )
+    order = np.lexsort((first_index, -sizes))
+    ranks = np.empty(unique_labels.size, dtype=np.int64)
+    ranks[order] = np.arange(unique_labels.size)
+    return ranks[inverse.ravel()]
@@ -0,0 +1,76 @@
+import os
+from typing import List, Optional
+
+# 探索の予算の既定値（リクエストで指定されなかった場合に使用、0は上限なし）
+NETWORK_MAX_NODES = int(os.getenv("NETWORK_MAX_NODES", "0"))
+NETWORK_MAX_UPSTREAM_CALLS = int(os.getenv("NETWORK_MAX_UPSTREAM_CALLS", "0"))
+NETWORK_MAX_DEGREE = int(os.getenv("NETWORK_MAX_DEGREE", "0"))
+
+# フロンティアの優先順位の付け方
+# - "value": 接続するトランザクションの合計金額が大きい順
+# - "recency": 接続するトランザクションの日時が新しい順
+RANK_MODES = ("value", "recency")
+
+# 打ち切りの理由
+TRUNCATED_MAX_NODES = "max_nodes"
+TRUNCATED_MAX_UPSTREAM_CALLS = "max_upstream_calls"
+TRUNCATED_MAX_DEGREE = "max_degree_per_node"
+
+
+def _limit(value: Optional[int], default: int) -> Optional[int]:
+    """
+    リクエストで指定された上限、なければ既定値を返す（既定値が0の場合は上限なしとしてNone）
+    """
+    if value is not None:
+        return value
+    return default or None
+
+
+class TraversalBudget:
+    """
+    ネットワーク探索の予算
+
+    - max_nodes: ネットワークに含めるノード数の上限（Noneは上限なし）
+    - max_upstream_calls: 上流APIから取得するアドレス数の上限（取得済み期間のアドレスは数えない、Noneは上限なし）
+    - max_degree_per_node: これより多くの相手と取引したアドレスはハブとして展開しない（Noneは上限なし）
+
+    予算によって探索を打ち切った場合は、その理由をreasonsに記録する。
+    リクエストで指定されず、環境変数の既定値も0の上限はNone（上限なし）になる。
+    """
+    def __init__(self, max_nodes: Optional[int] = None,
+                 max_upstream_calls: Optional[int] = None,
+                 max_degree_per_node: Optional[int] = None,
+                 rank_by: str = "value"):
+        if rank_by not in RANK_MODES:
+            raise ValueError(f"Unsupported rank mode: {rank_by}")
+        self.max_nodes = _limit(max_nodes, NETWORK_MAX_NODES)
+        self.max_upstream_calls = _limit(max_upstream_calls, NETWORK_MAX_UPSTREAM_CALLS)
+        self.max_degree_per_node = _limit(max_degree_per_node, NETWORK_MAX_DEGREE)
+        self.rank_by = rank_by
+        self.upstream_calls = 0
+        self.reasons: List[str] = []
+
+    def key(self) -> tuple:
+        """
+        キャッシュキーに含める値
+        """
+        return (self.max_nodes, self.max_upstream_calls, self.max_degree_per_node, self.rank_by)
+
+    def truncate(self, reason: str) -> None:
+        if reason not in self.reasons:
+            self.reasons.append(reason)
+
+    def take_upstream_calls(self, addresses: List[str]) -> List[str]:
+        """
+        残りの予算の範囲で上流APIから取得するアドレスを先頭から選ぶ
+        （addressesは優先順位の高い順に並んでいること）
+        """
+        if self.max_upstream_calls is None:
+            self.upstream_calls += len(addresses)
+            return addresses
+        remaining = max(0, self.max_upstream_calls - self.upstream_calls)
+        if len(addresses) > remaining:
+            self.truncate(TRUNCATED_MAX_UPSTREAM_CALLS)
+            addresses = addresses[:remaining]
+        self.upstream_calls += len(addresses)
+        return addresses
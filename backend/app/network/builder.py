@@ -0,0 +1,856 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from .. import schemas
+from ..schemas import NetworkResponse
+from ..api.scheduler import PRIORITY_NETWORK, request_priority
+from ..blockchain.addresses import address_registry
+from ..blockchain.base import BlockchainService
+from ..blockchain.coverage import find_unsynced_addresses
+from ..blockchain.filters import TransactionFilter
+from .budget import (
+    TRUNCATED_MAX_DEGREE,
+    TRUNCATED_MAX_NODES,
+    TraversalBudget,
+)
+from .cache import network_cache
+from .traversal import query_edge_aggregates, query_neighbourhood
+
+logger = logging.getLogger(__name__)
+
+# 上流APIごとの同時リクエスト数の上限
+# （BlockCypher: 3 calls/second, Etherscan: 5 calls/second の無料枠に合わせた初期値）
+FETCH_CONCURRENCY: Dict[str, int] = {
+    "bitcoin": int(os.getenv("BITCOIN_FETCH_CONCURRENCY", "3")),
+    "ethereum": int(os.getenv("ETHEREUM_FETCH_CONCURRENCY", "5")),
+}
+
+# 同一プロセス内の全リクエストで共有するセマフォ（上流ごとに同時実行数を制限）
+_upstream_semaphores: Dict[str, BoundedSemaphore] = {
+    blockchain: BoundedSemaphore(max(1, limit))
+    for blockchain, limit in FETCH_CONCURRENCY.items()
+}
+
+
+def _get_semaphore(blockchain: str) -> BoundedSemaphore:
+    if blockchain not in _upstream_semaphores:
+        _upstream_semaphores[blockchain] = BoundedSemaphore(1)
+    return _upstream_semaphores[blockchain]
+
+
+def fetch_frontier(blockchain_service: BlockchainService, addresses: List[str],
+                   session_factory: Callable[[], Session],
+                   start_datetime: Optional[datetime] = None,
+                   end_datetime: Optional[datetime] = None,
+                   depth: Optional[int] = None,
+                   on_fetched: Optional[Callable[[str], None]] = None,
+                   filters: Optional[TransactionFilter] = None) -> List[Optional[List[schemas.Transaction]]]:
+    """
+    BFSの1階層分のアドレスのトランザクションを並行して取得
+
+    Parameters:
+    - blockchain_service: 取得に使用するブロックチェーンサービス
+    - addresses: 取得対象のアドレス一覧
+    - session_factory: ワーカーごとのデータベースセッションを生成する関数
+    - start_datetime: 開始日時
+    - end_datetime: 終了日時
+    - depth: ネットワーク探索の深さ（キャッシュ判断に使用）
+    - on_fetched: 各アドレスの取得が終わるたびに（失敗した場合も）呼び出される関数
+    - filters: 返すトランザクションの絞り込み条件（保存はすべての行に対して行い、読み出しをSQLで絞り込む）
+
+    サービスのFETCH_BATCH_SIZEが2以上の場合は、その件数ずつget_transactions_manyでまとめて取得する。
+    戻り値は addresses と同じ順序のリスト。取得に失敗したアドレスは None になる。
+    """
+    if not addresses:
+        return []
+
+    blockchain = blockchain_service.blockchain_name
+    semaphore = _get_semaphore(blockchain)
+
+    def fetch(address: str) -> Optional[List[schemas.Transaction]]:
+        # 深い探索のリクエストは対話的な検索より後にスケジュールする
+        with semaphore, request_priority(PRIORITY_NETWORK):
+            # Sessionはスレッドセーフではないため、ワーカーごとにセッションを作成する
+            db = session_factory()
+            try:
+                return blockchain_service.get_transactions(
+                    address=address,
+                    start_datetime=start_datetime,
+                    end_datetime=end_datetime,
+                    db=db,
+                    depth=depth,
+                    filters=filters,
+                )
+            except HTTPException as e:
+                # アドレス検証エラーなどの場合はスキップして次のアドレスへ
+                logger.warning(f"Error fetching transactions for address {address}: {e.detail}")
+                return None
+            finally:
+                db.close()
+                if on_fetched is not None:
+                    on_fetched(address)
+
+    def fetch_batch(batch: List[str]) -> List[Optional[List[schemas.Transaction]]]:
+        with semaphore, request_priority(PRIORITY_NETWORK):
+            db = session_factory()
+            try:
+                results = blockchain_service.get_transactions_many(
+                    batch,
+                    start_datetime=start_datetime,
+                    end_datetime=end_datetime,
+                    db=db,
+                    depth=depth,
+                    filters=filters,
+                )
+            except HTTPException as e:
+                logger.warning(f"Error fetching transactions for {len(batch)} addresses: {e.detail}")
+                results = {}
+            finally:
+                db.close()
+                if on_fetched is not None:
+                    for address in batch:
+                        on_fetched(address)
+            return [results.get(address) for address in batch]
+
+    batch_size = max(1, blockchain_service.FETCH_BATCH_SIZE)
+    if batch_size == 1:
+        tasks, run = addresses, fetch
+    else:
+        # 複数のアドレスをまとめて取得できる上流APIでは、バッチ単位で並行取得する
+        tasks = [addresses[i:i + batch_size] for i in range(0, len(addresses), batch_size)]
+        run = fetch_batch
+
+    max_workers = min(len(tasks), FETCH_CONCURRENCY.get(blockchain, 1))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # mapは入力順に結果を返すため、並行取得でも結合順序は固定される
+        results = list(executor.map(run, tasks))
+    if batch_size == 1:
+        return results
+    return [result for batch_results in results for result in batch_results]
+
+
+class TraversalObserver:
+    """
+    ネットワーク探索の進捗を受け取るオブジェクトの基底クラス（既定では何もしない）
+    """
+    def on_frontier(self, addresses: List[str]) -> None:
+        """
+        取得するアドレスが決まった時に呼び出される
+        """
+        pass
+
+    def on_fetched(self, address: str) -> None:
+        """
+        1アドレスの取得が終わった時に呼び出される
+        """
+        pass
+
+    def on_level(self, network: schemas.TransactionNetwork) -> None:
+        """
+        BFSの1階層の展開が終わった時に、その時点のネットワーク（途中結果）とともに呼び出される
+        （traversal="sql"では呼び出されない）
+        """
+        pass
+
+    def on_read(self) -> None:
+        """
+        traversal="sql"で近傍全体をDBから読み出す直前に呼び出される
+        """
+        pass
+
+
+class _CacheFillObserver(TraversalObserver):
+    """
+    探索の進捗をobserverに渡しつつ、各アドレスのトランザクションを読み出した時点のキャッシュの世代を記録する
+
+    BFSではアドレスの取得（保存と読み出し）が終わるたびに、sqlでは近傍全体を読み出す直前に記録する。
+    探索自身が保存したトランザクションによる無効化は読み出しより前に起きるため、結果を破棄する理由にならない。
+    """
+    def __init__(self, observer: TraversalObserver, generation: int):
+        self._observer = observer
+        self._lock = Lock()
+        self._read_generations: Dict[str, int] = {}
+        self._snapshot = generation
+
+    def on_frontier(self, addresses: List[str]) -> None:
+        self._observer.on_frontier(addresses)
+
+    def on_fetched(self, address: str) -> None:
+        with self._lock:
+            self._read_generations[address] = network_cache.generation()
+        self._observer.on_fetched(address)
+
+    def on_level(self, network: schemas.TransactionNetwork) -> None:
+        self._observer.on_level(network)
+
+    def on_read(self) -> None:
+        self._snapshot = network_cache.generation()
+        self._observer.on_read()
+
+    def read_generations(self, addresses: Iterable[str]) -> Dict[str, int]:
+        """
+        読み出したアドレス -> 読み出した時点の世代
+        """
+        with self._lock:
+            return {
+                address: max(self._read_generations.get(address, self._snapshot), self._snapshot)
+                for address in addresses
+            }
+
+
+# ネットワークの構築方式
+# - "bfs": 階層ごとにアドレスのトランザクションを取得する幅優先探索
+# - "sql": 再帰CTEで近傍全体をDBから1回で取得し、未取得のアドレスのみ上流APIから取得する
+TRAVERSAL_MODES = ("bfs", "sql")
+
+
+class _NetworkAccumulator:
+    """
+    トランザクションからネットワークのノードとリンクを組み立てる（構築方式によらず共通）
+
+    ノードはキー（BFSでは正規化済みアドレス、SQLではアドレスID）で管理し、
+    アドレス文字列への変換はto_networkでシリアライズする時にまとめて行う。
+    ノード数と次数の予算はここで適用し、打ち切った場合はその理由をreasonsに記録する。
+    """
+    def __init__(self, root: Hashable, label: str,
+                 endpoints: Callable[[Any], Tuple[Hashable, Hashable]],
+                 budget: TraversalBudget):
+        """
+        Parameters:
+        - root: 中心アドレスのキー
+        - label: 中心アドレスの表示名（入力されたアドレス）
+        - endpoints: トランザクションから(送信元のキー, 送信先のキー)を返す関数
+        - budget: 探索の予算
+        """
+        self.root = root
+        self.label = label
+        self._endpoints = endpoints
+        self.budget = budget
+        # 探索済みアドレスのキー（ノードの順序を保持）
+        self._nodes: List[Hashable] = [root]
+        self.explored = set([root])
+        # 取引相手が多すぎるため展開しなかったアドレス
+        self.hubs: Set[Hashable] = set()
+        # drainで返していないハブ（ノードとして返した後にハブと判明したもの）
+        self._undrained_hubs: List[Hashable] = []
+        self._drained_nodes = 0
+        self.reasons: List[str] = []
+        # アドレスごとの優先度（接続するトランザクションの合計金額、または最新の日時）
+        self._scores: Dict[Hashable, Any] = {}
+        # (送信元のキー, 送信先のキー, txid, 金額, 日時, 同じ送信元・送信先・txidのリンクの中での番号)
+        self._links: List[Tuple[Hashable, Hashable, str, float, datetime, int]] = []
+        # 追加済みのリンクの(送信元のキー, 送信先のキー, txid, 金額)
+        # （transactionsテーブルの一意キーuq_transactions_identityと同じ単位で重複を判定する）
+        self._link_keys: Set[Tuple[Hashable, Hashable, str, float]] = set()
+        # (送信元のキー, 送信先のキー, txid)ごとのリンク数（Bitcoinの複数の出力を別のリンクにする）
+        self._link_outputs: Dict[Tuple[Hashable, Hashable, str], int] = {}
+
+    def expand(self, key: Hashable, transactions: Iterable[Any], hub: bool = False) -> List[Hashable]:
+        """
+        keyのアドレスのトランザクションをノードとリンクとして追加し、新たに見つかったアドレスのキーを返す
+        （transactionsは期間・最小金額の条件で絞り込み済みであること）
+
+        - 取引相手の数がmax_degree_per_nodeを超えるアドレス（中心アドレスを除く）はハブとして扱い、
+          既にネットワークに含まれるアドレスとのリンクだけを追加する
+        - hubが真の場合は、取引相手の数によらずハブとして扱う（中心アドレスを除く）
+        - 新しいアドレスは優先度の高い順に、ノード数がmax_nodesに達するまで追加する
+        """
+        transactions = list(transactions)
+
+        # 取引相手ごとの優先度
+        scores: Dict[Hashable, Any] = {}
+        for tx in transactions:
+            for counterparty in self._endpoints(tx):
+                if counterparty != key:
+                    scores[counterparty] = self._combine(scores.get(counterparty), self._score(tx))
+
+        discovered = []
+        max_degree = self.budget.max_degree_per_node
+        if key != self.root and (hub or (max_degree is not None and len(scores) > max_degree)):
+            self.hubs.add(key)
+            self._undrained_hubs.append(key)
+            self._truncate(TRUNCATED_MAX_DEGREE)
+        else:
+            # sortedは安定なため、優先度が同じ場合はトランザクションに現れた順になる
+            candidates = sorted(
+                (counterparty for counterparty in scores if counterparty not in self.explored),
+                key=lambda counterparty: scores[counterparty],
+                reverse=True,
+            )
+            if self.budget.max_nodes is not None:
+                room = max(0, self.budget.max_nodes - len(self._nodes))
+                if len(candidates) > room:
+                    self._truncate(TRUNCATED_MAX_NODES)
+                    candidates = candidates[:room]
+            for counterparty in candidates:
+                self._nodes.append(counterparty)
+                self.explored.add(counterparty)
+                discovered.append(counterparty)
+
+        for counterparty, score in scores.items():
+            if counterparty in self.explored:
+                self._scores[counterparty] = self._combine(self._scores.get(counterparty), score)
+
+        for tx in transactions:
+            source, target = self._endpoints(tx)
+            # ネットワークに含めなかったアドレスとのリンクは追加しない
+            if source not in self.explored or target not in self.explored:
+                continue
+            # リンク（各トランザクションごとに独自のリンク）
+            # 両端のアドレスを探索すると同じトランザクションが2回現れるため、1回だけ追加する
+            # （同じtxidで同じ送信元・送信先への金額の異なる出力は、それぞれ別のリンクにする）
+            link_key = (source, target, tx.txid, tx.value)
+            if link_key in self._link_keys:
+                continue
+            self._link_keys.add(link_key)
+            output = self._link_outputs.get(link_key[:3], 0)
+            self._link_outputs[link_key[:3]] = output + 1
+            self._links.append((source, target, tx.txid, tx.value, tx.timestamp, output))
+        return discovered
+
+    def add_known(self, keys: Iterable[Hashable]) -> None:
+        """
+        呼び出し側が既に持っているアドレスを探索済みのノードとして追加する（drainでは返さない）
+        （drainで返していないノードも返さなくなるため、drainの直後に呼び出すこと）
+        """
+        for key in keys:
+            if key not in self.explored:
+                self._nodes.append(key)
+                self.explored.add(key)
+        self._drained_nodes = len(self._nodes)
+
+    def rank(self, keys: List[Hashable]) -> List[Hashable]:
+        """
+        次の階層で展開するアドレスを優先度の高い順に並べる
+        """
+        return sorted(keys, key=lambda key: self._scores[key], reverse=True)
+
+    def to_network(self, address_of: Callable[[Hashable], str],
+                   reasons: Iterable[str] = ()) -> schemas.TransactionNetwork:
+        """
+        キーを正規化済みアドレスに変換してネットワークを組み立てる
+
+        Parameters:
+        - address_of: キーを正規化済みアドレスに変換する関数
+        - reasons: 上流APIの呼び出し回数など、このクラスの外で打ち切った理由
+        """
+        truncation_reasons = self.truncation_reasons(reasons)
+        return schemas.TransactionNetwork.construct(
+            aggregated=False,
+            nodes=[self._node(key, address_of) for key in self._nodes],
+            links=[self._link(link, address_of) for link in self._links],
+            truncated=bool(truncation_reasons),
+            truncation_reasons=truncation_reasons,
+        )
+
+    def drain(self, address_of: Callable[[Hashable], str]) -> Tuple[List[schemas.NetworkNode], List[schemas.NetworkLink]]:
+        """
+        前回のdrain以降に追加されたノードとリンクを返し、保持していたリンクを解放する（ストリーミング用）
+
+        返した後にハブと判明したノードは、typeを"hub"にして再度返す。
+        drainを使用した後は、to_networkで全体を組み立てることはできない。
+        """
+        new_keys = self._nodes[self._drained_nodes:]
+        self._drained_nodes = len(self._nodes)
+        new_key_set = set(new_keys)
+        nodes = [self._node(key, address_of) for key in new_keys]
+        nodes.extend(self._node(key, address_of) for key in self._undrained_hubs if key not in new_key_set)
+        self._undrained_hubs = []
+
+        links = [self._link(link, address_of) for link in self._links]
+        self._links = []
+        return nodes, links
+
+    def truncation_reasons(self, reasons: Iterable[str] = ()) -> List[str]:
+        reasons = list(reasons)
+        return reasons + [reason for reason in self.reasons if reason not in reasons]
+
+    # ノード・リンクは件数が多いため、Pydanticの検証を省略してconstructで生成する
+    # （値はDBの列から取り出した時点でスキーマの型に揃っている）
+    def _node(self, key: Hashable, address_of: Callable[[Hashable], str]) -> schemas.NetworkNode:
+        if key == self.root:
+            return schemas.NetworkNode.construct(id=address_of(key), label=self.label, type="source")
+        address = address_of(key)
+        node_type = "hub" if key in self.hubs else "address"
+        return schemas.NetworkNode.construct(id=address, label=address, type=node_type)
+
+    def _link(self, link: Tuple[Hashable, Hashable, str, float, datetime, int],
+              address_of: Callable[[Hashable], str]) -> schemas.NetworkLink:
+        source, target, txid, value, timestamp, output = link
+        source_address = address_of(source)
+        target_address = address_of(target)
+        # 2つ目以降の出力はIDに番号を付けて区別する
+        link_id = f"{source_address}_{target_address}_{txid}"
+        if output:
+            link_id = f"{link_id}_{output}"
+        return schemas.NetworkLink.construct(
+            id=link_id,
+            source=source_address,
+            target=target_address,
+            value=value,
+            timestamp=timestamp,
+        )
+
+    def _score(self, tx: Any) -> Any:
+        return tx.timestamp if self.budget.rank_by == "recency" else tx.value
+
+    def _combine(self, current: Any, score: Any) -> Any:
+        if current is None:
+            return score
+        return max(current, score) if self.budget.rank_by == "recency" else current + score
+
+    def _truncate(self, reason: str) -> None:
+        if reason not in self.reasons:
+            self.reasons.append(reason)
+
+
+def _focus(network: NetworkResponse, address: str, second_address: str,
+           second_label: str) -> NetworkResponse:
+    """
+    中心アドレスと指定アドレスの間のリンクのみを残したネットワークを返す
+    （address, second_addressは正規化済み）
+    """
+    nodes = list(network.nodes)
+    # second_addressがノードに含まれていない場合は追加
+    if not any(node.id == second_address for node in nodes):
+        nodes.append(schemas.NetworkNode.construct(id=second_address, label=second_label, type="focus"))
+    else:
+        # 既存のノードのタイプを変更
+        for node in nodes:
+            if node.id == second_address:
+                node.type = "focus"
+                break
+
+    # 中心アドレスと指定アドレス間のリンクのみをフィルタリング
+    filtered_links = [
+        link for link in network.links
+        if (link.source == address and link.target == second_address) or
+           (link.source == second_address and link.target == address)
+    ]
+
+    # 関連するノードのみを保持
+    relevant_nodes = {address, second_address}
+
+    # フィルタリングされたネットワークを作成（集約済みのネットワークはその型のまま返す）
+    return network.copy(update={
+        "nodes": [node for node in nodes if node.id in relevant_nodes],
+        "links": filtered_links,
+    })
+
+
+def build_transaction_network(blockchain_service: BlockchainService, address: str, depth: int,
+                              session_factory: Callable[[], Session],
+                              start_datetime: Optional[datetime] = None,
+                              end_datetime: Optional[datetime] = None,
+                              min_amount: Optional[float] = None,
+                              second_address: Optional[str] = None,
+                              use_cache: bool = True,
+                              traversal: str = "bfs",
+                              aggregate: bool = False,
+                              budget: Optional[TraversalBudget] = None,
+                              observer: Optional[TraversalObserver] = None) -> NetworkResponse:
+    """
+    指定されたアドレスを中心としたトランザクションネットワークを構築
+
+    Parameters:
+    - blockchain_service: 取得に使用するブロックチェーンサービス
+    - address: 中心となるウォレットアドレス
+    - depth: 探索する深さ
+    - session_factory: ワーカーごとのデータベースセッションを生成する関数
+    - start_datetime: 開始日時
+    - end_datetime: 終了日時
+    - min_amount: 最小取引金額
+    - second_address: 指定した場合、中心アドレスとの直接のリンクのみを残す
+    - use_cache: 構築済みネットワークのキャッシュを使用するかどうか
+    - traversal: 構築方式（"bfs" または "sql"）
+    - aggregate: Trueの場合、同じ(送信元, 送信先)のリンクを1本の重み付きリンクにまとめる
+    - budget: 探索の予算（省略時は既定値）。打ち切った場合はtruncated/truncation_reasonsで返す
+    - observer: 探索の進捗を受け取るオブジェクト（非同期ジョブで使用）
+    """
+    if traversal not in TRAVERSAL_MODES:
+        raise ValueError(f"Unsupported traversal mode: {traversal}")
+    if budget is None:
+        budget = TraversalBudget()
+    if observer is None:
+        observer = TraversalObserver()
+
+    blockchain = blockchain_service.blockchain_name
+    normalized_address = blockchain_service.normalize_address(address)
+    normalized_second_address = blockchain_service.normalize_address(second_address) if second_address else None
+    # sqlとbfsでは予算による打ち切り方やリンクの順序が異なるため、別々にキャッシュする
+    cache_key = (
+        blockchain, normalized_address, depth, start_datetime, end_datetime, min_amount,
+        normalized_second_address, traversal, aggregate, budget.key(),
+    )
+    if use_cache:
+        cached_network = network_cache.get(cache_key)
+        if cached_network is not None:
+            logger.info(f"Using cached network for address: {address} (depth: {depth})")
+            return cached_network
+
+    # 構築中に読み出したアドレスのトランザクションがその後で保存された場合は、古い結果をキャッシュしない
+    if use_cache:
+        generation = network_cache.begin_fill()
+        observer = fill_observer = _CacheFillObserver(observer, generation)
+    try:
+        traverse = _traverse_sql if traversal == "sql" else _traverse_bfs
+        network, explored_addresses, fetched_addresses = traverse(
+            blockchain_service, address, depth, session_factory,
+            start_datetime, end_datetime, min_amount, budget, observer,
+        )
+        if network.truncated:
+            logger.info(f"Network of {address} truncated: {', '.join(network.truncation_reasons)}")
+
+        if aggregate:
+            network = _aggregate(
+                blockchain_service, network, fetched_addresses, session_factory,
+                start_datetime, end_datetime, min_amount,
+            )
+
+        # 特定のアドレスとの間のトランザクションのみをフィルタリング
+        if second_address:
+            network = _focus(network, normalized_address, normalized_second_address, second_address)
+            explored_addresses.append(normalized_second_address)
+            logger.info(f"Filtered network to {len(network.nodes)} nodes and {len(network.links)} links between {address} and {second_address}")
+
+        if use_cache:
+            network_cache.put(
+                cache_key, blockchain, network, explored_addresses,
+                read_generations=fill_observer.read_generations(fetched_addresses),
+            )
+    finally:
+        if use_cache:
+            network_cache.end_fill(generation)
+    return network
+
+
+def _take_fetchable(blockchain_service: BlockchainService, addresses: List[str],
+                    session_factory: Callable[[], Session],
+                    start_datetime: Optional[datetime], end_datetime: Optional[datetime],
+                    budget: TraversalBudget) -> List[str]:
+    """
+    addressesのうち、取得済みのものと、上流APIの呼び出し回数の予算内で取得できるものを順序のまま返す
+    """
+    db = session_factory()
+    try:
+        unsynced = find_unsynced_addresses(
+            db, blockchain_service.blockchain_name, addresses, start_datetime, end_datetime
+        )
+    finally:
+        db.close()
+    allowed = set(budget.take_upstream_calls(unsynced))
+    skipped = set(unsynced) - allowed
+    return [address for address in addresses if address not in skipped]
+
+
+def _bfs_accumulator(blockchain_service: BlockchainService, address: str,
+                     budget: TraversalBudget) -> _NetworkAccumulator:
+    normalize = blockchain_service.normalize_address
+    return _NetworkAccumulator(
+        normalize(address), address,
+        lambda tx: (normalize(tx.from_address), normalize(tx.to_address)),
+        budget,
+    )
+
+
+def _iter_bfs_levels(accumulator: _NetworkAccumulator, blockchain_service: BlockchainService,
+                     depth: int, session_factory: Callable[[], Session],
+                     start_datetime: Optional[datetime], end_datetime: Optional[datetime],
+                     min_amount: Optional[float], budget: TraversalBudget,
+                     observer: TraversalObserver, fetched: List[str]) -> Iterator[int]:
+    """
+    階層ごとにアドレスのトランザクションを並行取得しながら幅優先探索し、
+    1階層の展開が終わるたびにその深さを返す（取引を取得したアドレスはfetchedに追加する）
+
+    各階層のアドレスは優先度の高い順に取得し、上流APIの呼び出し回数の予算を超えたアドレスは展開しない。
+    """
+    filters = TransactionFilter(min_amount=min_amount) if min_amount is not None else None
+    frontier = [accumulator.root]
+    for current_depth in range(depth):
+        frontier = _take_fetchable(
+            blockchain_service, frontier, session_factory, start_datetime, end_datetime, budget
+        )
+        if not frontier:
+            break
+        observer.on_frontier(frontier)
+
+        # この階層のアドレスの取引をまとめて並行取得
+        results = fetch_frontier(
+            blockchain_service,
+            frontier,
+            session_factory,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            depth=depth,  # 探索深度を渡す
+            on_fetched=observer.on_fetched,
+            # 最小金額の条件は取得したトランザクションの読み出しクエリで適用する
+            filters=filters,
+        )
+
+        next_frontier = []
+        for key, transactions in zip(frontier, results):
+            if transactions is None:
+                continue
+            fetched.append(key)
+            next_frontier.extend(accumulator.expand(key, transactions))
+
+        # 最後の階層で見つかったアドレスは探索しない
+        frontier = accumulator.rank(next_frontier) if current_depth + 1 < depth else []
+        yield current_depth + 1
+
+
+def _traverse_bfs(blockchain_service: BlockchainService, address: str,
+                  depth: int, session_factory: Callable[[], Session],
+                  start_datetime: Optional[datetime], end_datetime: Optional[datetime],
+                  min_amount: Optional[float], budget: TraversalBudget,
+                  observer: TraversalObserver) -> Tuple[schemas.TransactionNetwork, List[str], List[str]]:
+    """
+    階層ごとにアドレスのトランザクションを並行取得しながら幅優先探索する
+    （ノードのキーは正規化済みアドレス）
+
+    戻り値は構築したネットワーク、探索済みの正規化済みアドレス、取引を取得したアドレス。
+    """
+    accumulator = _bfs_accumulator(blockchain_service, address, budget)
+    fetched: List[str] = []
+    for level in _iter_bfs_levels(
+        accumulator, blockchain_service, depth, session_factory,
+        start_datetime, end_datetime, min_amount, budget, observer, fetched,
+    ):
+        if level < depth:
+            observer.on_level(accumulator.to_network(lambda key: key, budget.reasons))
+
+    network = accumulator.to_network(lambda key: key, budget.reasons)
+    return network, list(accumulator.explored), fetched
+
+
+def iter_transaction_network(blockchain_service: BlockchainService, address: str, depth: int,
+                             session_factory: Callable[[], Session],
+                             start_datetime: Optional[datetime] = None,
+                             end_datetime: Optional[datetime] = None,
+                             min_amount: Optional[float] = None,
+                             budget: Optional[TraversalBudget] = None,
+                             ) -> Iterator[Tuple[int, List[schemas.NetworkNode], List[schemas.NetworkLink], List[str]]]:
+    """
+    BFSでネットワークを構築しながら、1階層の展開が終わるたびに新たに追加されたノードとリンクを返す（ストリーミング用）
+
+    各要素は (深さ, ノード, リンク, その時点で打ち切った理由)。ノード・リンクは返した後に解放するため、
+    ネットワーク全体をメモリに保持しない（重複判定用のキーのみ保持する）。キャッシュは使用しない。
+    """
+    if budget is None:
+        budget = TraversalBudget()
+
+    accumulator = _bfs_accumulator(blockchain_service, address, budget)
+    address_of = lambda key: key
+    fetched: List[str] = []
+    emitted = False
+    for level in _iter_bfs_levels(
+        accumulator, blockchain_service, depth, session_factory,
+        start_datetime, end_datetime, min_amount, budget, TraversalObserver(), fetched,
+    ):
+        nodes, links = accumulator.drain(address_of)
+        emitted = True
+        yield level, nodes, links, accumulator.truncation_reasons(budget.reasons)
+
+    if not emitted:
+        # 中心アドレスを取得できなかった場合も、中心ノードだけは返す
+        nodes, links = accumulator.drain(address_of)
+        yield 0, nodes, links, accumulator.truncation_reasons(budget.reasons)
+
+
+def _row_endpoints(row: Any) -> Tuple[int, int]:
+    return row.from_address_id, row.to_address_id
+
+
+def _incident(rows: List[Any]) -> Dict[int, List[Any]]:
+    """
+    アドレスIDごとの接続トランザクションを返す
+    """
+    incident: Dict[int, List[Any]] = {}
+    for row in rows:
+        from_id, to_id = _row_endpoints(row)
+        incident.setdefault(from_id, []).append(row)
+        if to_id != from_id:
+            incident.setdefault(to_id, []).append(row)
+    return incident
+
+
+def _hubs(rows: List[Any]) -> Set[int]:
+    """
+    query_neighbourhoodがaddress_statsでハブと判定したアドレスIDを返す
+    """
+    hubs: Set[int] = set()
+    for row in rows:
+        if row.from_hub:
+            hubs.add(row.from_address_id)
+        if row.to_hub:
+            hubs.add(row.to_address_id)
+    return hubs
+
+
+def _expand_in_memory(accumulator: _NetworkAccumulator, incident: Dict[int, List[Any]],
+                      depth: int, hubs: Set[int]) -> List[int]:
+    """
+    取得済みのトランザクションを使って、BFSと同じ規則（予算・優先度）で幅優先に展開し、
+    展開した（ハブを含む）アドレスIDを展開した順に返す
+    （hubsのアドレスは、取得したトランザクションが探索対象同士を結ぶものに限られるため、常にハブとして扱う）
+    """
+    frontier = [accumulator.root]
+    fetched = []
+    for current_depth in range(depth):
+        next_frontier = []
+        for key in frontier:
+            fetched.append(key)
+            next_frontier.extend(accumulator.expand(key, incident.get(key, ()), hub=key in hubs))
+        frontier = accumulator.rank(next_frontier) if current_depth + 1 < depth else []
+    return fetched
+
+
+def _traverse_sql(blockchain_service: BlockchainService, address: str,
+                  depth: int, session_factory: Callable[[], Session],
+                  start_datetime: Optional[datetime], end_datetime: Optional[datetime],
+                  min_amount: Optional[float], budget: TraversalBudget,
+                  observer: TraversalObserver) -> Tuple[schemas.TransactionNetwork, List[str], List[str]]:
+    """
+    再帰CTEで近傍全体をDBから取得して構築する（ノードのキーはアドレスID）
+
+    ハブの判定とノード数の上限はCTEの中でも適用し、ハブの先の近傍は取得しない。
+    CTEではaddress_statsの取引相手の数（期間の条件を適用しない）でハブを判定するため、
+    期間を指定した場合はBFSよりも多くのアドレスがハブになることがある。
+
+    取得した近傍をBFSと同じ規則（予算・優先度）で展開し、展開したアドレスのうち
+    要求期間が未取得のものだけを上流APIから取得して、新たに取得するアドレスがなくなるまで繰り返す。
+    全て取得済みであれば、DBへの問い合わせはCTEと取得済み期間の確認の2回で済む。
+    上流APIの呼び出し回数の予算を超えたアドレスは、保存済みのトランザクションだけで展開する。
+    アドレスIDから文字列への変換は最後にまとめて行う。
+
+    戻り値は構築したネットワーク、探索済みの正規化済みアドレス、取引を取得したアドレス。
+    """
+    blockchain = blockchain_service.blockchain_name
+    root = blockchain_service.normalize_address(address)
+    attempted: Set[str] = set()
+
+    db = session_factory()
+    try:
+        while True:
+            root_id = address_registry.get_id(db, blockchain, root)
+            accumulator = _NetworkAccumulator(root_id, address, _row_endpoints, budget)
+            if root_id is None:
+                # 中心アドレスのトランザクションがまだ保存されていない
+                fetched, addresses = [], {}
+                candidates = [root]
+            else:
+                observer.on_read()
+                rows = query_neighbourhood(
+                    db, blockchain, root_id, depth,
+                    start_datetime=start_datetime,
+                    end_datetime=end_datetime,
+                    min_amount=min_amount,
+                    max_degree=budget.max_degree_per_node,
+                    max_nodes=budget.max_nodes,
+                )
+                fetched = _expand_in_memory(accumulator, _incident(rows), depth, _hubs(rows))
+                addresses = address_registry.get_addresses(db, fetched)
+                candidates = [addresses[address_id] for address_id in fetched]
+
+            # 未取得の期間があるアドレスのみ上流APIから取得（取得に失敗したアドレスは再試行しない）
+            candidates = [candidate for candidate in candidates if candidate not in attempted]
+            unsynced = find_unsynced_addresses(db, blockchain, candidates, start_datetime, end_datetime)
+            unsynced = budget.take_upstream_calls(unsynced)
+            if not unsynced:
+                break
+
+            logger.info(f"Fetching {len(unsynced)} unsynced addresses from upstream for network of {root}")
+            attempted.update(unsynced)
+            observer.on_frontier(unsynced)
+            fetch_frontier(
+                blockchain_service,
+                unsynced,
+                session_factory,
+                start_datetime=start_datetime,
+                end_datetime=end_datetime,
+                depth=depth,
+                on_fetched=observer.on_fetched,
+            )
+            # 他のワーカーのセッションで保存された行を参照できるよう、トランザクションを終了する
+            db.rollback()
+
+        # シリアライズ時に必要なアドレス文字列をまとめて取得
+        addresses.update(address_registry.get_addresses(
+            db, [key for key in accumulator.explored if key is not None and key not in addresses]
+        ))
+    finally:
+        db.close()
+
+    def address_of(key: Optional[int]) -> str:
+        return root if key is None else addresses[key]
+
+    return (
+        accumulator.to_network(address_of, budget.reasons),
+        [address_of(key) for key in accumulator.explored],
+        [address_of(key) for key in fetched] or [root],
+    )
+
+
+def _aggregate(blockchain_service: BlockchainService, network: schemas.TransactionNetwork,
+               expanded_addresses: List[str], session_factory: Callable[[], Session],
+               start_datetime: Optional[datetime], end_datetime: Optional[datetime],
+               min_amount: Optional[float]) -> schemas.AggregatedTransactionNetwork:
+    """
+    ネットワークのリンクを(送信元, 送信先)ごとに1本の重み付きリンクにまとめる
+
+    集約はPythonではなくDBのGROUP BYで行う。対象は構築時と同じく、取引を取得したアドレスに
+    接続し、期間と最小金額の条件を満たすトランザクション（両端がネットワークに含まれるもののみ）。
+    """
+    blockchain = blockchain_service.blockchain_name
+    db = session_factory()
+    try:
+        address_ids = address_registry.get_ids(db, blockchain, expanded_addresses)
+        rows = query_edge_aggregates(
+            db, blockchain, address_ids.values(),
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            min_amount=min_amount,
+        )
+        addresses = address_registry.get_addresses(
+            db, {row.from_address_id for row in rows} | {row.to_address_id for row in rows}
+        )
+    finally:
+        db.close()
+
+    node_ids = {node.id for node in network.nodes}
+    links = []
+    for row in rows:
+        source = addresses[row.from_address_id]
+        target = addresses[row.to_address_id]
+        # 予算によってネットワークに含めなかったアドレスとのリンクは除く
+        if source not in node_ids or target not in node_ids:
+            continue
+        links.append(
+            schemas.AggregatedNetworkLink.construct(
+                id=f"{source}_{target}",
+                source=source,
+                target=target,
+                value=row.total_value,
+                count=row.count,
+                total_value=row.total_value,
+                min_value=row.min_value,
+                max_value=row.max_value,
+                first_timestamp=row.first_timestamp,
+                last_timestamp=row.last_timestamp,
+            )
+        )
+    logger.info(f"Aggregated {len(network.links)} links into {len(links)} edges")
+    return schemas.AggregatedTransactionNetwork.construct(
+        aggregated=True,
+        nodes=network.nodes,
+        links=links,
+        truncated=network.truncated,
+        truncation_reasons=network.truncation_reasons,
+    )
@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from .. import schemas
+
+# キャッシュの設定
+NETWORK_CACHE_TTL = float(os.getenv("NETWORK_CACHE_TTL", "300"))
+NETWORK_CACHE_MAX_ENTRIES = int(os.getenv("NETWORK_CACHE_MAX_ENTRIES", "128"))
+# 全エントリのノード数とリンク数の合計の上限
+NETWORK_CACHE_MAX_WEIGHT = int(os.getenv("NETWORK_CACHE_MAX_WEIGHT", "500000"))
+
+
+class _Entry:
+    def __init__(self, network: schemas.TransactionNetwork, expires_at: float,
+                 weight: int, addresses: Set[Tuple[str, str]]):
+        self.network = network
+        self.expires_at = expires_at
+        self.weight = weight
+        self.addresses = addresses
+
+
+class NetworkCache:
+    """
+    構築済みのTransactionNetworkを保持するLRU/TTLキャッシュ
+
+    - エントリ数とノード数+リンク数の合計が上限を超えた場合、最も古く使われたものから削除する
+    - TTLを過ぎたエントリは参照時に削除する
+    - グラフに含まれるアドレスのトランザクションが保存されると、そのエントリを無効化する
+    - 構築中にトランザクションを読み出した後で無効化されたアドレスがあれば、構築したネットワークは保存しない
+      （無効化のたびに世代を進め、putでアドレスを読み出した時点の世代と、そのアドレスの最後の無効化の世代を比べる）
+    """
+    def __init__(self, max_entries: int = NETWORK_CACHE_MAX_ENTRIES,
+                 max_weight: int = NETWORK_CACHE_MAX_WEIGHT,
+                 ttl: float = NETWORK_CACHE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        # (blockchain, 正規化済みアドレス) -> そのアドレスを含むエントリのキー
+        self._keys_by_address: Dict[Tuple[str, str], Set[Hashable]] = {}
+        self._weight = 0
+        # 無効化のたびに進める世代と、構築中のエントリがある間のアドレスごとの最後の無効化の世代
+        self._generation = 0
+        self._invalidated: Dict[Tuple[str, str], int] = {}
+        # 構築中のエントリの開始時の世代 -> 構築中の数
+        self._fills: Dict[int, int] = {}
+        # 統計情報
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[schemas.TransactionNetwork]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= self._clock():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.network
+
+    def begin_fill(self) -> int:
+        """
+        ネットワークの構築を始める前に呼び出し、現在の世代を返す（構築の終了時にend_fillに渡す）
+        """
+        with self._lock:
+            self._fills[self._generation] = self._fills.get(self._generation, 0) + 1
+            return self._generation
+
+    def generation(self) -> int:
+        """
+        現在の世代を返す（構築中にアドレスのトランザクションを読み出した時点の記録に使用する）
+        """
+        with self._lock:
+            return self._generation
+
+    def end_fill(self, generation: int) -> None:
+        """
+        begin_fillで始めた構築を終了する（失敗した場合も呼び出す）
+        """
+        with self._lock:
+            remaining = self._fills.pop(generation, 0) - 1
+            if remaining > 0:
+                self._fills[generation] = remaining
+            if not self._fills:
+                self._invalidated.clear()
+
+    def put(self, key: Hashable, blockchain: str, network: schemas.TransactionNetwork,
+            addresses: Iterable[str], read_generations: Optional[Dict[str, int]] = None) -> None:
+        """
+        Parameters:
+        - key: キャッシュキー
+        - blockchain: ブロックチェーン名
+        - network: 構築済みのネットワーク
+        - addresses: 構築時に参照したアドレス（正規化済み）。無効化の判定に使用する
+        - read_generations: 構築中に読み出したアドレス -> 読み出した時点の世代。
+          読み出した後に無効化されたアドレスがある場合は保存しない
+        """
+        weight = len(network.nodes) + len(network.links)
+        if weight > self.max_weight or self.max_entries <= 0:
+            return
+
+        address_keys = {(blockchain, address) for address in addresses}
+        with self._lock:
+            if read_generations and any(
+                self._invalidated.get((blockchain, address), -1) > generation
+                for address, generation in read_generations.items()
+            ):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(network, self._clock() + self.ttl, weight, address_keys)
+            self._weight += weight
+            for address_key in address_keys:
+                self._keys_by_address.setdefault(address_key, set()).add(key)
+
+            while len(self._entries) > self.max_entries or self._weight > self.max_weight:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate_addresses(self, blockchain: str, addresses: Iterable[str]) -> None:
+        """
+        指定されたアドレスを含むエントリを無効化する
+        """
+        with self._lock:
+            self._generation += 1
+            for address in addresses:
+                if self._fills:
+                    self._invalidated[(blockchain, address)] = self._generation
+                for key in list(self._keys_by_address.get((blockchain, address), ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_address.clear()
+            self._weight = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "weight": self._weight,
+                "max_entries": self.max_entries,
+                "max_weight": self.max_weight,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._weight -= entry.weight
+        for address_key in entry.addresses:
+            keys = self._keys_by_address.get(address_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_address[address_key]
+
+
+# プロセス内で共有するネットワークキャッシュ
+network_cache = NetworkCache()
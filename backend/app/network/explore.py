@@ -0,0 +1,212 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from .. import schemas
+from ..blockchain.base import BlockchainService
+from ..blockchain.filters import TransactionFilter
+from .budget import TraversalBudget
+from .builder import _NetworkAccumulator, _bfs_accumulator, _take_fetchable, fetch_frontier
+
+logger = logging.getLogger(__name__)
+
+# 探索セッション（グラフ上でノードを1つずつ展開する際のサーバー側の状態）の設定
+EXPLORE_SESSION_TTL = float(os.getenv("EXPLORE_SESSION_TTL", "900"))
+EXPLORE_MAX_SESSIONS = int(os.getenv("EXPLORE_MAX_SESSIONS", "256"))
+
+
+class ExplorationSession:
+    """
+    1つのグラフの対話的な探索の状態
+
+    - accumulator: これまでに返したノードとリンクのキー、ハブ（ノード・リンク自体は返した後に解放する）
+    - expanded: 展開済みのアドレス（再度展開を要求されてもトランザクションを読み出さない）
+    - budget: セッション全体の予算（ノード数・上流APIから取得するアドレス数・ハブの判定）
+    """
+    def __init__(self, session_id: str, params: Hashable,
+                 accumulator: _NetworkAccumulator, budget: TraversalBudget):
+        self.id = session_id
+        self.params = params
+        self.accumulator = accumulator
+        self.budget = budget
+        self.expanded: Set[str] = set()
+        # 同じセッションへの同時リクエストは順に処理する
+        self.lock = threading.Lock()
+
+
+class ExplorationStore:
+    """
+    探索セッションを保持するLRU/TTLストア
+
+    - セッション数が上限を超えた場合、最も古く使われたものから削除する
+    - TTLを過ぎたセッションは参照時に削除する（削除された場合は、クライアントが持つノードから作り直す）
+    - アドレスのトランザクションが保存されると、そのアドレスを未展開に戻す（次の展開で新しい取引を返す）
+    """
+    def __init__(self, max_sessions: int = EXPLORE_MAX_SESSIONS,
+                 ttl: float = EXPLORE_SESSION_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # セッションID -> (有効期限, セッション)
+        self._sessions: "OrderedDict[str, Any]" = OrderedDict()
+        # 統計情報
+        self.created = 0
+        self.reused = 0
+        self.evictions = 0
+
+    def get_or_create(self, session_id: Optional[str], params: Hashable,
+                      factory: Callable[[str], ExplorationSession]) -> ExplorationSession:
+        """
+        session_idのセッションを返す（存在しない、期限切れ、またはパラメータが異なる場合は新しく作成する）
+        """
+        with self._lock:
+            now = self._clock()
+            entry = self._sessions.get(session_id) if session_id else None
+            if entry is not None and entry[0] > now and entry[1].params == params:
+                self._sessions[session_id] = (now + self.ttl, entry[1])
+                self._sessions.move_to_end(session_id)
+                self.reused += 1
+                return entry[1]
+
+            session = factory(uuid.uuid4().hex)
+            self._sessions[session.id] = (now + self.ttl, session)
+            self.created += 1
+            while len(self._sessions) > max(1, self.max_sessions):
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+            return session
+
+    def invalidate_addresses(self, blockchain: str, addresses: Iterable[str]) -> None:
+        """
+        指定されたアドレスを、そのブロックチェーンのすべてのセッションで未展開に戻す
+        """
+        addresses = set(addresses)
+        with self._lock:
+            sessions = [session for _, session in self._sessions.values()]
+        for session in sessions:
+            if session.params[0] == blockchain:
+                # 展開中のスレッドがsession.lockを保持しているため、ここではロックを取らずに更新する
+                session.expanded.difference_update(addresses)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl": self.ttl,
+                "created": self.created,
+                "reused": self.reused,
+                "evictions": self.evictions,
+            }
+
+
+# プロセス内で共有する探索セッションのストア
+exploration_sessions = ExplorationStore()
+
+
+def expand_network_node(blockchain_service: BlockchainService, address: str, node: str,
+                        session_factory: Callable[[], Session],
+                        known_nodes: Iterable[str] = (),
+                        known_links: Iterable[str] = (),
+                        session_id: Optional[str] = None,
+                        start_datetime: Optional[datetime] = None,
+                        end_datetime: Optional[datetime] = None,
+                        min_amount: Optional[float] = None,
+                        budget: Optional[TraversalBudget] = None,
+                        store: ExplorationStore = exploration_sessions) -> schemas.NetworkDelta:
+    """
+    グラフのノードを1ホップ展開し、クライアントがまだ持っていないノードとリンクのみを返す
+
+    Parameters:
+    - blockchain_service: 取得に使用するブロックチェーンサービス
+    - address: グラフの中心アドレス
+    - node: 展開するアドレス
+    - session_factory: データベースセッションを生成する関数
+    - known_nodes: クライアントが既に持っているノードのID
+    - known_links: クライアントが既に持っているリンクのID（新しいセッションの作成時など、重複を避けたい場合に指定）
+    - session_id: 前回の展開で返したセッションID
+    - start_datetime: 開始日時
+    - end_datetime: 終了日時
+    - min_amount: 最小取引金額
+    - budget: 探索の予算（セッションを作成する時に使用し、以降の展開で共有する）
+    - store: 探索セッションのストア
+
+    セッションにはこれまでに返したノード・リンクのキーと展開済みのアドレスを保持するため、
+    1回の展開で読み出すのは展開するアドレスのトランザクションのみで、返すのはグラフの差分のみになる。
+    展開済みのアドレスを再度展開した場合は、トランザクションを読み出さずに空の差分を返す。
+    """
+    if budget is None:
+        budget = TraversalBudget()
+
+    blockchain = blockchain_service.blockchain_name
+    normalize = blockchain_service.normalize_address
+    root = normalize(address)
+    key = normalize(node)
+    params = (blockchain, root, start_datetime, end_datetime, min_amount, budget.key())
+
+    def create(new_id: str) -> ExplorationSession:
+        return ExplorationSession(
+            new_id, params, _bfs_accumulator(blockchain_service, address, budget), budget
+        )
+
+    session = store.get_or_create(session_id, params, create)
+    with session.lock:
+        accumulator = session.accumulator
+        # 打ち切りの理由は、この展開で打ち切ったもののみを返す
+        accumulator.reasons = []
+        session.budget.reasons = []
+        # クライアントが持っているノード（他のセッションや /network で取得したもの）は返さない
+        known = {normalize(known_node) for known_node in known_nodes}
+        known.add(key)
+        accumulator.add_known(known)
+
+        expanded = False
+        if key not in session.expanded:
+            fetchable = _take_fetchable(
+                blockchain_service, [key], session_factory, start_datetime, end_datetime, session.budget
+            )
+            results = fetch_frontier(
+                blockchain_service,
+                fetchable,
+                session_factory,
+                start_datetime=start_datetime,
+                end_datetime=end_datetime,
+                depth=1,
+                filters=TransactionFilter(min_amount=min_amount) if min_amount is not None else None,
+            )
+            if results and results[0] is not None:
+                accumulator.expand(key, results[0])
+                session.expanded.add(key)
+                expanded = True
+
+        nodes, links = accumulator.drain(lambda node_key: node_key)
+        known_link_ids = set(known_links)
+        if known_link_ids:
+            links = [link for link in links if link.id not in known_link_ids]
+        reasons = accumulator.truncation_reasons(session.budget.reasons)
+
+    logger.info(
+        f"Expanded {node} in session {session.id}: {len(nodes)} new nodes, {len(links)} new links"
+    )
+    return schemas.NetworkDelta.construct(
+        session_id=session.id,
+        node=key,
+        expanded=expanded,
+        nodes=nodes,
+        links=links,
+        truncated=bool(reasons),
+        truncation_reasons=reasons,
+    )
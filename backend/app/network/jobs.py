@@ -0,0 +1,330 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from .. import schemas
+from ..blockchain.base import BlockchainService
+from ..database.models import CrawlJob
+from .budget import TraversalBudget
+from .builder import TraversalObserver, build_transaction_network
+
+logger = logging.getLogger(__name__)
+
+# ジョブを並行して実行するワーカー数
+CRAWL_JOB_WORKERS = int(os.getenv("CRAWL_JOB_WORKERS", "2"))
+# この秒数以上進捗が更新されていない実行中のジョブは、停止したものとみなして再開する
+CRAWL_JOB_STALE_SECONDS = int(os.getenv("CRAWL_JOB_STALE_SECONDS", "300"))
+# 実行中のジョブの生存を記録し、停止したジョブを確認する間隔（秒）
+CRAWL_JOB_SWEEP_SECONDS = max(1, CRAWL_JOB_STALE_SECONDS // 3)
+# 取得したアドレスの進捗は、この件数またはこの秒数ごとにまとめて書き込む
+# （生存の記録はCRAWL_JOB_SWEEP_SECONDSごとに別途行うため、進捗の書き込みを間引いても再開の対象にはならない）
+CRAWL_JOB_PROGRESS_ADDRESSES = max(1, int(os.getenv("CRAWL_JOB_PROGRESS_ADDRESSES", "100")))
+CRAWL_JOB_PROGRESS_SECONDS = float(os.getenv("CRAWL_JOB_PROGRESS_SECONDS", "5"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class _JobObserver(TraversalObserver):
+    """
+    探索の進捗をcrawl_jobsテーブルに書き込む
+
+    階層の開始と途中結果はすぐに書き込み、アドレスごとの進捗は
+    CRAWL_JOB_PROGRESS_ADDRESSES件またはCRAWL_JOB_PROGRESS_SECONDS秒ごとにまとめて書き込む。
+    """
+    def __init__(self, manager: "CrawlJobManager", job_id: str, budget: TraversalBudget):
+        self._manager = manager
+        self._job_id = job_id
+        self._budget = budget
+        # on_fetchedはワーカーのスレッドから同時に呼び出される
+        self._lock = threading.Lock()
+        self.addresses_done = 0
+        self.addresses_remaining = 0
+        # 最後に進捗を書き込んだ時点
+        self._saved_done = 0
+        self._saved_at = time.monotonic()
+
+    def on_frontier(self, addresses: List[str]) -> None:
+        with self._lock:
+            self.addresses_remaining += len(addresses)
+            self._save()
+
+    def on_fetched(self, address: str) -> None:
+        with self._lock:
+            self.addresses_done += 1
+            self.addresses_remaining = max(0, self.addresses_remaining - 1)
+            if (self.addresses_done - self._saved_done >= CRAWL_JOB_PROGRESS_ADDRESSES
+                    or time.monotonic() - self._saved_at >= CRAWL_JOB_PROGRESS_SECONDS):
+                self._save()
+
+    def on_level(self, network: schemas.TransactionNetwork) -> None:
+        # 途中結果はtraversal="bfs"の場合のみ階層ごとに保存される（"sql"では完了時の結果のみ）
+        with self._lock:
+            self._save(result=network.json())
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "addresses_done": self.addresses_done,
+            "addresses_remaining": self.addresses_remaining,
+            "upstream_calls": self._budget.upstream_calls,
+        }
+
+    def _save(self, **fields: Any) -> None:
+        self._manager.update(self._job_id, **self.progress(), **fields)
+        self._saved_done = self.addresses_done
+        self._saved_at = time.monotonic()
+
+
+class CrawlJobManager:
+    """
+    ネットワーク構築ジョブをワーカープールで実行する
+
+    ジョブのパラメータと進捗はcrawl_jobsテーブルに保存する。取得したトランザクションと取得済み期間も
+    DBに保存されているため、再起動後に再実行すると取得済みのアドレスは上流APIに問い合わせずに再開できる。
+    複数のuvicornワーカーから同じジョブを実行しないよう、実行前にステータスを条件付きで更新して確保する。
+
+    実行中のジョブはCRAWL_JOB_SWEEP_SECONDSごとにupdated_atを更新して生存を記録し、同じ間隔で
+    CRAWL_JOB_STALE_SECONDS以上更新されていない（実行していたプロセスが停止した）ジョブを再開する。
+    """
+    def __init__(self, session_factory: Callable[[], Session],
+                 service_factory: Callable[[str], BlockchainService],
+                 workers: int = CRAWL_JOB_WORKERS):
+        """
+        Parameters:
+        - session_factory: データベースセッションを生成する関数
+        - service_factory: ブロックチェーン名からサービスを返す関数
+        - workers: ジョブを並行して実行するワーカー数
+        """
+        self._session_factory = session_factory
+        self._service_factory = service_factory
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="crawl-job")
+        # このプロセスで実行中のジョブID
+        self._running: Set[str] = set()
+        self._running_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def submit(self, blockchain: str, address: str, params: Dict[str, Any]) -> str:
+        """
+        ジョブを登録して実行を予約し、ジョブIDを返す
+
+        Parameters:
+        - blockchain: ブロックチェーン名
+        - address: 中心となるアドレス
+        - params: build_transaction_networkに渡すパラメータ（JSONに変換できる値）
+        """
+        now = datetime.utcnow()
+        job = CrawlJob(
+            id=uuid.uuid4().hex,
+            blockchain=blockchain,
+            address=address,
+            params=json.dumps(params),
+            status=JOB_QUEUED,
+            addresses_done=0,
+            addresses_remaining=0,
+            upstream_calls=0,
+            created_at=now,
+            updated_at=now,
+        )
+        db = self._session_factory()
+        try:
+            db.add(job)
+            db.commit()
+            job_id = job.id
+        finally:
+            db.close()
+
+        self._executor.submit(self._run, job_id)
+        logger.info(f"Queued crawl job {job_id} for {blockchain} address: {address}")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[CrawlJob]:
+        db = self._session_factory()
+        try:
+            return db.query(CrawlJob).filter(CrawlJob.id == job_id).first()
+        finally:
+            db.close()
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        """
+        ジョブの進捗・結果を更新する
+        """
+        fields["updated_at"] = datetime.utcnow()
+        db = self._session_factory()
+        try:
+            db.query(CrawlJob).filter(CrawlJob.id == job_id).update(fields, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def resume(self) -> int:
+        """
+        未実行のジョブと、停止した（進捗が一定時間更新されていない）実行中のジョブを再開し、その数を返す
+        （アプリケーション起動時に呼び出す。以降はstart_sweeperのスレッドが停止したジョブを再開する）
+        """
+        requeued = self._requeue_stale()
+        db = self._session_factory()
+        try:
+            job_ids = [row.id for row in db.query(CrawlJob.id).filter(CrawlJob.status == JOB_QUEUED).all()]
+        finally:
+            db.close()
+
+        for job_id in job_ids:
+            self._executor.submit(self._run, job_id)
+        if job_ids:
+            logger.info(f"Resumed {len(job_ids)} crawl jobs ({len(requeued)} stale)")
+        return len(job_ids)
+
+    def start_sweeper(self, interval: float = CRAWL_JOB_SWEEP_SECONDS) -> None:
+        """
+        実行中のジョブの生存の記録と、停止したジョブの再開を定期的に行うスレッドを開始する
+        """
+        if self._sweeper is not None:
+            return
+        self._sweeper = threading.Thread(
+            target=self._sweep_loop, args=(interval,), name="crawl-job-sweeper", daemon=True
+        )
+        self._sweeper.start()
+
+    def sweep(self) -> List[str]:
+        """
+        このプロセスで実行中のジョブのupdated_atを更新し、停止したジョブを再開して、再開したジョブIDを返す
+        """
+        with self._running_lock:
+            running = list(self._running)
+        if running:
+            db = self._session_factory()
+            try:
+                db.query(CrawlJob).filter(
+                    CrawlJob.id.in_(running),
+                    CrawlJob.status == JOB_RUNNING,
+                ).update({"updated_at": datetime.utcnow()}, synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+
+        requeued = self._requeue_stale()
+        for job_id in requeued:
+            self._executor.submit(self._run, job_id)
+        if requeued:
+            logger.info(f"Resumed {len(requeued)} stale crawl jobs")
+        return requeued
+
+    def shutdown(self) -> None:
+        """
+        未開始のジョブの予約を取り消す（取り消したジョブは次回起動時に再開される）
+        """
+        self._stopped.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _sweep_loop(self, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Failed to sweep crawl jobs")
+
+    def _requeue_stale(self) -> List[str]:
+        """
+        停止した実行中のジョブを待機中に戻し、そのIDを返す
+        （このプロセスで実行中のジョブは、記録が遅れていても戻さない）
+        """
+        stale_before = datetime.utcnow() - timedelta(seconds=CRAWL_JOB_STALE_SECONDS)
+        with self._running_lock:
+            running = set(self._running)
+        db = self._session_factory()
+        try:
+            stale = [
+                row.id for row in db.query(CrawlJob.id).filter(
+                    CrawlJob.status == JOB_RUNNING,
+                    CrawlJob.updated_at < stale_before,
+                ).all()
+                if row.id not in running
+            ]
+            requeued = []
+            for job_id in stale:
+                # 他のワーカーが同時に戻した・生存を記録した場合は更新されない
+                updated = db.query(CrawlJob).filter(
+                    CrawlJob.id == job_id,
+                    CrawlJob.status == JOB_RUNNING,
+                    CrawlJob.updated_at < stale_before,
+                ).update({"status": JOB_QUEUED}, synchronize_session=False)
+                if updated:
+                    requeued.append(job_id)
+            db.commit()
+        finally:
+            db.close()
+        return requeued
+
+    def _claim(self, job_id: str) -> Optional[CrawlJob]:
+        """
+        待機中のジョブを実行中に変更して確保する（他のワーカーが確保済みの場合はNone）
+        """
+        db = self._session_factory()
+        try:
+            claimed = db.query(CrawlJob).filter(
+                CrawlJob.id == job_id,
+                CrawlJob.status == JOB_QUEUED,
+            ).update({"status": JOB_RUNNING, "updated_at": datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                return None
+            return db.query(CrawlJob).filter(CrawlJob.id == job_id).first()
+        finally:
+            db.close()
+
+    def _run(self, job_id: str) -> None:
+        job = self._claim(job_id)
+        if job is None:
+            return
+
+        with self._running_lock:
+            self._running.add(job_id)
+        try:
+            self._execute(job)
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+
+    def _execute(self, job: CrawlJob) -> None:
+        job_id = job.id
+        params = json.loads(job.params)
+        budget = TraversalBudget(**params.get("budget", {}))
+        observer = _JobObserver(self, job_id, budget)
+        logger.info(f"Running crawl job {job_id} for {job.blockchain} address: {job.address}")
+        try:
+            network = build_transaction_network(
+                self._service_factory(job.blockchain),
+                job.address,
+                params["depth"],
+                session_factory=self._session_factory,
+                start_datetime=_parse_datetime(params.get("start_datetime")),
+                end_datetime=_parse_datetime(params.get("end_datetime")),
+                min_amount=params.get("min_amount"),
+                second_address=params.get("second_address"),
+                traversal=params.get("traversal", "bfs"),
+                aggregate=params.get("aggregate", False),
+                budget=budget,
+                observer=observer,
+            )
+        except Exception as e:
+            logger.exception(f"Crawl job {job_id} failed")
+            self.update(job_id, status=JOB_FAILED, error=str(e), **observer.progress())
+            return
+
+        self.update(job_id, status=JOB_COMPLETED, result=network.json(), **observer.progress())
+        logger.info(f"Completed crawl job {job_id} with {len(network.nodes)} nodes and {len(network.links)} links")
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
@@ -0,0 +1,278 @@
+import itertools
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from .. import schemas
+from ..blockchain.base import BlockchainService
+from ..blockchain.filters import TransactionFilter
+from .budget import TRUNCATED_MAX_DEGREE, TRUNCATED_MAX_NODES, TraversalBudget
+from .builder import _take_fetchable, fetch_frontier
+
+logger = logging.getLogger(__name__)
+
+# パスの並べ方
+# - "length": ホップ数が少ない順（同じ場合は最小金額が大きい順）
+# - "value": パス上の最小金額（流せる金額の目安）が大きい順
+PATH_RANK_MODES = ("length", "value")
+
+# 並べ替えの候補として列挙するパス数の上限
+PATH_MAX_CANDIDATES = int(os.getenv("PATH_MAX_CANDIDATES", "1000"))
+
+
+class _SearchSide:
+    """
+    双方向BFSの片側の状態
+
+    - direction: "out"（送金の向きにたどる）, "in"（送金の逆向きにたどる）, None（向きを問わない）
+    - depth: 訪問済みのアドレスと起点からのホップ数
+    - parents: 各アドレスに最短で到達する直前のアドレス（起点側）
+    """
+    def __init__(self, root: str, direction: Optional[str]):
+        self.root = root
+        self.direction = direction
+        self.depth: Dict[str, int] = {root: 0}
+        self.parents: Dict[str, Set[str]] = {root: set()}
+        self.frontier: List[str] = [root]
+        self.level = 0
+
+    def follows(self, address: str, source: str, target: str) -> bool:
+        if self.direction == "out":
+            return source == address
+        if self.direction == "in":
+            return target == address
+        return True
+
+    def paths_to(self, address: str) -> Iterator[List[str]]:
+        """
+        起点からaddressまでの最短パスを順に返す
+        """
+        if address == self.root:
+            yield [address]
+            return
+        for parent in sorted(self.parents[address]):
+            for path in self.paths_to(parent):
+                yield path + [address]
+
+
+def find_transaction_paths(blockchain_service: BlockchainService, source: str, target: str,
+                           session_factory: Callable[[], Session],
+                           max_depth: int = 4,
+                           k: int = 5,
+                           rank_by: str = "length",
+                           directed: bool = True,
+                           start_datetime: Optional[datetime] = None,
+                           end_datetime: Optional[datetime] = None,
+                           min_amount: Optional[float] = None,
+                           budget: Optional[TraversalBudget] = None) -> schemas.PathResult:
+    """
+    sourceとtargetの両端から同時に幅優先探索し、2つのアドレスを結ぶパスを返す
+
+    Parameters:
+    - blockchain_service: 取得に使用するブロックチェーンサービス
+    - source: 起点のアドレス
+    - target: 終点のアドレス
+    - session_factory: ワーカーごとのデータベースセッションを生成する関数
+    - max_depth: パスの最大ホップ数
+    - k: 返すパスの最大数
+    - rank_by: パスの並べ方（"length" または "value"）
+    - directed: Trueの場合、送金の向き（sourceからtargetへ資金が流れる向き）のパスのみを探す
+    - start_datetime: 開始日時
+    - end_datetime: 終了日時
+    - min_amount: 最小取引金額
+    - budget: 探索の予算（上流APIの呼び出し回数・ノード数・ハブの判定）
+
+    毎回フロンティアの小さい側を1階層展開し、両側の訪問済みアドレスが重なり、それを経由するパスが
+    k件見つかった時点で探索を終える（k件に満たない場合はmax_depthまで展開を続ける）。
+    各アドレスのトランザクションは保存済みの行を使用し、未取得の期間だけ上流APIから取得する。
+    見つかったパスをrank_byの順に並べてk件を返す。
+    """
+    if rank_by not in PATH_RANK_MODES:
+        raise ValueError(f"Unsupported path rank mode: {rank_by}")
+    if budget is None:
+        budget = TraversalBudget()
+
+    normalize = blockchain_service.normalize_address
+    source_side = _SearchSide(normalize(source), "out" if directed else None)
+    target_side = _SearchSide(normalize(target), "in" if directed else None)
+    filters = TransactionFilter(min_amount=min_amount) if min_amount is not None else None
+
+    # (送信元, 送信先) ごとの最も金額の大きいトランザクション（パスの各ホップの表示に使用）
+    edges: Dict[Tuple[str, str], schemas.Transaction] = {}
+    hubs: Set[str] = set()
+    expanded = 0
+    failed: List[str] = []
+
+    while source_side.frontier and target_side.frontier and source_side.level + target_side.level < max_depth:
+        side = source_side if len(source_side.frontier) <= len(target_side.frontier) else target_side
+        addresses = _take_fetchable(
+            blockchain_service, side.frontier, session_factory, start_datetime, end_datetime, budget
+        )
+        results = fetch_frontier(
+            blockchain_service,
+            addresses,
+            session_factory,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            depth=max_depth,
+            filters=filters,
+        )
+        next_frontier = []
+        for address, transactions in zip(addresses, results):
+            if transactions is None:
+                failed.append(address)
+                continue
+            expanded += 1
+            neighbours = []
+            for tx in transactions:
+                tx_source, tx_target = normalize(tx.from_address), normalize(tx.to_address)
+                if not side.follows(address, tx_source, tx_target):
+                    continue
+                counterparty = tx_target if tx_source == address else tx_source
+                if counterparty == address:
+                    continue
+                best = edges.get((tx_source, tx_target))
+                if best is None or tx.value > best.value:
+                    edges[(tx_source, tx_target)] = tx
+                neighbours.append(counterparty)
+
+            neighbours = list(dict.fromkeys(neighbours))
+            # ハブ（取引相手が多すぎるアドレス）は経由点として残すが、その先は展開しない
+            if (address != side.root and budget.max_degree_per_node is not None
+                    and len(neighbours) > budget.max_degree_per_node):
+                hubs.add(address)
+                budget.truncate(TRUNCATED_MAX_DEGREE)
+                continue
+            for counterparty in neighbours:
+                if counterparty not in side.depth:
+                    side.depth[counterparty] = side.level + 1
+                    side.parents[counterparty] = {address}
+                    next_frontier.append(counterparty)
+                elif side.depth[counterparty] == side.level + 1:
+                    side.parents[counterparty].add(address)
+
+        side.level += 1
+        side.frontier = next_frontier
+        # 両側のフロンティアが出会い、k件のパスが見つかったら終了
+        if source_side.depth.keys() & target_side.depth.keys():
+            candidates = _candidate_paths(source_side, target_side, max_depth)
+            if len(candidates) >= k:
+                break
+        if budget.max_nodes is not None and len(source_side.depth) + len(target_side.depth) >= budget.max_nodes:
+            budget.truncate(TRUNCATED_MAX_NODES)
+            break
+
+    candidates = _candidate_paths(source_side, target_side, max_depth)
+    paths = _rank_paths(candidates, edges, directed, rank_by)[:k]
+    logger.info(
+        f"Found {len(paths)} paths between {source} and {target} after expanding {expanded} addresses"
+        + (f" ({len(failed)} failed)" if failed else "")
+    )
+    return _path_result(source_side.root, target_side.root, source, target, paths, hubs,
+                        expanded, failed, budget.reasons)
+
+
+def _candidate_paths(source_side: _SearchSide, target_side: _SearchSide,
+                     max_depth: int) -> List[List[str]]:
+    """
+    両側の訪問済みアドレスが重なったアドレスを経由するパスを、短い順に最大PATH_MAX_CANDIDATES件列挙する
+    """
+    meetings = sorted(
+        (source_side.depth[address] + target_side.depth[address], address)
+        for address in source_side.depth.keys() & target_side.depth.keys()
+        if source_side.depth[address] + target_side.depth[address] <= max_depth
+    )
+
+    def combined() -> Iterator[List[str]]:
+        for _, address in meetings:
+            for head in source_side.paths_to(address):
+                for tail in target_side.paths_to(address):
+                    yield head + tail[-2::-1]
+
+    candidates: List[List[str]] = []
+    seen: Set[Tuple[str, ...]] = set()
+    for path in itertools.islice(combined(), PATH_MAX_CANDIDATES):
+        key = tuple(path)
+        # 同じパスを別の合流点から見つけた場合や、同じアドレスを2回通るパスは除く
+        if key in seen or len(set(path)) != len(path):
+            continue
+        seen.add(key)
+        candidates.append(path)
+    return candidates
+
+
+def _rank_paths(candidates: List[List[str]], edges: Dict[Tuple[str, str], schemas.Transaction],
+                directed: bool, rank_by: str) -> List[schemas.TransactionPath]:
+    paths = []
+    for addresses in candidates:
+        links = []
+        for previous, current in zip(addresses, addresses[1:]):
+            # 向きを問わない場合は、逆向きのトランザクションも含めて最も金額の大きいものを使う
+            pairs = [(previous, current)] if directed else [(previous, current), (current, previous)]
+            hop_source, hop_target = max(
+                (pair for pair in pairs if pair in edges), key=lambda pair: edges[pair].value
+            )
+            links.append(_link(hop_source, hop_target, edges[(hop_source, hop_target)]))
+        values = [link.value for link in links]
+        paths.append(schemas.TransactionPath.construct(
+            addresses=addresses,
+            links=links,
+            length=len(links),
+            min_value=min(values),
+            total_value=sum(values),
+        ))
+
+    if rank_by == "value":
+        paths.sort(key=lambda path: (-path.min_value, path.length))
+    else:
+        paths.sort(key=lambda path: (path.length, -path.min_value))
+    return paths
+
+
+def _link(source: str, target: str, tx: schemas.Transaction) -> schemas.NetworkLink:
+    return schemas.NetworkLink.construct(
+        id=f"{source}_{target}_{tx.txid}",
+        source=source,
+        target=target,
+        value=tx.value,
+        timestamp=tx.timestamp,
+    )
+
+
+def _path_result(source: str, target: str, source_label: str, target_label: str,
+                 paths: List[schemas.TransactionPath], hubs: Set[str], expanded: int,
+                 failed: List[str], reasons: List[str]) -> schemas.PathResult:
+    """
+    パスと、すべてのパスを重ねたノード・リンク（グラフ表示用）をまとめる
+    """
+    nodes: Dict[str, schemas.NetworkNode] = {}
+    links: Dict[str, schemas.NetworkLink] = {}
+    for path in paths:
+        for address in path.addresses:
+            if address in nodes:
+                continue
+            if address == source:
+                nodes[address] = schemas.NetworkNode.construct(id=address, label=source_label, type="source")
+            elif address == target:
+                nodes[address] = schemas.NetworkNode.construct(id=address, label=target_label, type="focus")
+            else:
+                node_type = "hub" if address in hubs else "address"
+                nodes[address] = schemas.NetworkNode.construct(id=address, label=address, type=node_type)
+        for link in path.links:
+            links.setdefault(link.id, link)
+
+    return schemas.PathResult.construct(
+        source=source,
+        target=target,
+        paths=paths,
+        nodes=list(nodes.values()),
+        links=list(links.values()),
+        expanded_addresses=expanded,
+        failed_addresses=failed,
+        truncated=bool(reasons),
+        truncation_reasons=reasons,
+    )
+
@@ -0,0 +1,88 @@
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from .. import schemas
+from ..serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# 1回の書き込みにまとめる行数
+STREAM_BATCH_LINES = 500
+
+
+def _event(event: str, data: Any) -> str:
+    """
+    /network のNDJSONの1行（{"event": ..., "data": ...}）
+    """
+    return f'{{"event": "{event}", "data": {dumps(data).decode("utf-8")}}}\n'
+
+
+def _batched(lines: Iterable[str]) -> Iterator[str]:
+    batch: List[str] = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= STREAM_BATCH_LINES:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def stream_transactions(transactions: Iterable[Any]) -> Iterator[str]:
+    """
+    /transactions のNDJSON（1行に1件のトランザクション。スキーマまたは transaction_rows のdict）
+    """
+    return _batched(dumps(tx).decode("utf-8") + "\n" for tx in transactions)
+
+
+def stream_network_levels(
+    levels: Iterable[Tuple[int, List[schemas.NetworkNode], List[schemas.NetworkLink], List[str]]]
+) -> Iterator[str]:
+    """
+    BFSの階層ごとのノードとリンクを、階層が終わるたびにNDJSONとして返す
+
+    - {"event": "node", "data": NetworkNode}: ノード（同じidのノードが再度届いた場合は上書きする。ハブの判明時など）
+    - {"event": "link", "data": NetworkLink}: リンク
+    - {"event": "level", "data": {"depth", "nodes", "links"}}: 1階層分の送信の終わり
+    - {"event": "end", "data": {"truncated", "truncation_reasons"}}: ネットワーク全体の送信の終わり
+    - {"event": "error", "data": {"detail"}}: 途中でエラーが発生した場合（ストリームはここで終わる）
+    """
+    def lines() -> Iterator[str]:
+        reasons: List[str] = []
+        try:
+            for depth, nodes, links, reasons in levels:
+                for node in nodes:
+                    yield _event("node", node)
+                for link in links:
+                    yield _event("link", link)
+                yield _event("level", {"depth": depth, "nodes": len(nodes), "links": len(links)})
+        except Exception as e:
+            # ヘッダーは送信済みのため、ステータスコードではなくイベントとしてエラーを伝える
+            logger.exception("Error while streaming network")
+            yield _event("error", {"detail": str(e)})
+            return
+        yield _event("end", {"truncated": bool(reasons), "truncation_reasons": reasons})
+
+    return _batched(lines())
+
+
+def stream_network(network: schemas.NetworkResponse) -> Iterator[str]:
+    """
+    構築済みのネットワークを stream_network_levels と同じ形式で返す
+    （キャッシュ済み・集約・SQLでの構築など、階層ごとに返せない場合に使用）
+    """
+    def lines() -> Iterator[str]:
+        for node in network.nodes:
+            yield _event("node", node)
+        for link in network.links:
+            yield _event("link", link)
+        summary: Dict[str, Any] = {
+            "truncated": network.truncated,
+            "truncation_reasons": network.truncation_reasons,
+            "aggregated": network.aggregated,
+        }
+        yield _event("end", summary)
+
+    return _batched(lines())
@@ -0,0 +1,166 @@
+from datetime import datetime
+from typing import Any, Iterable, List, Optional
+
+from sqlalchemy import Integer, and_, case, cast, exists, false, func, literal, or_, select
+from sqlalchemy.orm import Session
+
+from ..database.models import AddressStats, Transaction
+
+
+def _transaction_filters(table, blockchain: str, start_datetime: Optional[datetime],
+                         end_datetime: Optional[datetime], min_amount: Optional[float]) -> List[Any]:
+    """
+    ブロックチェーン・期間・最小金額の条件（トラバーサルと辺の取得の両方に適用する）
+    """
+    filters = [table.c.blockchain == blockchain]
+    if start_datetime:
+        filters.append(table.c.timestamp >= start_datetime)
+    if end_datetime:
+        filters.append(table.c.timestamp <= end_datetime)
+    if min_amount is not None:
+        filters.append(table.c.value >= min_amount)
+    return filters
+
+
+def _is_hub(address_id, max_degree: Optional[int]):
+    """
+    address_statsの取引相手の数がmax_degreeを超えるアドレスかどうか
+    （max_degreeがNoneの場合は常に偽）
+    """
+    if max_degree is None:
+        return false()
+    stats = AddressStats.__table__
+    return exists().where(and_(stats.c.address_id == address_id, stats.c.counterparties > max_degree))
+
+
+def query_neighbourhood(db: Session, blockchain: str, address_id: int, depth: int,
+                        start_datetime: Optional[datetime] = None,
+                        end_datetime: Optional[datetime] = None,
+                        min_amount: Optional[float] = None,
+                        max_degree: Optional[int] = None,
+                        max_nodes: Optional[int] = None) -> List[Any]:
+    """
+    再帰CTEで、address_idから深さdepthまでの近傍に含まれるトランザクションを1回のクエリで取得
+
+    探索対象（深さ0〜depth-1）のアドレスに接続するトランザクションを返す。
+    期間と最小金額の条件はトラバーサル自体に適用されるため、条件を満たさない
+    トランザクションを経由したアドレスは探索されない。
+
+    トラバーサルは整数のアドレスIDだけで行い、返す行もfrom_address_id/to_address_idを持つ。
+    （アドレス文字列への変換は呼び出し側でシリアライズ時に行う）
+
+    Parameters:
+    - max_degree: address_statsの取引相手の数がこれを超えるアドレス（起点を除く）はハブとして
+      その先を探索せず、ハブのトランザクションは探索対象のアドレス同士を結ぶものだけを返す。
+      address_statsは期間の条件を適用しない集計のため、期間内の取引相手の数より多くなることがある。
+      返す行のfrom_hub/to_hubが、各端のアドレスがハブかどうかを示す。
+    - max_nodes: 探索対象とするアドレス数の上限（浅い階層から順に数える）
+    """
+    table = Transaction.__table__
+    filters = _transaction_filters(table, blockchain, start_datetime, end_datetime, min_amount)
+
+    # 深さ0: 起点アドレス（PostgreSQLで再帰部分と型を揃えるためINTEGERにキャストする）
+    frontier = select(
+        cast(literal(address_id), Integer).label("address_id"),
+        literal(0).label("level"),
+    ).cte("frontier", recursive=True)
+
+    # 深さn+1: 深さnのアドレス（ハブを除く）と取引した相手のアドレス
+    previous = frontier.alias("previous")
+    counterparty = case(
+        (table.c.from_address_id == previous.c.address_id, table.c.to_address_id),
+        else_=table.c.from_address_id,
+    )
+    step = (
+        select(counterparty, previous.c.level + 1)
+        .select_from(
+            previous.join(
+                table,
+                or_(table.c.from_address_id == previous.c.address_id,
+                    table.c.to_address_id == previous.c.address_id),
+            )
+        )
+        .where(and_(
+            previous.c.level < depth - 1,
+            or_(previous.c.level == 0, ~_is_hub(previous.c.address_id, max_degree)),
+            *filters,
+        ))
+    )
+    # UNIONにより(アドレス, 深さ)の重複は除かれるため、循環があっても行数は有限
+    frontier = frontier.union(step)
+
+    # 同じアドレスは複数の深さで現れるため、アドレスごとに最も浅い深さにまとめてから
+    # 浅い順に並べて上限を適用する（(アドレス, 深さ)の行数ではなくアドレス数で数える）
+    level = func.min(frontier.c.level).label("level")
+    expanded = (
+        select(frontier.c.address_id, level)
+        .where(frontier.c.level < depth)
+        .group_by(frontier.c.address_id)
+    )
+    if max_nodes is not None:
+        expanded = expanded.order_by(level, frontier.c.address_id).limit(max_nodes)
+    expanded = expanded.cte("expanded")
+    expanded_ids = select(expanded.c.address_id)
+    # ハブでないアドレスは全てのトランザクションを、ハブは探索対象同士を結ぶものだけを返す
+    open_ids = select(expanded.c.address_id).where(
+        or_(expanded.c.level == 0, ~_is_hub(expanded.c.address_id, max_degree))
+    )
+    edges = (
+        select(
+            table,
+            _is_hub(table.c.from_address_id, max_degree).label("from_hub"),
+            _is_hub(table.c.to_address_id, max_degree).label("to_hub"),
+        )
+        .where(
+            and_(
+                *filters,
+                or_(
+                    table.c.from_address_id.in_(open_ids),
+                    table.c.to_address_id.in_(open_ids),
+                    and_(table.c.from_address_id.in_(expanded_ids), table.c.to_address_id.in_(expanded_ids)),
+                ),
+            )
+        )
+        .order_by(table.c.timestamp, table.c.id)
+    )
+    return db.execute(edges).fetchall()
+
+
+def query_edge_aggregates(db: Session, blockchain: str, address_ids: Iterable[int],
+                          start_datetime: Optional[datetime] = None,
+                          end_datetime: Optional[datetime] = None,
+                          min_amount: Optional[float] = None) -> List[Any]:
+    """
+    探索対象のアドレスに接続するトランザクションを、(送信元, 送信先)ごとにGROUP BYで集約して取得
+
+    返す行は from_address_id, to_address_id, count, total_value, min_value, max_value,
+    first_timestamp, last_timestamp を持つ（first_timestampの昇順）。
+    """
+    table = Transaction.__table__
+    address_ids = list(address_ids)
+    if not address_ids:
+        return []
+
+    filters = _transaction_filters(table, blockchain, start_datetime, end_datetime, min_amount)
+    first_timestamp = func.min(table.c.timestamp).label("first_timestamp")
+    aggregates = (
+        select(
+            table.c.from_address_id,
+            table.c.to_address_id,
+            func.count().label("count"),
+            func.sum(table.c.value).label("total_value"),
+            func.min(table.c.value).label("min_value"),
+            func.max(table.c.value).label("max_value"),
+            first_timestamp,
+            func.max(table.c.timestamp).label("last_timestamp"),
+        )
+        .where(
+            and_(
+                *filters,
+                or_(table.c.from_address_id.in_(address_ids), table.c.to_address_id.in_(address_ids)),
+            )
+        )
+        .group_by(table.c.from_address_id, table.c.to_address_id)
+        .order_by(first_timestamp, table.c.from_address_id, table.c.to_address_id)
+    )
+    return db.execute(aggregates).fetchall()
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional, Union
 from datetime import datetime
 
 
@@ -23,10 +23,74 @@ class Transaction(BaseModel):
         orm_mode = True
 
 
+class AddressStats(BaseModel):
+    """
+    アドレスごとの保存済みトランザクションの集計（address_statsテーブル）
+    """
+    blockchain: str
+    address: str
+    tx_count: int
+    in_count: int
+    out_count: int
+    in_volume: float
+    out_volume: float
+    # 受取額 - 送金額
+    net_volume: float
+    counterparties: int
+    first_seen: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
+    max_transfer: float
+
+
+class TimeSeriesPoint(BaseModel):
+    # 集計の単位（時・日・週）の開始日時
+    timestamp: datetime
+    inflow: float
+    outflow: float
+    # inflow - outflow
+    net: float
+    count: int
+
+
+class TimeSeries(BaseModel):
+    """
+    アドレスの受取額・送金額・件数の時系列（取引のない単位は含めない）
+    """
+    blockchain: str
+    address: str
+    bucket: str  # "hour", "day", "week"
+    points: List[TimeSeriesPoint]
+
+
+class TimeSeriesRequest(BaseModel):
+    """
+    複数のアドレス（ネットワークのノードなど）の時系列をまとめて取得する際のパラメータ
+    """
+    addresses: List[str] = Field(..., min_items=1)
+    bucket: str = Field("day", regex="^(hour|day|week)$")
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+
+class NodeMetrics(BaseModel):
+    """
+    グラフ分析によるノードの指標（/network?analytics=true の場合のみ設定）
+    """
+    pagerank: float
+    in_strength: float
+    out_strength: float
+    # 媒介中心性（起点を抽出した近似値、0〜1に正規化。/network?analytics_betweenness=true の場合のみ）
+    betweenness: Optional[float] = None
+    # 弱連結成分とコミュニティの番号（大きい順に0から）
+    component: int
+    community: int
+
+
 class NetworkNode(BaseModel):
     id: str
     label: str
-    type: str  # "source", "address"
+    type: str  # "source", "address", "hub", "focus"
+    metrics: Optional[NodeMetrics] = None
 
 
 class NetworkLink(BaseModel):
@@ -40,3 +104,130 @@ class NetworkLink(BaseModel):
 class TransactionNetwork(BaseModel):
     nodes: List[NetworkNode]
     links: List[NetworkLink]
+    aggregated: bool = False
+    # 探索の予算によって打ち切られたかどうかと、その理由
+    # （"max_nodes", "max_upstream_calls", "max_degree_per_node"）
+    truncated: bool = False
+    truncation_reasons: List[str] = []
+
+
+class AggregatedNetworkLink(BaseModel):
+    """
+    同じ(送信元, 送信先)の間のトランザクションをまとめた重み付きリンク
+    """
+    id: str
+    source: str
+    target: str
+    # 描画用の重み（total_valueと同じ値）
+    value: float
+    count: int
+    total_value: float
+    min_value: float
+    max_value: float
+    first_timestamp: datetime
+    last_timestamp: datetime
+
+
+class AggregatedTransactionNetwork(BaseModel):
+    nodes: List[NetworkNode]
+    links: List[AggregatedNetworkLink]
+    aggregated: bool = True
+    truncated: bool = False
+    truncation_reasons: List[str] = []
+
+
+# /network のレスポンス（aggregate=trueの場合はリンクをまとめたネットワーク）
+NetworkResponse = Union[TransactionNetwork, AggregatedTransactionNetwork]
+
+
+class TransactionPath(BaseModel):
+    """
+    2つのアドレスを結ぶパス（addressesは起点から終点の順）
+    """
+    addresses: List[str]
+    # 各ホップのトランザクション（同じアドレスの間に複数ある場合は金額が最大のもの）
+    links: List[NetworkLink]
+    length: int
+    # パス上の金額の最小値（パスに沿って流せる金額の目安）と合計
+    min_value: float
+    total_value: float
+
+
+class PathResult(BaseModel):
+    source: str
+    target: str
+    paths: List[TransactionPath]
+    # すべてのパスを重ねたノードとリンク（グラフ表示用）
+    nodes: List[NetworkNode]
+    links: List[NetworkLink]
+    # 探索で展開したアドレス数（両側の合計。取得に失敗したアドレスは含まない）
+    expanded_addresses: int
+    # トランザクションの取得に失敗したため展開できなかったアドレス
+    failed_addresses: List[str] = []
+    truncated: bool = False
+    truncation_reasons: List[str] = []
+
+
+class NetworkExpandRequest(BaseModel):
+    """
+    ノードの展開のパラメータ（期間・最小金額・予算は /network のクエリパラメータと同じ意味）
+    """
+    node: str
+    # クライアントが既に持っているノード・リンクのID（これらはレスポンスに含めない）
+    known_nodes: List[str] = []
+    known_links: List[str] = []
+    # 前回の展開で返されたセッションID（省略した場合や期限切れの場合は新しいセッションを作成する）
+    session_id: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    min_amount: Optional[float] = None
+    max_nodes: Optional[int] = Field(None, ge=1)
+    max_upstream_calls: Optional[int] = Field(None, ge=0)
+    max_degree_per_node: Optional[int] = Field(None, ge=1)
+    rank_by: str = Field("value", regex="^(value|recency)$")
+
+
+class NetworkDelta(BaseModel):
+    """
+    ノードの展開で新たに追加されたノードとリンク（ハブと判明したノードはtypeを"hub"にして再度含める）
+    """
+    session_id: str
+    node: str
+    # トランザクションを読み出して展開したかどうか（展開済みのアドレスや取得に失敗した場合はfalse）
+    expanded: bool
+    nodes: List[NetworkNode]
+    links: List[NetworkLink]
+    truncated: bool = False
+    truncation_reasons: List[str] = []
+
+
+class NetworkJobRequest(BaseModel):
+    """
+    非同期ネットワーク構築ジョブのパラメータ（/network のクエリパラメータと同じ意味）
+    """
+    depth: int = Field(1, ge=1, le=3)
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    min_amount: Optional[float] = None
+    second_address: Optional[str] = None
+    traversal: str = Field("bfs", regex="^(bfs|sql)$")
+    aggregate: bool = False
+    max_nodes: Optional[int] = Field(None, ge=1)
+    max_upstream_calls: Optional[int] = Field(None, ge=0)
+    max_degree_per_node: Optional[int] = Field(None, ge=1)
+    rank_by: str = Field("value", regex="^(value|recency)$")
+
+
+class CrawlJob(BaseModel):
+    id: str
+    blockchain: str
+    address: str
+    status: str  # "queued", "running", "completed", "failed"
+    addresses_done: int
+    addresses_remaining: int
+    upstream_calls: int
+    created_at: datetime
+    updated_at: datetime
+    error: Optional[str] = None
+    # 実行中は途中結果（最後に展開を終えた階層までのネットワーク）、完了後は最終結果
+    result: Optional[NetworkResponse] = None
@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Union
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from . import schemas
+
+try:
+    import orjson
+except ImportError:  # orjsonがない環境では標準のjsonで同じ形式を出力する
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# 高速なシリアライズ（Pydanticによるレスポンスの検証を省略）を使用するエンドポイント
+# カンマ区切りで "transactions", "network", "edge", "timeseries" を指定する（既定は空で、全エンドポイントで検証を行う）
+# 出力がresponse_modelで検証した場合と一致することは tests/test_serialization.py で確認している
+FAST_SERIALIZATION_ENDPOINTS = {
+    name.strip()
+    for name in os.getenv("FAST_SERIALIZATION_ENDPOINTS", "").split(",")
+    if name.strip()
+}
+
+# スキーマのフィールドとNULLの場合の既定値（DBの行から直接レスポンスを組み立てる際に使用）
+TRANSACTION_FIELDS = tuple(schemas.Transaction.__fields__)
+_TRANSACTION_DEFAULTS = {
+    name: field.default
+    for name, field in schemas.Transaction.__fields__.items()
+    if field.default is not None
+}
+
+
+def fast_serialization_enabled(endpoint: str) -> bool:
+    return endpoint in FAST_SERIALIZATION_ENDPOINTS
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, BaseModel):
+        return value.__dict__
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    dict・list・datetime・構築済みのモデルをJSONのバイト列に変換する
+    （datetimeはPydanticの.json()と同じISO形式）
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def transaction_rows(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """
+    cached_transactions_query などの結果の行を、Transactionスキーマと同じ形のdictに変換する
+
+    各行をTransactionモデルとして検証せず、列の値をそのまま使用する。
+    """
+    transactions = []
+    for row in rows:
+        mapping = row._mapping
+        transaction = {name: mapping.get(name) for name in TRANSACTION_FIELDS}
+        for name, default in _TRANSACTION_DEFAULTS.items():
+            if transaction[name] is None:
+                transaction[name] = default
+        transactions.append(transaction)
+    return transactions
+
+
+def network_content(network: Union[schemas.NetworkResponse, schemas.NetworkDelta]) -> Dict[str, Any]:
+    """
+    構築済みのネットワーク（またはノードの展開の差分）をレスポンスのdictに変換する（ノード・リンクはモデルの値をそのまま使用）
+    """
+    content = dict(network.__dict__)
+    content["nodes"] = [node.__dict__ for node in network.nodes]
+    content["links"] = [link.__dict__ for link in network.links]
+    return content
+
+
+def timeseries_content(series: List[schemas.TimeSeries]) -> List[Dict[str, Any]]:
+    """
+    集計済みの時系列をレスポンスのdictに変換する（各点はモデルの値をそのまま使用）
+    """
+    content = []
+    for item in series:
+        entry = dict(item.__dict__)
+        entry["points"] = [point.__dict__ for point in item.points]
+        content.append(entry)
+    return content
+
+
+class FastJSONResponse(Response):
+    """
+    response_modelによる検証を行わず、dumpsでそのままJSONに変換するレスポンス
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
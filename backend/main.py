@@ -1,14 +1,40 @@
 from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from dateutil import parser
+import json
 import logging
 
 from app.database import models, database
 from app import schemas
-from app.blockchain import BitcoinService, EthereumService
+from app.blockchain import BitcoinService, EthereumService, TransactionFilter
+from app.network import (
+    NDJSON_MEDIA_TYPE,
+    CrawlJobManager,
+    TraversalBudget,
+    analytics_available,
+    analyze_network,
+    build_transaction_network,
+    expand_network_node,
+    exploration_sessions,
+    find_transaction_paths,
+    iter_transaction_network,
+    network_cache,
+    stream_network,
+    stream_network_levels,
+    stream_transactions,
+)
+from app.api.scheduler import get_scheduler_stats
+from app.serialization import (
+    FastJSONResponse,
+    fast_serialization_enabled,
+    network_content,
+    timeseries_content,
+    transaction_rows,
+)
 from app.config import CORS_ORIGINS, DEBUG
 
 # データベース初期化
@@ -38,17 +64,59 @@ def get_db():
         db.close()
 
 
+# ブロックチェーンサービスの生成関数（サービスとAPIクライアントはリクエスト間で再利用する）
+_service_classes = {
+    "bitcoin": BitcoinService,
+    "ethereum": EthereumService,
+}
+_services = {}
+
+
 # ブロックチェーンサービスのファクトリー関数
 def get_blockchain_service(blockchain: str):
     """指定されたブロックチェーンのサービスインスタンスを返す"""
-    if blockchain == "bitcoin":
-        return BitcoinService()
-    elif blockchain == "ethereum":
-        return EthereumService()
-    else:
+    if blockchain not in _service_classes:
         raise HTTPException(
             status_code=400, detail=f"Unsupported blockchain: {blockchain}"
         )
+    if blockchain not in _services:
+        _services[blockchain] = _service_classes[blockchain]()
+    return _services[blockchain]
+
+
+def _parse_date(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        # タイムゾーン情報を削除して比較可能にする
+        return parser.parse(value).replace(tzinfo=None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} format")
+
+
+def parse_date_range(start_date: Optional[str], end_date: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    start_date / end_date（クエリパラメータまたはリクエストボディの文字列）を日時に変換する
+    （形式が不正な場合は400を返す）
+    """
+    return _parse_date(start_date, "start_date"), _parse_date(end_date, "end_date")
+
+
+# 非同期のネットワーク構築ジョブ
+crawl_jobs = CrawlJobManager(database.SessionLocal, get_blockchain_service)
+
+
+@app.on_event("startup")
+def resume_crawl_jobs():
+    # 前回の実行で完了しなかったジョブを再開（取得済みのトランザクションはDBから読み込まれる）
+    crawl_jobs.resume()
+    # 実行中に停止したジョブ（他のワーカーのプロセスが終了した場合など）を定期的に再開する
+    crawl_jobs.start_sweeper()
+
+
+@app.on_event("shutdown")
+def stop_crawl_jobs():
+    crawl_jobs.shutdown()
 
 
 @app.get("/")
@@ -56,6 +124,30 @@ def read_root():
     return {"message": "Blockchain Transaction Visualizer API"}
 
 
+@app.get("/status/upstream")
+def get_upstream_status():
+    """
+    上流APIごとのレート制限キューの状態（キューの深さ・待機時間）を取得
+    """
+    return get_scheduler_stats()
+
+
+@app.get("/status/cache")
+def get_cache_status():
+    """
+    構築済みネットワークのキャッシュの状態（ヒット数・ミス数など）を取得
+    """
+    return network_cache.stats()
+
+
+@app.get("/status/explore")
+def get_explore_status():
+    """
+    ノードの展開に使用する探索セッションの状態（セッション数・再利用回数など）を取得
+    """
+    return exploration_sessions.stats()
+
+
 @app.get(
     "/transactions/{blockchain}/{address}", response_model=List[schemas.Transaction]
 )
@@ -65,6 +157,7 @@ def get_transactions(
     start_date: str = Query(None),
     end_date: str = Query(None),
     second_address: str = Query(None),
+    format: str = Query("json", regex="^(json|ndjson)$"),
     db: Session = Depends(get_db),
 ):
     """
@@ -74,6 +167,7 @@ def get_transactions(
     - start_date: 開始日 (ISO形式: YYYY-MM-DD)
     - end_date: 終了日 (ISO形式: YYYY-MM-DD)
     - second_address: 特定のアドレスとの間のトランザクションのみを取得する場合に指定
+    - format: "ndjson" の場合、全件をメモリに載せずに1行1件のNDJSONとして順に返す
     """
     logger.info(f"Fetching transactions for blockchain: {blockchain}, address: {address}, start_date: {start_date}, end_date: {end_date}, second_address: {second_address}")
     # パラメータの検証
@@ -93,53 +187,54 @@ def get_transactions(
             )
 
     # 日付パラメータの処理
-    start_datetime = None
-    end_datetime = None
-
-    if start_date:
-        try:
-            parsed_date = parser.parse(start_date)
-            # タイムゾーン情報を削除して比較可能にする
-            start_datetime = parsed_date.replace(tzinfo=None)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid start_date format")
-
-    if end_date:
-        try:
-            parsed_date = parser.parse(end_date)
-            # タイムゾーン情報を削除して比較可能にする
-            end_datetime = parsed_date.replace(tzinfo=None)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid end_date format")
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
 
     # 適切なブロックチェーンサービスを取得
     blockchain_service = get_blockchain_service(blockchain)
+
+    # 特定のアドレスとの間のトランザクションのみを、DBからの読み出し時に絞り込む
+    filters = TransactionFilter(counterparty=second_address) if second_address else None
+
+    if format == "ndjson":
+        # 未取得の期間の取得はここで終え、保存済みの行を少しずつ読み出しながら返す
+        transactions = blockchain_service.iter_transactions(
+            address=address,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            db=db,
+            depth=1,
+            filters=filters,
+        )
+        return StreamingResponse(stream_transactions(transactions), media_type=NDJSON_MEDIA_TYPE)
     
+    # DBの行から直接JSONを組み立てる（トランザクションごとのスキーマの生成と検証を省略）
+    if fast_serialization_enabled("transactions"):
+        rows = blockchain_service.get_transaction_rows(
+            address=address,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            db=db,
+            depth=1,
+            filters=filters,
+        )
+        logger.info(f"Fetched {len(rows)} transactions for address: {address}")
+        return FastJSONResponse(transaction_rows(rows))
+
     # サービスを使用してトランザクションを取得
     transactions = blockchain_service.get_transactions(
         address=address,
         start_datetime=start_datetime,
         end_datetime=end_datetime,
         db=db,
-        depth=1  # 通常のトランザクション取得では深度1として扱う
+        depth=1,  # 通常のトランザクション取得では深度1として扱う
+        filters=filters,
     )
     
-    # 特定のアドレスとの間のトランザクションのみをフィルタリング
-    if second_address:
-        second_address_lower = second_address.lower()
-        filtered_transactions = [
-            tx for tx in transactions 
-            if (tx.from_address.lower() == second_address_lower and tx.to_address.lower() == address.lower()) or
-               (tx.from_address.lower() == address.lower() and tx.to_address.lower() == second_address_lower)
-        ]
-        logger.info(f"Filtered to {len(filtered_transactions)} transactions between {address} and {second_address}")
-        return filtered_transactions
-    
     logger.info(f"Fetched {len(transactions)} transactions for address: {address}")
     return transactions
 
 
-@app.get("/network/{blockchain}/{address}", response_model=schemas.TransactionNetwork)
+@app.get("/network/{blockchain}/{address}", response_model=schemas.NetworkResponse)
 def get_transaction_network(
     blockchain: str,
     address: str,
@@ -148,6 +243,16 @@ def get_transaction_network(
     end_date: str = Query(None),
     min_amount: float = Query(None),
     second_address: str = Query(None),
+    traversal: str = Query("bfs", regex="^(bfs|sql)$"),
+    aggregate: bool = Query(False),
+    max_nodes: int = Query(None, ge=1),
+    max_upstream_calls: int = Query(None, ge=0),
+    max_degree_per_node: int = Query(None, ge=1),
+    rank_by: str = Query("value", regex="^(value|recency)$"),
+    format: str = Query("json", regex="^(json|ndjson)$"),
+    analytics: bool = Query(False),
+    analytics_weight: str = Query("value", regex="^(value|count)$"),
+    analytics_betweenness: bool = Query(False),
     db: Session = Depends(get_db),
 ):
     """
@@ -158,12 +263,30 @@ def get_transaction_network(
     - start_date: 開始日 (ISO形式)
     - end_date: 終了日 (ISO形式)
     - min_amount: 最小取引金額（この金額以上のトランザクションのみを表示）
+    - traversal: 構築方式（"bfs": 階層ごとに取得, "sql": 再帰CTEでDBから一括取得し、未取得のアドレスのみ上流APIから取得）
+    - aggregate: trueの場合、同じ送信元・送信先のリンクを1本にまとめ、件数・合計・最小・最大金額と最初・最後の日時を返す
+      （個々のトランザクションは /edge/{blockchain}/{source}/{target} で取得）
+    - max_nodes: ネットワークに含めるノード数の上限
+    - max_upstream_calls: 上流APIから取得するアドレス数の上限
+    - max_degree_per_node: これより多くの相手と取引したアドレスは "hub" として展開しない
+    - rank_by: 予算内で優先して展開するアドレスの基準（"value": 取引金額の合計, "recency": 最新の取引日時）
+
+    - format: "ndjson" の場合、ノードとリンクをNDJSONで返す（traversal=bfsで集約・second_addressなしの場合は、
+      BFSの階層が終わるたびに順に返す）
+    - analytics: trueの場合、構築したグラフの各ノードにPageRank・受取/送金の重みの合計・
+      連結成分・コミュニティの番号を metrics として設定する（グラフ全体が必要なため、階層ごとのNDJSONでは返さない）
+    - analytics_weight: 分析に使用するリンクの重み（"value": 金額, "count": トランザクション数）
+    - analytics_betweenness: trueの場合、metricsに媒介中心性（近似）も設定する（大きなグラフでは他の指標より時間がかかる）
+
+    予算によって探索を打ち切った場合は、truncated と truncation_reasons で理由を返す。
     """
     logger.info(f"Fetching transaction network for blockchain: {blockchain}, address: {address}, depth: {depth}, start_date: {start_date}, end_date: {end_date}, min_amount: {min_amount}, second_address: {second_address}")
     if blockchain not in ["bitcoin", "ethereum"]:
         raise HTTPException(
             status_code=400, detail="Supported blockchains are 'bitcoin' and 'ethereum'"
         )
+    if analytics and not analytics_available():
+        raise HTTPException(status_code=501, detail="Network analytics requires numpy and scipy")
         
     # 第二アドレスの検証（指定されている場合）
     if second_address and blockchain == "bitcoin":
@@ -176,141 +299,380 @@ def get_transaction_network(
             )
 
     # 日付パラメータの処理
-    start_datetime = None
-    end_datetime = None
-
-    if start_date:
-        try:
-            parsed_date = parser.parse(start_date)
-            start_datetime = parsed_date.replace(tzinfo=None)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid start_date format")
-
-    if end_date:
-        try:
-            parsed_date = parser.parse(end_date)
-            end_datetime = parsed_date.replace(tzinfo=None)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid end_date format")
-
-    # アドレスを小文字に正規化
-    normalized_address = address.lower()
-    
-    # 初期ネットワーク構造
-    network = schemas.TransactionNetwork(
-        nodes=[schemas.NetworkNode(id=normalized_address, label=address, type="source")], links=[]
-    )
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
 
-    # 探索済みアドレス（小文字に正規化）
-    explored_addresses = set([normalized_address])
-    # 探索予定アドレス（深さごと）
-    to_explore = {0: [normalized_address]}
-    
     # 適切なブロックチェーンサービスを取得
     blockchain_service = get_blockchain_service(blockchain)
 
-    for current_depth in range(depth):
-        if current_depth not in to_explore or not to_explore[current_depth]:
-            break
-
-        next_depth = current_depth + 1
-        if next_depth not in to_explore:
-            to_explore[next_depth] = []
-
-        for current_address in to_explore[current_depth]:
-            try:
-                # このアドレスの取引を取得
-                transactions = blockchain_service.get_transactions(
-                    address=current_address,
-                    start_datetime=start_datetime,
-                    end_datetime=end_datetime,
-                    db=db,
-                    depth=depth,  # 探索深度を渡す
-                )
-            except HTTPException as e:
-                # アドレス検証エラーなどの場合はスキップして次のアドレスへ
-                logger.warning(f"Error fetching transactions for address {current_address}: {e.detail}")
-                continue
-
-            for tx in transactions:
-                # 最小金額でフィルタリング
-                if min_amount is not None and tx.value < min_amount:
-                    continue
-
-                # アドレスを小文字に正規化
-                from_address_normalized = tx.from_address.lower()
-                to_address_normalized = tx.to_address.lower()
-                
-                # 送信元
-                if from_address_normalized not in explored_addresses:
-                    network.nodes.append(
-                        schemas.NetworkNode(
-                            id=from_address_normalized, label=tx.from_address, type="address"
-                        )
-                    )
-                    explored_addresses.add(from_address_normalized)
-                    if next_depth < depth:
-                        to_explore[next_depth].append(from_address_normalized)
-
-                # 送信先
-                if to_address_normalized not in explored_addresses:
-                    network.nodes.append(
-                        schemas.NetworkNode(
-                            id=to_address_normalized, label=tx.to_address, type="address"
-                        )
-                    )
-                    explored_addresses.add(to_address_normalized)
-                    if next_depth < depth:
-                        to_explore[next_depth].append(to_address_normalized)
-
-                # リンク（各トランザクションごとに独自のリンク）
-                link_id = f"{from_address_normalized}_{to_address_normalized}_{tx.txid}"
-                network.links.append(
-                    schemas.NetworkLink(
-                        id=link_id,
-                        source=from_address_normalized,
-                        target=to_address_normalized,
-                        value=tx.value,
-                        timestamp=tx.timestamp,
-                    )
-                )
-    # 特定のアドレスとの間のトランザクションのみをフィルタリング
-    if second_address:
-        second_address_normalized = second_address.lower()
-        
-        # second_addressがノードに含まれていない場合は追加
-        if second_address_normalized not in explored_addresses:
-            network.nodes.append(
-                schemas.NetworkNode(
-                    id=second_address_normalized, label=second_address, type="focus"
-                )
-            )
-            explored_addresses.add(second_address_normalized)
-        else:
-            # 既存のノードのタイプを変更
-            for node in network.nodes:
-                if node.id == second_address_normalized:
-                    node.type = "focus"
-                    break
-        
-        # 中心アドレスと指定アドレス間のリンクのみをフィルタリング
-        filtered_links = [
-            link for link in network.links
-            if (link.source == normalized_address and link.target == second_address_normalized) or
-               (link.source == second_address_normalized and link.target == normalized_address)
-        ]
-        
-        # 関連するノードのみを保持
-        relevant_nodes = {normalized_address, second_address_normalized}
-        
-        # フィルタリングされたネットワークを作成
-        filtered_network = schemas.TransactionNetwork(
-            nodes=[node for node in network.nodes if node.id in relevant_nodes],
-            links=filtered_links
+    budget = TraversalBudget(
+        max_nodes=max_nodes,
+        max_upstream_calls=max_upstream_calls,
+        max_degree_per_node=max_degree_per_node,
+        rank_by=rank_by,
+    )
+
+    # BFSの階層が終わるたびに、新たに追加されたノードとリンクを返す
+    if format == "ndjson" and traversal == "bfs" and not aggregate and not second_address and not analytics:
+        levels = iter_transaction_network(
+            blockchain_service,
+            address,
+            depth,
+            session_factory=database.SessionLocal,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            min_amount=min_amount,
+            budget=budget,
         )
-        
-        logger.info(f"Filtered network to {len(filtered_network.nodes)} nodes and {len(filtered_network.links)} links between {address} and {second_address}")
-        return filtered_network
-    
+        return StreamingResponse(stream_network_levels(levels), media_type=NDJSON_MEDIA_TYPE)
+
+    # 深さごとのアドレスを並行取得しながらネットワークを構築
+    network = build_transaction_network(
+        blockchain_service,
+        address,
+        depth,
+        session_factory=database.SessionLocal,
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        min_amount=min_amount,
+        second_address=second_address,
+        traversal=traversal,
+        aggregate=aggregate,
+        budget=budget,
+    )
+
     logger.info(f"Fetched network with {len(network.nodes)} nodes and {len(network.links)} links for address: {address}")
+    if analytics:
+        network = analyze_network(network, weight=analytics_weight, betweenness=analytics_betweenness)
+    if format == "ndjson":
+        return StreamingResponse(stream_network(network), media_type=NDJSON_MEDIA_TYPE)
+    if fast_serialization_enabled("network"):
+        return FastJSONResponse(network_content(network))
     return network
+
+
+@app.get("/stats/{blockchain}/{address}", response_model=schemas.AddressStats)
+def get_address_stats(blockchain: str, address: str, db: Session = Depends(get_db)):
+    """
+    アドレスの保存済みトランザクションの集計（受取・送金の件数と金額、取引相手の数、最初・最後の取引日時、
+    1回の取引の最大金額）を取得
+    - blockchain: "bitcoin" または "ethereum"
+    - address: ウォレットアドレス
+
+    トランザクションの保存時に更新した集計を返すため、取引履歴を読み出さない（上流APIへの問い合わせも行わない）。
+    /transactions や /network で取得済みの期間のトランザクションが対象。
+    """
+    if blockchain not in ["bitcoin", "ethereum"]:
+        raise HTTPException(
+            status_code=400, detail="Supported blockchains are 'bitcoin' and 'ethereum'"
+        )
+
+    blockchain_service = get_blockchain_service(blockchain)
+    blockchain_service.validate_address(address)
+    stats = blockchain_service.get_address_stats(address, db)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No stored transactions for address: {address}")
+    return stats
+
+
+@app.get("/timeseries/{blockchain}/{address}", response_model=schemas.TimeSeries)
+def get_volume_timeseries(
+    blockchain: str,
+    address: str,
+    bucket: str = Query("day", regex="^(hour|day|week)$"),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+    db: Session = Depends(get_db),
+):
+    """
+    アドレスの受取額・送金額・差額・件数を期間の単位ごとに集計した時系列を取得
+    - blockchain: "bitcoin" または "ethereum"
+    - address: ウォレットアドレス
+    - bucket: 集計の単位（"hour", "day", "week"。週は月曜日始まり）
+    - start_date: 開始日 (ISO形式)
+    - end_date: 終了日 (ISO形式)
+
+    未取得の期間は /transactions と同様に上流APIから取得する。集計はデータベース側で行い、取引履歴は返さない。
+    """
+    if blockchain not in ["bitcoin", "ethereum"]:
+        raise HTTPException(
+            status_code=400, detail="Supported blockchains are 'bitcoin' and 'ethereum'"
+        )
+
+    # 日付パラメータの処理
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
+
+    blockchain_service = get_blockchain_service(blockchain)
+    series = blockchain_service.get_volume_timeseries(
+        address, bucket, db, start_datetime=start_datetime, end_datetime=end_datetime
+    )
+    logger.info(f"Aggregated {len(series.points)} {bucket} buckets for address: {address}")
+    if fast_serialization_enabled("timeseries"):
+        return FastJSONResponse(timeseries_content([series])[0])
+    return series
+
+
+@app.post("/timeseries/{blockchain}", response_model=List[schemas.TimeSeries])
+def get_volume_timeseries_many(blockchain: str, request: schemas.TimeSeriesRequest,
+                               db: Session = Depends(get_db)):
+    """
+    複数のアドレス（ネットワークのノード全体など）の時系列をまとめて取得
+    - blockchain: "bitcoin" または "ethereum"
+    - リクエストボディ:
+      - addresses: 集計するアドレスの一覧
+      - bucket / start_date / end_date: /timeseries/{blockchain}/{address} と同じ
+
+    保存済みのトランザクションのみを集計し、上流APIへの問い合わせは行わない（/network で取得済みのノードに使用する）。
+    """
+    if blockchain not in ["bitcoin", "ethereum"]:
+        raise HTTPException(
+            status_code=400, detail="Supported blockchains are 'bitcoin' and 'ethereum'"
+        )
+
+    # 日付パラメータの処理
+    start_datetime, end_datetime = parse_date_range(request.start_date, request.end_date)
+
+    blockchain_service = get_blockchain_service(blockchain)
+    series = blockchain_service.get_volume_timeseries_many(
+        request.addresses, request.bucket, db, start_datetime=start_datetime, end_datetime=end_datetime
+    )
+    logger.info(f"Aggregated {request.bucket} time series for {len(series)} addresses")
+    if fast_serialization_enabled("timeseries"):
+        return FastJSONResponse(timeseries_content(series))
+    return series
+
+
+@app.post("/network/{blockchain}/{address}/expand", response_model=schemas.NetworkDelta)
+def expand_network(blockchain: str, address: str, request: schemas.NetworkExpandRequest):
+    """
+    /network で取得したグラフのノードを1ホップ展開し、新たに追加されたノードとリンクのみを返す
+    - blockchain: "bitcoin" または "ethereum"
+    - address: グラフの中心アドレス
+    - リクエストボディ:
+      - node: 展開するアドレス
+      - known_nodes / known_links: クライアントが既に持っているノード・リンクのID
+      - session_id: 前回の展開で返されたセッションID（同じグラフの展開では毎回指定する）
+      - start_date / end_date / min_amount / max_nodes / max_upstream_calls / max_degree_per_node / rank_by:
+        /network と同じ
+
+    サーバー側のセッションにこれまでに返したノード・リンクを記録するため、2回目以降の展開では
+    known_nodes / known_links を省略しても差分のみを返す。セッションが期限切れの場合は、
+    known_nodes / known_links から作り直す。
+    """
+    if blockchain not in ["bitcoin", "ethereum"]:
+        raise HTTPException(
+            status_code=400, detail="Supported blockchains are 'bitcoin' and 'ethereum'"
+        )
+
+    blockchain_service = get_blockchain_service(blockchain)
+    blockchain_service.validate_address(request.node)
+
+    # 日付パラメータの処理
+    start_datetime, end_datetime = parse_date_range(request.start_date, request.end_date)
+
+    budget = TraversalBudget(
+        max_nodes=request.max_nodes,
+        max_upstream_calls=request.max_upstream_calls,
+        max_degree_per_node=request.max_degree_per_node,
+        rank_by=request.rank_by,
+    )
+    delta = expand_network_node(
+        blockchain_service,
+        address,
+        request.node,
+        session_factory=database.SessionLocal,
+        known_nodes=request.known_nodes,
+        known_links=request.known_links,
+        session_id=request.session_id,
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        min_amount=request.min_amount,
+        budget=budget,
+    )
+    if fast_serialization_enabled("network"):
+        return FastJSONResponse(network_content(delta))
+    return delta
+
+
+@app.get("/edge/{blockchain}/{source}/{target}", response_model=List[schemas.Transaction])
+def get_edge_transactions(
+    blockchain: str,
+    source: str,
+    target: str,
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+    min_amount: float = Query(None),
+    db: Session = Depends(get_db),
+):
+    """
+    集約されたリンク1本分（sourceからtargetへ）のトランザクションを取得
+    - blockchain: "bitcoin" または "ethereum"
+    - source: 送信元のアドレス
+    - target: 送信先のアドレス
+    - start_date: 開始日 (ISO形式)
+    - end_date: 終了日 (ISO形式)
+    - min_amount: 最小取引金額
+
+    /network で取得済みのトランザクションのみを返す（上流APIへの問い合わせは行わない）。
+    """
+    if blockchain not in ["bitcoin", "ethereum"]:
+        raise HTTPException(
+            status_code=400, detail="Supported blockchains are 'bitcoin' and 'ethereum'"
+        )
+
+    # 日付パラメータの処理
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
+
+    blockchain_service = get_blockchain_service(blockchain)
+    if fast_serialization_enabled("edge"):
+        rows = blockchain_service.get_edge_transaction_rows(
+            source,
+            target,
+            db,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            min_amount=min_amount,
+        )
+        logger.info(f"Fetched {len(rows)} transactions from {source} to {target}")
+        return FastJSONResponse(transaction_rows(rows))
+
+    transactions = blockchain_service.get_edge_transactions(
+        source,
+        target,
+        db,
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        min_amount=min_amount,
+    )
+    logger.info(f"Fetched {len(transactions)} transactions from {source} to {target}")
+    return transactions
+
+
+@app.get("/path/{blockchain}/{source}/{target}", response_model=schemas.PathResult)
+def get_transaction_paths(
+    blockchain: str,
+    source: str,
+    target: str,
+    max_depth: int = Query(4, ge=1, le=6),
+    k: int = Query(5, ge=1, le=50),
+    rank_by: str = Query("length", regex="^(length|value)$"),
+    directed: bool = Query(True),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+    min_amount: float = Query(None),
+    max_nodes: int = Query(None, ge=1),
+    max_upstream_calls: int = Query(None, ge=0),
+    max_degree_per_node: int = Query(None, ge=1),
+):
+    """
+    2つのアドレスを間接的に結ぶパスを、両端からの双方向BFSで探索して返す
+    - blockchain: "bitcoin" または "ethereum"
+    - source: 起点のアドレス
+    - target: 終点のアドレス
+    - max_depth: パスの最大ホップ数（1〜6）
+    - k: 返すパスの最大数
+    - rank_by: パスの並べ方（"length": ホップ数が少ない順, "value": パス上の最小金額が大きい順）
+    - directed: trueの場合、sourceからtargetへ資金が流れる向きのパスのみを探す
+    - start_date: 開始日 (ISO形式)
+    - end_date: 終了日 (ISO形式)
+    - min_amount: 最小取引金額
+    - max_nodes / max_upstream_calls / max_degree_per_node: 探索の予算（/network と同じ）
+
+    両側の探索が出会った時点で終了するため、片側から深さmax_depthまで展開するより展開するアドレスが少ない。
+    保存済みのトランザクションを使用し、未取得の期間のみ上流APIから取得する。
+    """
+    if blockchain not in ["bitcoin", "ethereum"]:
+        raise HTTPException(
+            status_code=400, detail="Supported blockchains are 'bitcoin' and 'ethereum'"
+        )
+
+    blockchain_service = get_blockchain_service(blockchain)
+    blockchain_service.validate_address(source)
+    blockchain_service.validate_address(target)
+    if blockchain_service.normalize_address(source) == blockchain_service.normalize_address(target):
+        raise HTTPException(status_code=400, detail="source and target must be different addresses")
+
+    # 日付パラメータの処理
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
+
+    budget = TraversalBudget(
+        max_nodes=max_nodes,
+        max_upstream_calls=max_upstream_calls,
+        max_degree_per_node=max_degree_per_node,
+    )
+    return find_transaction_paths(
+        blockchain_service,
+        source,
+        target,
+        session_factory=database.SessionLocal,
+        max_depth=max_depth,
+        k=k,
+        rank_by=rank_by,
+        directed=directed,
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        min_amount=min_amount,
+        budget=budget,
+    )
+
+
+@app.post("/jobs/network/{blockchain}/{address}", response_model=schemas.CrawlJob, status_code=202)
+def create_network_job(blockchain: str, address: str, request: schemas.NetworkJobRequest):
+    """
+    ネットワークの構築をバックグラウンドのジョブとして開始し、ジョブの状態を返す
+    - blockchain: "bitcoin" または "ethereum"
+    - address: 中心となるウォレットアドレス
+    - リクエストボディ: /network のクエリパラメータと同じ（depth, start_date, end_date, min_amount, ...）
+
+    進捗と途中結果・最終結果は GET /jobs/{job_id} で取得する。
+    """
+    if blockchain not in ["bitcoin", "ethereum"]:
+        raise HTTPException(
+            status_code=400, detail="Supported blockchains are 'bitcoin' and 'ethereum'"
+        )
+
+    # 日付パラメータの処理
+    start_datetime, end_datetime = parse_date_range(request.start_date, request.end_date)
+
+    job_id = crawl_jobs.submit(blockchain, address, {
+        "depth": request.depth,
+        "start_datetime": start_datetime.isoformat() if start_datetime else None,
+        "end_datetime": end_datetime.isoformat() if end_datetime else None,
+        "min_amount": request.min_amount,
+        "second_address": request.second_address,
+        "traversal": request.traversal,
+        "aggregate": request.aggregate,
+        "budget": {
+            "max_nodes": request.max_nodes,
+            "max_upstream_calls": request.max_upstream_calls,
+            "max_degree_per_node": request.max_degree_per_node,
+            "rank_by": request.rank_by,
+        },
+    })
+    return get_network_job(job_id)
+
+
+@app.get("/jobs/{job_id}", response_model=schemas.CrawlJob)
+def get_network_job(job_id: str):
+    """
+    ネットワーク構築ジョブの状態を取得
+    - status: "queued", "running", "completed", "failed"
+    - addresses_done / addresses_remaining / upstream_calls: 進捗
+    - result: 実行中は途中結果、完了後は最終結果のネットワーク
+    """
+    job = crawl_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    return schemas.CrawlJob(
+        id=job.id,
+        blockchain=job.blockchain,
+        address=job.address,
+        status=job.status,
+        addresses_done=job.addresses_done,
+        addresses_remaining=job.addresses_remaining,
+        upstream_calls=job.upstream_calls,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        error=job.error,
+        result=json.loads(job.result) if job.result else None,
+    )
@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import types
+
+import pytest
+
+# backendディレクトリをパスに追加して、appモジュールをインポートできるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app/config.pyは環境ごとに用意するため、ない場合はテスト用の設定を使用する
+# （TEST_DATABASE_URLを指定しない場合は一時ディレクトリのSQLiteを使用）
+try:
+    import app.config  # noqa: F401
+except ImportError:
+    config = types.ModuleType("app.config")
+    config.DATABASE_URL = os.getenv(
+        "TEST_DATABASE_URL",
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}",
+    )
+    config.BLOCKCYPHER_BASE_URL = "https://api.blockcypher.com/v1/btc/main"
+    config.BLOCKCYPHER_API_KEY = None
+    config.ETHERSCAN_BASE_URL = "https://api.etherscan.io/api"
+    config.ETHERSCAN_API_KEY = None
+    config.CORS_ORIGINS = ["*"]
+    config.DEBUG = False
+    sys.modules["app.config"] = config
+
+from app.blockchain.addresses import address_registry  # noqa: E402
+from app.database import database, models  # noqa: E402
+
+
+@pytest.fixture
+def engine():
+    """
+    テーブルを作成したエンジン（テストごとに作り直す）
+    """
+    models.Base.metadata.create_all(bind=database.engine)
+    yield database.engine
+    models.Base.metadata.drop_all(bind=database.engine)
+    address_registry.clear()
+
+
+@pytest.fixture
+def db(engine):
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
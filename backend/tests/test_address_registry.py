@@ -0,0 +1,48 @@
+from app.blockchain.addresses import address_registry
+from app.database import database
+
+
+def test_created_ids_are_not_cached_after_rollback(engine, db):
+    created = address_registry.get_ids(db, "ethereum", ["0xa", "0xb"], create=True)
+    assert set(created) == {"0xa", "0xb"}
+    db.rollback()
+
+    other = database.SessionLocal()
+    try:
+        assert address_registry.get_ids(other, "ethereum", ["0xa", "0xb"]) == {}
+        assert address_registry.get_addresses(other, created.values()) == {}
+    finally:
+        other.close()
+
+
+def test_created_ids_are_cached_after_commit(engine, db):
+    created = address_registry.get_ids(db, "ethereum", ["0xa"], create=True)
+    db.commit()
+
+    other = database.SessionLocal()
+    try:
+        # キャッシュから返すため、DBへの問い合わせは行わない
+        other.execute = None
+        assert address_registry.get_ids(other, "ethereum", ["0xa"]) == created
+    finally:
+        other.close()
+
+
+def test_addresses_are_created_without_on_conflict(engine, db, monkeypatch):
+    address_registry.get_ids(db, "ethereum", ["0xa"], create=True)
+    db.commit()
+    address_registry.clear()
+
+    # ON CONFLICTに対応していないデータベースでは、登録済みのアドレスを除いて挿入する
+    monkeypatch.setattr(db.bind.dialect, "name", "mssql")
+    created = address_registry.get_ids(db, "ethereum", ["0xa", "0xb", "0xc"], create=True)
+    db.commit()
+    monkeypatch.undo()
+    address_registry.clear()
+
+    other = database.SessionLocal()
+    try:
+        assert address_registry.get_ids(other, "ethereum", ["0xa", "0xb", "0xc"]) == created
+        assert len(set(created.values())) == 3
+    finally:
+        other.close()
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+from app.blockchain import EthereumService
+from app.database.add_address_stats import add_address_stats
+from app.database.models import AddressCounterparty, AddressStats
+
+
+def _stats(db):
+    db.expire_all()
+    return {
+        row.address_id: (row.in_count, row.out_count, row.in_volume, row.out_volume, row.counterparties,
+                         row.first_seen, row.last_seen, row.max_transfer)
+        for row in db.query(AddressStats).all()
+    }
+
+
+def test_add_address_stats_rebuilds_stats_from_saved_transactions(engine, db):
+    start = datetime(2021, 1, 1)
+    EthereumService().save_transactions_to_db([
+        dict(blockchain="ethereum", txid=f"0x{i:064x}", from_address=f"0x{i % 3:040x}",
+             to_address=f"0x{i % 4 + 10:040x}", value=float(i), timestamp=start + timedelta(hours=i),
+             block_number=i)
+        for i in range(20)
+    ], db)
+    db.commit()
+    expected = _stats(db)
+    assert expected
+
+    # 集計テーブルの追加前のデータベース
+    db.query(AddressStats).delete()
+    db.query(AddressCounterparty).delete()
+    db.commit()
+
+    add_address_stats()
+    assert _stats(db) == expected
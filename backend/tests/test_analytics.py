@@ -0,0 +1,45 @@
+import pytest
+
+from app import schemas
+from app.network import analytics
+from app.network.analytics import analyze_network
+
+nx = pytest.importorskip("networkx")
+pytest.importorskip("scipy")
+
+EDGES = [("a", "b", 3.0), ("b", "c", 1.0), ("c", "a", 2.0), ("c", "d", 4.0), ("d", "e", 1.0),
+         ("e", "c", 0.5), ("b", "e", 2.5), ("f", "a", 1.0)]
+
+
+def _network():
+    nodes = sorted({node for source, target, _ in EDGES for node in (source, target)})
+    return schemas.TransactionNetwork(
+        nodes=[schemas.NetworkNode(id=node, label=node, type="address") for node in nodes],
+        links=[
+            schemas.NetworkLink(id=f"{source}_{target}", source=source, target=target, value=value,
+                                timestamp="2021-01-01T00:00:00")
+            for source, target, value in EDGES
+        ],
+    )
+
+
+def _graph():
+    graph = nx.DiGraph()
+    graph.add_weighted_edges_from(EDGES)
+    return graph
+
+
+def test_pagerank_matches_reference():
+    metrics = {node.id: node.metrics for node in analyze_network(_network()).nodes}
+    reference = nx.pagerank(_graph(), alpha=analytics.PAGERANK_DAMPING, weight="weight", tol=1e-12)
+    for node, rank in reference.items():
+        assert metrics[node]["pagerank"] == pytest.approx(rank, abs=1e-6)
+        assert metrics[node]["betweenness"] is None
+
+
+def test_betweenness_matches_reference():
+    metrics = {node.id: node.metrics for node in analyze_network(_network(), betweenness=True).nodes}
+    # ノード数が起点の数以下の場合は全ノードから求めた厳密な値になる
+    reference = nx.betweenness_centrality(_graph(), normalized=True)
+    for node, centrality in reference.items():
+        assert metrics[node]["betweenness"] == pytest.approx(centrality, abs=1e-12)
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.blockcypher import BlockCypherClient
+from app.blockchain.bitcoin import BitcoinService
+from app.database.models import Transaction
+
+ADDRESS = "1addr"
+
+
+def _tx(k, height):
+    received = datetime(2021, 1, 1) + timedelta(minutes=height * 10 + k % 10)
+    return {
+        "hash": f"h{k}",
+        "block_height": height,
+        "received": received.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "addresses": [ADDRESS, "1src"],
+        "inputs": [{"addresses": ["1src"]}],
+        "outputs": [{"addresses": [ADDRESS], "value": 100000000}],
+    }
+
+
+class FakeBlockCypher(BlockCypherClient):
+    """
+    トランザクションの一覧を新しい順に返す、BlockCypherのページングを模したクライアント
+    """
+    PAGE_LIMIT = 3
+
+    def __init__(self, txs):
+        super().__init__("https://blockcypher.invalid")
+        self.txs = sorted(txs, key=lambda tx: -tx["block_height"])
+        self.requests = []
+
+    def _make_request(self, endpoint, params=None, headers=None, cost=1):
+        self.requests.append((endpoint, dict(params or {})))
+        if endpoint.startswith("txs/"):
+            hashes = endpoint[len("txs/"):].split(";")
+            return [tx for tx in self.txs if tx["hash"] in hashes]
+        before = params.get("before", float("inf"))
+        after = params.get("after", float("-inf"))
+        matched = [tx for tx in self.txs if after < tx["block_height"] < before]
+        page = matched[:params["limit"]]
+        if endpoint.endswith("/full"):
+            return {"address": ADDRESS, "txs": page, "hasMore": len(matched) > len(page)}
+        refs = [{"tx_hash": tx["hash"], "block_height": tx["block_height"]} for tx in page]
+        return {"address": ADDRESS, "txrefs": refs, "hasMore": len(matched) > len(page)}
+
+
+def _txids(rows):
+    return sorted(row["txid"] for row in rows)
+
+
+def test_pages_move_back_by_block_height_without_duplicates():
+    txs = [_tx(k, height) for k, height in enumerate([10, 9, 9, 8, 7, 7, 6, 5])]
+    client = FakeBlockCypher(txs)
+
+    assert _txids(client.get_transactions(ADDRESS)) == _txids({"txid": tx["hash"]} for tx in txs)
+    # 境界のブロックを含めて次のページを要求する
+    befores = [params.get("before") for endpoint, params in client.requests]
+    assert befores == [None, 10, 9, 8, 7]
+
+
+def test_block_larger_than_a_page_is_fetched_in_full():
+    txs = [_tx(k, 9 if k < 7 else 5 - k % 2) for k in range(9)]
+    client = FakeBlockCypher(txs)
+
+    assert _txids(client.get_transactions(ADDRESS)) == _txids({"txid": tx["hash"]} for tx in txs)
+    remainder = [params for endpoint, params in client.requests if endpoint == f"addrs/{ADDRESS}"]
+    assert remainder == [{"before": 10, "after": 8, "limit": BlockCypherClient.TXREF_LIMIT}]
+
+
+def test_block_too_large_to_list_is_not_recorded_as_fetched(monkeypatch):
+    client = FakeBlockCypher([_tx(k, 9) for k in range(8)])
+    monkeypatch.setattr(FakeBlockCypher, "TXREF_LIMIT", 5)
+
+    with pytest.raises(HTTPException) as error:
+        client.get_transactions(ADDRESS)
+    assert error.value.status_code == 502
+
+
+def test_unconfirmed_transactions_are_updated_when_confirmed(engine, db):
+    service = BitcoinService()
+    row = dict(blockchain="bitcoin", txid="h1", from_address="1src", to_address=ADDRESS, value=1.0,
+               timestamp=datetime(2021, 1, 1, 0, 0), block_number=-1)
+    service.save_transactions_to_db([row], db)
+    service.save_transactions_to_db([dict(row, timestamp=datetime(2021, 1, 1, 0, 5), block_number=100)], db)
+    db.commit()
+
+    saved = db.query(Transaction).one()
+    assert (saved.block_number, saved.timestamp) == (100, datetime(2021, 1, 1, 0, 5))
+
+    # 承認済みの行は置き換えない
+    service.save_transactions_to_db([dict(row, block_number=-1)], db)
+    db.commit()
+    db.refresh(saved)
+    assert saved.block_number == 100
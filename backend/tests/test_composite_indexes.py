@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+from app.blockchain import EthereumService
+from app.database.add_composite_indexes import COMPOSITE_INDEXES, explain, verify_index_usage
+from app.database.models import Transaction
+
+
+def _save_transactions(db, count: int = 50):
+    start = datetime(2021, 1, 1)
+    transactions = [
+        dict(
+            blockchain="ethereum",
+            txid=f"0x{i:064x}",
+            from_address=f"0x{i % 5:040x}",
+            to_address=f"0x{i % 7 + 100:040x}",
+            value=float(i),
+            timestamp=start + timedelta(hours=i),
+            block_number=i,
+        )
+        for i in range(count)
+    ]
+    EthereumService().save_transactions_to_db(transactions, db)
+    db.commit()
+
+
+def test_models_declare_composite_indexes():
+    indexes = {index.name: [column.name for column in index.columns] for index in Transaction.__table__.indexes}
+    for name, columns in COMPOSITE_INDEXES:
+        assert indexes[name] == [column.strip() for column in columns.split(",")]
+
+
+def test_verify_index_usage_uses_composite_indexes(engine, db):
+    _save_transactions(db)
+    assert verify_index_usage(engine) == []
+
+
+def test_cached_transactions_query_uses_composite_indexes(engine, db):
+    _save_transactions(db)
+    address_id = db.execute("SELECT id FROM addresses ORDER BY id LIMIT 1").scalar()
+    query = EthereumService().cached_transactions_query(address_id, datetime(2021, 1, 1), datetime(2021, 1, 2))
+
+    # text()で実行できるよう、名前付きのバインドパラメータでコンパイルする
+    compiled = query.compile(dialect=engine.dialect.__class__(paramstyle="named"))
+    params = {
+        key: value.isoformat(" ") if isinstance(value, datetime) else value
+        for key, value in compiled.params.items()
+    }
+    with engine.connect() as conn:
+        plan = explain(conn, str(compiled), params)
+
+    for name, _ in COMPOSITE_INDEXES:
+        assert name in plan, plan
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app.blockchain.coverage import (
+    CHAIN_EPOCH, SYNC_FRESHNESS, get_covered_intervals, missing_intervals, plan_sync, record_coverage,
+)
+from app.database import database
+
+
+def day(n):
+    return datetime(2021, 1, n)
+
+
+def test_record_coverage_merges_overlapping_and_adjacent_ranges(engine, db):
+    record_coverage(db, "ethereum", "0xa", day(1), day(5))
+    record_coverage(db, "ethereum", "0xa", day(10), day(12))
+    record_coverage(db, "ethereum", "0xa", day(20), day(25))
+    # 1つ目と重なり、2つ目と隣接する
+    record_coverage(db, "ethereum", "0xa", day(4), day(10))
+    record_coverage(db, "ethereum", "0xb", day(1), day(31))
+
+    assert get_covered_intervals(db, "ethereum", "0xa") == [(day(1), day(12)), (day(20), day(25))]
+
+
+def test_concurrent_records_leave_no_overlapping_rows(engine):
+    def record(k):
+        db = database.SessionLocal()
+        try:
+            record_coverage(db, "ethereum", "0xa", day(1 + k), day(3 + k))
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(record, range(16)))
+
+    db = database.SessionLocal()
+    try:
+        assert get_covered_intervals(db, "ethereum", "0xa") == [(day(1), day(18))]
+    finally:
+        db.close()
+
+
+def test_missing_intervals_returns_the_gaps():
+    covered = [(day(3), day(5)), (day(8), day(10)), (day(4), day(6))]
+    assert missing_intervals(covered, day(1), day(12)) == [
+        (day(1), day(3)), (day(6), day(8)), (day(10), day(12)),
+    ]
+    assert missing_intervals(covered, day(4), day(6)) == []
+
+
+def test_plan_sync_skips_a_recently_synced_tail():
+    now = day(20)
+    assert plan_sync([], None, day(2)) == [(CHAIN_EPOCH, day(2))]
+
+    # 終了日時の指定がなければ、同期済みの日時がSYNC_FRESHNESS以内なら取得しない
+    fresh = [(day(1), now - SYNC_FRESHNESS / 2)]
+    assert plan_sync(fresh, day(1), None, now=now) == []
+
+    # 取得する場合は現在時刻まで取得する
+    stale = [(day(1), now - SYNC_FRESHNESS - timedelta(minutes=1))]
+    assert plan_sync(stale, day(1), None, now=now) == [(stale[0][1], now)]
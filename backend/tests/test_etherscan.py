@@ -0,0 +1,45 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api.etherscan import EtherscanClient
+
+ADDRESS = "0xaa"
+
+
+def _tx(k, block):
+    return {"hash": f"0x{k:02x}", "blockNumber": str(block), "timeStamp": str(1609459200 + block),
+            "from": ADDRESS, "to": "0xbb", "value": "1000000000000000000", "input": "0x"}
+
+
+class FakeEtherscan(EtherscanClient):
+    """
+    txlistの結果をMAX_RESULTS件で切り捨てて返すクライアント
+    """
+    MAX_RESULTS = 4
+
+    def __init__(self, txs):
+        super().__init__("https://etherscan.invalid", "key")
+        self.txs = txs
+        self.requests = []
+
+    def _iter_txlist(self, address, start_block, end_block):
+        self.requests.append(start_block)
+        matched = [tx for tx in self.txs if start_block <= int(tx["blockNumber"]) <= end_block]
+        return iter(matched[:self.MAX_RESULTS])
+
+
+def test_results_past_the_cap_are_requested_from_the_last_block():
+    blocks = [10, 11, 12, 12, 12, 13, 14, 15, 15, 16]
+    client = FakeEtherscan([_tx(k, block) for k, block in enumerate(blocks)])
+
+    transactions = client.get_transactions(ADDRESS)
+    # 最後のブロックから続きを要求し、そのブロックで返し済みのトランザクションは除く
+    assert [tx["txid"] for tx in transactions] == [f"0x{k:02x}" for k in range(len(blocks))]
+    assert client.requests == [0, 12, 13, 15]
+
+
+def test_block_over_the_cap_is_an_error():
+    client = FakeEtherscan([_tx(k, 12) for k in range(5)])
+    with pytest.raises(HTTPException) as error:
+        client.get_transactions(ADDRESS)
+    assert error.value.status_code == 502
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pytest
+
+import main
+from app.database import database
+from app.network.explore import ExplorationStore, exploration_sessions, expand_network_node
+
+PERIOD = dict(start_datetime=datetime(2021, 1, 1), end_datetime=datetime(2021, 2, 1))
+TRANSFERS = [("0xaa", "0xbb"), ("0xaa", "0xcc"), ("0xbb", "0xdd"), ("0xbb", "0xcc")]
+
+
+def _row(source, target, txid=None):
+    return dict(blockchain="ethereum", txid=txid or f"0x{source}{target}", from_address=source, to_address=target,
+                value=1.0, timestamp=datetime(2021, 1, 2), block_number=100)
+
+
+@pytest.fixture
+def expand(engine, monkeypatch):
+    service = main.get_blockchain_service("ethereum")
+
+    def fetch_pages(address, start_datetime, end_datetime, db=None):
+        yield [_row(source, target) for source, target in TRANSFERS if address in (source, target)]
+
+    monkeypatch.setattr(service, "fetch_pages_from_api", fetch_pages)
+    exploration_sessions.clear()
+
+    def expand(node, **kwargs):
+        delta = expand_network_node(service, "0xaa", node, database.SessionLocal, **PERIOD, **kwargs)
+        return delta, sorted(n.id for n in delta.nodes), sorted(link.id for link in delta.links)
+
+    yield expand
+    exploration_sessions.clear()
+
+
+def test_expansions_return_only_the_delta(expand):
+    first, nodes, links = expand("0xaa")
+    assert first.expanded
+    assert nodes == ["0xbb", "0xcc"]
+    assert links == ["0xaa_0xbb_0x0xaa0xbb", "0xaa_0xcc_0x0xaa0xcc"]
+
+    # 既に返したノードとリンクは含めない
+    second, nodes, links = expand("0xbb", session_id=first.session_id)
+    assert second.session_id == first.session_id
+    assert nodes == ["0xdd"]
+    assert links == ["0xbb_0xcc_0x0xbb0xcc", "0xbb_0xdd_0x0xbb0xdd"]
+
+    # 展開済みのアドレスは空の差分を返す
+    again, nodes, links = expand("0xbb", session_id=first.session_id)
+    assert (again.expanded, nodes, links) == (False, [], [])
+
+
+def test_new_session_skips_what_the_client_already_has(expand):
+    first, _, _ = expand("0xaa")
+    # パラメータが異なる場合は新しいセッションを作成し、クライアントが持っているノード・リンクを除く
+    delta, nodes, links = expand(
+        "0xbb", session_id=first.session_id, min_amount=0.5,
+        known_nodes=["0xAA", "0xcc"], known_links=["0xbb_0xcc_0x0xbb0xcc"],
+    )
+    assert delta.session_id != first.session_id
+    assert nodes == ["0xdd"]
+    assert links == ["0xaa_0xbb_0x0xaa0xbb", "0xbb_0xdd_0x0xbb0xdd"]
+
+
+def test_saved_transactions_reopen_expanded_addresses(expand, db):
+    first, _, _ = expand("0xaa")
+    main.get_blockchain_service("ethereum").save_transactions_to_db([_row("0xee", "0xaa", txid="0xnew")], db)
+
+    delta, nodes, links = expand("0xaa", session_id=first.session_id)
+    assert delta.expanded
+    assert (nodes, links) == (["0xee"], ["0xee_0xaa_0xnew"])
+
+
+def test_store_evicts_the_least_recently_used_session():
+    clock = [0.0]
+    store = ExplorationStore(max_sessions=2, ttl=10, clock=lambda: clock[0])
+    create = lambda new_id: type("Session", (), {"id": new_id, "params": "p"})()
+
+    a = store.get_or_create(None, "p", create)
+    b = store.get_or_create(None, "p", create)
+    assert store.get_or_create(a.id, "p", create) is a
+    store.get_or_create(None, "p", create)
+    # bが最も古く使われたため削除される
+    assert store.get_or_create(b.id, "p", create) is not b
+    clock[0] = 11
+    assert store.get_or_create(a.id, "p", create) is not a
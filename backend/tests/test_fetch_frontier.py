@@ -0,0 +1,124 @@
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+
+import main
+from app.blockchain.coverage import record_coverage
+from app.network import builder
+from app.network.builder import fetch_frontier
+
+
+def _session():
+    return SimpleNamespace(close=lambda: None)
+
+
+class FakeService:
+    """
+    取得中の同時実行数を記録するサービス
+    """
+    FETCH_BATCH_SIZE = 1
+
+    def __init__(self, blockchain="ethereum", failing=()):
+        self.blockchain_name = blockchain
+        self.failing = set(failing)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def get_transactions(self, address, db=None, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(0.02)
+            if address in self.failing:
+                raise HTTPException(status_code=400, detail="invalid address")
+            return [address]
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_frontier_is_fetched_concurrently_within_the_upstream_limit(monkeypatch):
+    monkeypatch.setitem(builder.FETCH_CONCURRENCY, "ethereum", 3)
+    monkeypatch.setitem(builder._upstream_semaphores, "ethereum", threading.BoundedSemaphore(3))
+    service = FakeService(failing={"0x4"})
+    addresses = [f"0x{i}" for i in range(12)]
+    fetched = []
+
+    results = fetch_frontier(service, addresses, _session, on_fetched=fetched.append)
+
+    # 結果は入力の順序で返り、取得に失敗したアドレスはNoneになる
+    assert results == [None if address == "0x4" else [address] for address in addresses]
+    assert sorted(fetched) == sorted(addresses)
+    assert 1 < service.max_active <= 3
+
+
+def test_upstream_limit_is_shared_across_requests(monkeypatch):
+    monkeypatch.setitem(builder.FETCH_CONCURRENCY, "ethereum", 2)
+    monkeypatch.setitem(builder._upstream_semaphores, "ethereum", threading.BoundedSemaphore(2))
+    service = FakeService()
+
+    requests = [
+        threading.Thread(target=fetch_frontier, args=(service, [f"0x{r}{i}" for i in range(4)], _session))
+        for r in range(3)
+    ]
+    for request in requests:
+        request.start()
+    for request in requests:
+        request.join()
+    assert service.max_active == 2
+
+
+class FakeBatchService(FakeService):
+    FETCH_BATCH_SIZE = 3
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def get_transactions_many(self, addresses, db=None, **kwargs):
+        with self.lock:
+            self.batches.append(addresses)
+        return {address: [address] for address in addresses if address != "0x4"}
+
+
+def test_frontier_is_fetched_in_batches():
+    service = FakeBatchService()
+    addresses = [f"0x{i}" for i in range(7)]
+
+    results = fetch_frontier(service, addresses, _session)
+    assert results == [None if address == "0x4" else [address] for address in addresses]
+    assert sorted(service.batches) == [["0x0", "0x1", "0x2"], ["0x3", "0x4", "0x5"], ["0x6"]]
+
+
+def test_unsynced_addresses_are_fetched_upstream_together(engine, db, monkeypatch):
+    service = main.get_blockchain_service("ethereum")
+    batches = []
+
+    def fetch_many(addresses, start_datetime, end_datetime, db=None):
+        batches.append(list(addresses))
+        return {
+            address: [dict(blockchain="ethereum", txid=f"tx-{address}", from_address=address, to_address="0xff",
+                           value=1.0, timestamp=datetime(2021, 1, 2), block_number=100)]
+            for address in addresses
+        }
+
+    monkeypatch.setattr(service, "FETCH_BATCH_SIZE", 2)
+    monkeypatch.setattr(service, "fetch_many_from_api", fetch_many)
+    period = dict(start_datetime=datetime(2021, 1, 1), end_datetime=datetime(2021, 2, 1))
+    record_coverage(db, "ethereum", "0xaa", period["start_datetime"], period["end_datetime"])
+
+    results = service.get_transactions_many(["0xaa", "0xbb", "0xcc", "0xdd"], db=db, **period)
+    # 取得済みの0xaaは上流に問い合わせず、残りをFETCH_BATCH_SIZE件ずつまとめて取得する
+    assert batches == [["0xbb", "0xcc"], ["0xdd"]]
+    assert {address: [tx.txid for tx in txs] for address, txs in results.items()} == {
+        "0xaa": [], "0xbb": ["tx-0xbb"], "0xcc": ["tx-0xcc"], "0xdd": ["tx-0xdd"],
+    }
+
+    # 取得した期間は記録されるため、2回目は上流に問い合わせない
+    service.get_transactions_many(["0xbb", "0xcc", "0xdd"], db=db, **period)
+    assert len(batches) == 2
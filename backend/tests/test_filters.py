@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import main
+from app.blockchain.filters import TransactionFilter
+from app.database.models import Transaction
+
+PERIOD = dict(start_datetime=datetime(2021, 1, 1), end_datetime=datetime(2021, 2, 1))
+# (送信元, 送信先, 金額)
+TRANSFERS = [("0xaa", "0xbb", 0.5), ("0xbb", "0xaa", 2.0), ("0xaa", "0xcc", 3.0), ("0xcc", "0xaa", 0.1)]
+
+
+def _rows():
+    return [
+        dict(blockchain="ethereum", txid=f"0x{k}", from_address=source, to_address=target, value=value,
+             timestamp=datetime(2021, 1, 2 + k), block_number=100 + k)
+        for k, (source, target, value) in enumerate(TRANSFERS)
+    ]
+
+
+def _get(service, db, **filter_args):
+    transactions = service.get_transactions("0xaa", db=db, filters=TransactionFilter(**filter_args), **PERIOD)
+    return sorted(tx.txid for tx in transactions)
+
+
+def test_filters_are_applied_when_reading_saved_rows(engine, db, monkeypatch):
+    service = main.get_blockchain_service("ethereum")
+    calls = []
+
+    def fetch_pages(address, start_datetime, end_datetime, db=None):
+        calls.append(address)
+        yield _rows()
+
+    monkeypatch.setattr(service, "fetch_pages_from_api", fetch_pages)
+
+    assert _get(service, db, min_amount=1.0) == ["0x1", "0x2"]
+    # 取引相手のアドレスは正規化して比較する
+    assert _get(service, db, counterparty="0xBB") == ["0x0", "0x1"]
+    assert _get(service, db, min_amount=1.0, counterparty="0xbb") == ["0x1"]
+    assert _get(service, db, counterparty="0xdd") == []
+    # 条件を満たさない行も保存されるため、条件を変えても上流APIに問い合わせずに返せる
+    assert db.query(Transaction).count() == len(TRANSFERS)
+    assert calls == ["0xaa"]
+
+
+def test_filters_match_upstream_rows_without_a_database():
+    rows = _rows()
+    assert [row["txid"] for row in rows if TransactionFilter(min_amount=1.0).matches("ethereum", row)] == ["0x1", "0x2"]
+    assert [row["txid"] for row in rows if TransactionFilter(counterparty="0xCC").matches("ethereum", row)] == [
+        "0x2", "0x3",
+    ]
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.database import database
+from app.database.models import CrawlJob
+from app.network.budget import TraversalBudget
+from app.network.jobs import (
+    CRAWL_JOB_PROGRESS_ADDRESSES, CRAWL_JOB_STALE_SECONDS, JOB_QUEUED, JOB_RUNNING, CrawlJobManager, _JobObserver,
+)
+
+
+def _add_running_job(db, job_id, updated_at):
+    db.add(CrawlJob(
+        id=job_id, blockchain="ethereum", address="0xa", params="{}", status=JOB_RUNNING,
+        addresses_done=0, addresses_remaining=0, upstream_calls=0,
+        created_at=updated_at, updated_at=updated_at,
+    ))
+    db.commit()
+
+
+def _manager(ran):
+    manager = CrawlJobManager(database.SessionLocal, lambda blockchain: None, workers=1)
+    manager._run = ran.append
+    return manager
+
+
+def test_sweep_requeues_stale_running_jobs(engine, db):
+    stale = datetime.utcnow() - timedelta(seconds=CRAWL_JOB_STALE_SECONDS + 60)
+    _add_running_job(db, "stale", stale)
+    _add_running_job(db, "live", datetime.utcnow())
+
+    ran = []
+    manager = _manager(ran)
+    assert manager.sweep() == ["stale"]
+    manager._executor.shutdown(wait=True)
+
+    assert ran == ["stale"]
+    statuses = {job.id: job.status for job in db.query(CrawlJob).all()}
+    assert statuses == {"stale": JOB_QUEUED, "live": JOB_RUNNING}
+
+
+def test_sweep_keeps_jobs_running_in_this_process_alive(engine, db):
+    stale = datetime.utcnow() - timedelta(seconds=CRAWL_JOB_STALE_SECONDS + 60)
+    _add_running_job(db, "mine", stale)
+
+    ran = []
+    manager = _manager(ran)
+    manager._running.add("mine")
+    assert manager.sweep() == []
+    manager._executor.shutdown(wait=True)
+
+    job = db.query(CrawlJob).filter(CrawlJob.id == "mine").one()
+    assert job.status == JOB_RUNNING
+    assert job.updated_at > stale
+    assert ran == []
+
+
+def test_fetched_progress_is_written_in_batches():
+    updates = []
+    manager = SimpleNamespace(update=lambda job_id, **fields: updates.append(fields))
+    observer = _JobObserver(manager, "job", TraversalBudget())
+
+    observer.on_frontier([f"0x{i}" for i in range(CRAWL_JOB_PROGRESS_ADDRESSES * 2)])
+    for i in range(CRAWL_JOB_PROGRESS_ADDRESSES * 2):
+        observer.on_fetched(f"0x{i}")
+
+    assert [fields["addresses_done"] for fields in updates] == [
+        0, CRAWL_JOB_PROGRESS_ADDRESSES, CRAWL_JOB_PROGRESS_ADDRESSES * 2,
+    ]
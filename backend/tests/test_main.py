@@ -0,0 +1,22 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from main import parse_date_range
+
+
+def test_parse_date_range_drops_timezone():
+    assert parse_date_range("2021-01-01T09:00:00+09:00", None) == (datetime(2021, 1, 1, 9), None)
+    assert parse_date_range(None, "2021-02-01") == (None, datetime(2021, 2, 1))
+
+
+@pytest.mark.parametrize("start_date, end_date, detail", [
+    ("not a date", None, "Invalid start_date format"),
+    ("2021-01-01", "2021-13-45", "Invalid end_date format"),
+])
+def test_parse_date_range_rejects_invalid_dates(start_date, end_date, detail):
+    with pytest.raises(HTTPException) as error:
+        parse_date_range(start_date, end_date)
+    assert error.value.status_code == 400
+    assert error.value.detail == detail
@@ -0,0 +1,96 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from app.database import database
+from app.network.budget import TraversalBudget
+from app.network.builder import TraversalObserver, _NetworkAccumulator, build_transaction_network
+from app.network.cache import network_cache
+
+
+def _tx(txid, from_address, to_address, value):
+    return SimpleNamespace(txid=txid, from_address=from_address, to_address=to_address,
+                           value=value, timestamp=datetime(2021, 1, 1))
+
+
+def _accumulator():
+    return _NetworkAccumulator("a", "a", lambda tx: (tx.from_address, tx.to_address), TraversalBudget())
+
+
+def test_multiple_outputs_to_the_same_address_are_kept():
+    accumulator = _accumulator()
+    transactions = [_tx("t1", "a", "b", 1.0), _tx("t1", "a", "b", 2.5)]
+    accumulator.expand("a", transactions)
+    # 送信先を展開すると同じトランザクションが再び現れる
+    accumulator.expand("b", transactions)
+
+    network = accumulator.to_network(lambda key: key)
+    assert sorted(link.value for link in network.links) == [1.0, 2.5]
+    assert len({link.id for link in network.links}) == 2
+    assert network.links[0].id == "a_b_t1"
+
+
+def test_budget_is_unlimited_by_default():
+    budget = TraversalBudget()
+    assert (budget.max_nodes, budget.max_upstream_calls, budget.max_degree_per_node) == (None, None, None)
+    assert budget.take_upstream_calls([f"0x{i}" for i in range(500)]) == [f"0x{i}" for i in range(500)]
+
+    accumulator = _NetworkAccumulator("a", "a", lambda tx: (tx.from_address, tx.to_address), budget)
+    discovered = accumulator.expand("a", [_tx(f"t{i}", "a", f"b{i}", 1.0) for i in range(2000)])
+    assert len(discovered) == 2000
+    assert accumulator.truncation_reasons(budget.reasons) == []
+
+
+GRAPH = {"0xaa": ["0xbb", "0xcc"], "0xbb": ["0xdd"], "0xcc": ["0xee"]}
+
+
+def _fetch_graph(address, start_datetime, end_datetime, db=None):
+    yield [
+        dict(blockchain="ethereum", txid=f"0x{address}{other}", from_address=address, to_address=other,
+             value=1.0, timestamp=datetime(2021, 1, 2), block_number=100)
+        for other in GRAPH.get(address, [])
+    ]
+
+
+class _ExternalSave(TraversalObserver):
+    """
+    1階層目の展開後に、別のリクエストが中心アドレスの新しいトランザクションを保存する
+    """
+    def __init__(self, service):
+        self.service = service
+
+    def on_level(self, network):
+        db = database.SessionLocal()
+        try:
+            self.service.save_transactions_to_db([dict(
+                blockchain="ethereum", txid="0xnew", from_address="0xff", to_address="0xaa",
+                value=2.0, timestamp=datetime(2021, 1, 3), block_number=101,
+            )], db)
+        finally:
+            db.close()
+
+
+def _build(monkeypatch, observer=None, traversal="bfs"):
+    service = main.get_blockchain_service("ethereum")
+    monkeypatch.setattr(service, "fetch_pages_from_api", _fetch_graph)
+    network_cache.clear()
+    build_transaction_network(
+        service, "0xaa", 2, database.SessionLocal,
+        start_datetime=datetime(2021, 1, 1), end_datetime=datetime(2021, 2, 1),
+        traversal=traversal, observer=observer or TraversalObserver(),
+    )
+    return service
+
+
+@pytest.mark.parametrize("traversal", ["bfs", "sql"])
+def test_network_fetched_by_the_build_itself_is_cached(engine, monkeypatch, traversal):
+    _build(monkeypatch, traversal=traversal)
+    assert network_cache.stats()["entries"] == 1
+    network_cache.clear()
+
+
+def test_network_is_not_cached_when_a_read_address_changes_during_the_build(engine, monkeypatch):
+    _build(monkeypatch, observer=_ExternalSave(main.get_blockchain_service("ethereum")))
+    assert network_cache.stats()["entries"] == 0
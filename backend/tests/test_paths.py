@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from fastapi import HTTPException
+
+import main
+from app.database import database
+from app.network.paths import find_transaction_paths
+
+# 送信元 -> 送信先
+TRANSFERS = [("0xa", "0xb"), ("0xb", "0xc"), ("0xa", "0xf"), ("0xd", "0xc"), ("0xe", "0xc")]
+
+
+def _fetch_pages(address, start_datetime, end_datetime, db=None):
+    if address == "0xf":
+        raise HTTPException(status_code=502, detail="upstream error")
+    yield [
+        dict(blockchain="ethereum", txid=f"0x{source}{target}", from_address=source, to_address=target,
+             value=1.0, timestamp=datetime(2021, 1, 2), block_number=100)
+        for source, target in TRANSFERS if address in (source, target)
+    ]
+
+
+def test_failed_addresses_are_reported_and_not_counted(engine, monkeypatch):
+    service = main.get_blockchain_service("ethereum")
+    monkeypatch.setattr(service, "fetch_pages_from_api", _fetch_pages)
+
+    result = find_transaction_paths(
+        service, "0xa", "0xc", database.SessionLocal, max_depth=3,
+        start_datetime=datetime(2021, 1, 1), end_datetime=datetime(2021, 2, 1),
+    )
+    assert [path.addresses for path in result.paths] == [["0xa", "0xb", "0xc"]]
+    # 0xa, 0xc, 0xb を展開し、0xf は取得に失敗した
+    assert result.expanded_addresses == 3
+    assert result.failed_addresses == ["0xf"]
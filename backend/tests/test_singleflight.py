@@ -0,0 +1,83 @@
+import threading
+import time
+from datetime import datetime
+
+import main
+from app.blockchain.singleflight import SingleFlight
+from app.database import database
+
+
+def _run_concurrently(count, fn):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(i):
+        try:
+            results[i] = fn(i)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_calls_with_the_same_key_run_once():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    results, errors = _run_concurrently(5, lambda i: flight.do("key", slow))
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.coalesced == 4
+
+    # 完了した後の呼び出しは新たに実行する
+    assert flight.do("key", slow) == "result"
+    assert len(calls) == 2
+
+
+def test_errors_are_shared_with_waiting_callers():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.1)
+        raise ValueError("upstream error")
+
+    _, errors = _run_concurrently(3, lambda i: flight.do("key", failing))
+    assert all(isinstance(error, ValueError) for error in errors)
+
+
+def test_concurrent_requests_for_an_address_fetch_upstream_once(engine, monkeypatch):
+    service = main.get_blockchain_service("ethereum")
+    calls = []
+
+    def fetch_pages(address, start_datetime, end_datetime, db=None):
+        calls.append(address)
+        time.sleep(0.1)
+        yield [dict(blockchain="ethereum", txid="0x1", from_address="0xaa", to_address="0xbb",
+                    value=1.0, timestamp=datetime(2021, 1, 2), block_number=100)]
+
+    monkeypatch.setattr(service, "fetch_pages_from_api", fetch_pages)
+
+    def request(i):
+        db = database.SessionLocal()
+        try:
+            transactions = service.get_transactions(
+                "0xAA", datetime(2021, 1, 1), datetime(2021, 2, 1), db=db, depth=1
+            )
+            return [tx.txid for tx in transactions]
+        finally:
+            db.close()
+
+    results, errors = _run_concurrently(4, request)
+    assert errors == [None] * 4
+    assert results == [["0x1"]] * 4
+    assert calls == ["0xaa"]
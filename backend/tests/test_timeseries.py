@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from app.blockchain import timeseries
+from app.blockchain.addresses import address_registry
+from app.blockchain.timeseries import volume_timeseries
+
+# (送信元, 送信先, 金額, 日時)。2021-01-03は日曜日、2021-01-04は月曜日
+TRANSFERS = [
+    ("0xbb", "0xaa", 1.0, datetime(2021, 1, 3, 23, 59)),
+    ("0xaa", "0xbb", 0.25, datetime(2021, 1, 4, 0, 0)),
+    ("0xaa", "0xaa", 2.0, datetime(2021, 1, 4, 0, 30)),
+    ("0xcc", "0xaa", 4.0, datetime(2021, 1, 10, 12, 0)),
+    ("0xaa", "0xcc", 8.0, datetime(2021, 1, 11, 1, 0)),
+]
+
+
+def _date_trunc(timestamp, bucket):
+    """
+    PostgreSQLのdate_truncと同じ単位の開始日時（週は月曜日始まり）
+    """
+    if bucket == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    day = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=day.weekday()) if bucket == "week" else day
+
+
+def _expected(bucket):
+    points = {}
+    for source, target, value, timestamp in TRANSFERS:
+        point = points.setdefault(_date_trunc(timestamp, bucket), [0.0, 0.0, 0])
+        if target == "0xaa":
+            point[0] += value
+        if source == "0xaa":
+            point[1] += value
+        # 自分宛の送金は1件として数える
+        point[2] += 1
+    return [(start, inflow, outflow, inflow - outflow, count) for start, (inflow, outflow, count) in sorted(points.items())]
+
+
+@pytest.fixture
+def address_ids(engine, db):
+    main.get_blockchain_service("ethereum").save_transactions_to_db([
+        dict(blockchain="ethereum", txid=f"0x{k}", from_address=source, to_address=target, value=value,
+             timestamp=timestamp, block_number=100 + k)
+        for k, (source, target, value, timestamp) in enumerate(TRANSFERS)
+    ], db)
+    db.commit()
+    return {address_id: address for address, address_id in address_registry.get_ids(db, "ethereum", ["0xaa"]).items()}
+
+
+def _points(db, address_ids, bucket, **period):
+    (points,) = volume_timeseries(db, address_ids, bucket, **period).values()
+    return [(p.timestamp, p.inflow, p.outflow, p.net, p.count) for p in points]
+
+
+@pytest.mark.parametrize("bucket", timeseries.TIMESERIES_BUCKETS)
+def test_buckets_match_date_trunc(db, address_ids, bucket):
+    # SQLiteではメモリ上で、PostgreSQL（TEST_DATABASE_URL）ではdate_truncで集計し、同じ結果になる
+    assert _points(db, address_ids, bucket) == _expected(bucket)
+
+
+def test_weeks_start_on_monday(db, address_ids):
+    starts = [point[0] for point in _points(db, address_ids, "week")]
+    assert starts == [datetime(2020, 12, 28), datetime(2021, 1, 4), datetime(2021, 1, 11)]
+    assert all(start.weekday() == 0 for start in starts)
+
+
+@pytest.mark.parametrize("bucket", timeseries.TIMESERIES_BUCKETS)
+def test_aggregation_without_numpy_gives_the_same_points(db, address_ids, monkeypatch, bucket):
+    with_numpy = _points(db, address_ids, bucket, start_datetime=datetime(2021, 1, 4))
+    monkeypatch.setattr(timeseries, "np", None)
+    assert _points(db, address_ids, bucket, start_datetime=datetime(2021, 1, 4)) == with_numpy
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+import main
+from app.blockchain.addresses import address_registry
+from app.network.traversal import query_neighbourhood
+
+
+def _save(db, pairs):
+    main.get_blockchain_service("ethereum").save_transactions_to_db([
+        dict(blockchain="ethereum", txid=f"0x{source}{target}", from_address=source, to_address=target,
+             value=1.0, timestamp=datetime(2021, 1, 2), block_number=100)
+        for source, target in pairs
+    ], db)
+    db.commit()
+
+
+def test_max_nodes_counts_distinct_addresses(engine, db):
+    # 0xa〜0xcは循環しているため、複数の深さで現れる
+    _save(db, [("0xa", "0xb"), ("0xa", "0xc"), ("0xb", "0xc"), ("0xc", "0xd"), ("0xd", "0xe")])
+    ids = address_registry.get_ids(db, "ethereum", ["0xa", "0xb", "0xc", "0xd", "0xe"])
+
+    rows = query_neighbourhood(db, "ethereum", ids["0xa"], 3, max_nodes=4)
+    endpoints = {(row.from_address_id, row.to_address_id) for row in rows}
+    # 深さ2の0xdも探索対象に含まれ、その先の0xeとのトランザクションが返る
+    assert (ids["0xd"], ids["0xe"]) in endpoints
+
+    rows = query_neighbourhood(db, "ethereum", ids["0xa"], 3, max_nodes=3)
+    assert {(row.from_address_id, row.to_address_id) for row in rows} == {
+        (ids["0xa"], ids["0xb"]), (ids["0xa"], ids["0xc"]), (ids["0xb"], ids["0xc"]), (ids["0xc"], ids["0xd"]),
+    }
@@ -113,7 +113,9 @@ export const getNetwork = async (
   depth,
   startDate,
   endDate,
-  minAmount
+  minAmount,
+  aggregate = false,
+  analyticsWeight = null
 ) => {
   console.log("API呼び出し開始:", {
     blockchain,
@@ -136,6 +138,9 @@ export const getNetwork = async (
       ...(formattedStartDate && { start_date: formattedStartDate }),
       ...(formattedEndDate && { end_date: formattedEndDate }),
       ...(minAmount && { min_amount: minAmount.toString() }),
+      ...(aggregate && { aggregate: true }),
+      // "value" または "count" を指定すると、各ノードの metrics に分析結果（PageRankなど）が設定される
+      ...(analyticsWeight && { analytics: true, analytics_weight: analyticsWeight }),
     };
 
     const url = `/network/${blockchain}/${address}`;
@@ -152,3 +157,149 @@ export const getNetwork = async (
     throw error;
   }
 };
+
+// 集約されたリンク1本分（source → target）のトランザクションを取得
+export const getEdgeTransactions = async (
+  blockchain,
+  source,
+  target,
+  startDate,
+  endDate,
+  minAmount
+) => {
+  try {
+    const formattedStartDate = startDate
+      ? format(new Date(startDate), "yyyy-MM-dd")
+      : "";
+    const formattedEndDate = endDate
+      ? format(new Date(endDate), "yyyy-MM-dd")
+      : "";
+
+    const params = {
+      ...(formattedStartDate && { start_date: formattedStartDate }),
+      ...(formattedEndDate && { end_date: formattedEndDate }),
+      ...(minAmount && { min_amount: minAmount.toString() }),
+    };
+
+    const response = await api.get(`/edge/${blockchain}/${source}/${target}`, { params });
+    return response.data;
+  } catch (error) {
+    console.error("APIエラー (リンクの詳細):", error);
+    console.error("エラー詳細:", error.response?.data || error.message);
+    throw error;
+  }
+};
+
+// アドレスの集計（件数・金額・取引相手の数・最初/最後の取引日時）を取得（保存済みの取引がない場合は null）
+export const getAddressStats = async (blockchain, address) => {
+  try {
+    const response = await api.get(`/stats/${blockchain}/${address}`);
+    return response.data;
+  } catch (error) {
+    if (error.response?.status === 404) {
+      return null;
+    }
+    console.error("APIエラー (アドレスの集計):", error);
+    console.error("エラー詳細:", error.response?.data || error.message);
+    throw error;
+  }
+};
+
+// アドレスの受取額・送金額・件数の時系列を取得（bucket: "hour" | "day" | "week"）
+// addressに配列を渡した場合は、複数のアドレス（ネットワークのノード全体など）の時系列をまとめて取得する
+export const getVolumeTimeSeries = async (
+  blockchain,
+  address,
+  bucket = "day",
+  startDate,
+  endDate
+) => {
+  try {
+    const formattedStartDate = startDate
+      ? format(new Date(startDate), "yyyy-MM-dd")
+      : "";
+    const formattedEndDate = endDate
+      ? format(new Date(endDate), "yyyy-MM-dd")
+      : "";
+    const params = {
+      bucket,
+      ...(formattedStartDate && { start_date: formattedStartDate }),
+      ...(formattedEndDate && { end_date: formattedEndDate }),
+    };
+
+    const response = Array.isArray(address)
+      ? await api.post(`/timeseries/${blockchain}`, { addresses: address, ...params })
+      : await api.get(`/timeseries/${blockchain}/${address}`, { params });
+    return response.data;
+  } catch (error) {
+    console.error("APIエラー (時系列):", error);
+    console.error("エラー詳細:", error.response?.data || error.message);
+    throw error;
+  }
+};
+
+// グラフのノードを1ホップ展開し、新たに追加されたノードとリンクのみを取得
+// （2回目以降はレスポンスの session_id を渡すと、knownNodes / knownLinks を省略できる）
+export const expandNetworkNode = async (
+  blockchain,
+  address,
+  node,
+  { sessionId, knownNodes = [], knownLinks = [], startDate, endDate, minAmount } = {}
+) => {
+  try {
+    const body = {
+      node,
+      known_nodes: knownNodes,
+      known_links: knownLinks,
+      ...(sessionId && { session_id: sessionId }),
+      ...(startDate && { start_date: format(new Date(startDate), "yyyy-MM-dd") }),
+      ...(endDate && { end_date: format(new Date(endDate), "yyyy-MM-dd") }),
+      ...(minAmount && { min_amount: minAmount }),
+    };
+
+    const response = await api.post(`/network/${blockchain}/${address}/expand`, body);
+    return response.data;
+  } catch (error) {
+    console.error("APIエラー (ノードの展開):", error);
+    console.error("エラー詳細:", error.response?.data || error.message);
+    throw error;
+  }
+};
+
+// 2つのアドレスを結ぶパスを取得（レスポンスの nodes / links はネットワークグラフとして表示できる）
+export const getPaths = async (
+  blockchain,
+  source,
+  target,
+  startDate,
+  endDate,
+  minAmount,
+  maxDepth = 4,
+  k = 5,
+  rankBy = "length"
+) => {
+  try {
+    const formattedStartDate = startDate
+      ? format(new Date(startDate), "yyyy-MM-dd")
+      : "";
+    const formattedEndDate = endDate
+      ? format(new Date(endDate), "yyyy-MM-dd")
+      : "";
+
+    const params = {
+      max_depth: maxDepth,
+      k,
+      rank_by: rankBy,
+      ...(formattedStartDate && { start_date: formattedStartDate }),
+      ...(formattedEndDate && { end_date: formattedEndDate }),
+      ...(minAmount && { min_amount: minAmount.toString() }),
+    };
+
+    const response = await api.get(`/path/${blockchain}/${source}/${target}`, { params });
+    return response.data;
+  } catch (error) {
+    console.error("APIエラー (パス探索):", error);
+    console.error("エラー詳細:", error.response?.data || error.message);
+    throw error;
+  }
+};